@@ -18,7 +18,7 @@ class _ProfileScreenState extends State<ProfileScreen> {
   String? fullName;
   String? icNumber;
   String? email;
-  List<dynamic>? palmHash; 
+  Object? palmHash; // Blob template (or a list of floats for older enrolments)
   bool isLoading = true;
   String? sessionId;
   bool showPalmHashError = false;
@@ -169,7 +169,7 @@ class _ProfileScreenState extends State<ProfileScreen> {
       );
     }
 
-    final isPalmLinked = palmHash != null && palmHash!.isNotEmpty;
+    final isPalmLinked = palmHash != null && !(palmHash is List && (palmHash as List).isEmpty);
 
     return Scaffold(
       appBar: AppBar(
@@ -1,5 +1,9 @@
+import 'dart:convert';
 import 'package:flutter/material.dart';
 import 'package:cloud_firestore/cloud_firestore.dart';
+import 'package:firebase_auth/firebase_auth.dart';
+import 'package:flutter_dotenv/flutter_dotenv.dart';
+import 'package:http/http.dart' as http;
 import 'package:intl/intl.dart';
 
 class TransactionHistoryScreen extends StatefulWidget {
@@ -11,68 +15,115 @@ class TransactionHistoryScreen extends StatefulWidget {
 }
 
 class _TransactionHistoryScreenState extends State<TransactionHistoryScreen> {
+  static const int pageSize = 20;
+
   String selectedBank = 'All Banks';
   String selectedCategory = 'All';
   List<Map<String, dynamic>> bankOptions = [];
-  List<Map<String, dynamic>> allTransactions = [];
+  List<Map<String, dynamic>> transactions = [];
+  String? nextCursor;
   bool isLoading = true;
+  bool isLoadingMore = false;
+  bool loadMoreFailed = false;
+  String? error;
+  int _generation = 0; // bumped when the filters change, so stale pages are dropped
 
   final List<String> categories = [
     'All', 'Groceries', 'Food & Drink', 'Bills', 'Transport', 'Others'
   ];
 
+  String get _serverUrl => dotenv.env['PAYPALM_SERVER_URL'] ?? 'https://paypalm-server.onrender.com';
+
   @override
   void initState() {
     super.initState();
-    _fetchBanksAndTransactions();
+    _fetchBanks();
+    _reload();
   }
 
-  Future<void> _fetchBanksAndTransactions() async {
-    setState(() => isLoading = true);
+  Future<void> _fetchBanks() async {
     final banksSnap = await FirebaseFirestore.instance
         .collection('users')
         .doc(widget.uid)
         .collection('linkedAccounts')
         .get();
 
-    bankOptions = banksSnap.docs.map((doc) {
-      final data = doc.data();
-      print('Bank doc: ${doc.id}, bankName: ${data['bankName']}, accountType: ${data['accountType']}');
-      return {
-        'id': doc.id,
-        'label': '${data['bankName'] ?? doc.id} – ${data['accountType'] ?? ''}',
-      };
-    }).toList();
+    setState(() {
+      bankOptions = banksSnap.docs.map((doc) {
+        final data = doc.data();
+        return {
+          'id': doc.id,
+          'label': '${data['bankName'] ?? doc.id} – ${data['accountType'] ?? ''}',
+        };
+      }).toList();
+    });
     print('Fetched ${banksSnap.docs.length} banks');
+  }
 
-    // Fetch all transactions from all banks
-    List<Map<String, dynamic>> txs = [];
-    for (var bank in banksSnap.docs) {
-      final txSnap = await bank.reference.collection('transactions').get();
-      print('Bank ${bank.id} has ${txSnap.docs.length} transactions');
-      txs.addAll(txSnap.docs.map((txDoc) {
-        final txData = txDoc.data();
-        print('Transaction data: $txData');
-        txData['bankId'] = bank.id;
-        return txData;
-      }));
+  // Pages come from the payment server, which merges every account's transactions
+  // newest first and applies the bank and category filters in the query. The server
+  // only returns a user's history to a request signed with that user's ID token.
+  Future<Map<String, dynamic>> _fetchPage(String? cursor) async {
+    final params = {
+      'limit': '$pageSize',
+      if (selectedBank != 'All Banks') 'account': selectedBank,
+      if (selectedCategory != 'All') 'category': selectedCategory,
+      if (cursor != null) 'cursor': cursor,
+    };
+    final uri = Uri.parse('$_serverUrl/transactions/${widget.uid}').replace(queryParameters: params);
+    final idToken = await FirebaseAuth.instance.currentUser?.getIdToken();
+    if (idToken == null) throw Exception('Not signed in');
+    final response = await http.get(uri, headers: {'Authorization': 'Bearer $idToken'});
+    if (response.statusCode != 200) {
+      throw Exception('Transaction history request failed (${response.statusCode}): ${response.body}');
     }
-    txs.sort((a, b) => (b['timestamp'] as Timestamp).compareTo(a['timestamp'] as Timestamp));
+    return jsonDecode(response.body) as Map<String, dynamic>;
+  }
+
+  Future<void> _reload() async {
+    final generation = ++_generation;
     setState(() {
-      allTransactions = txs;
-      isLoading = false;
+      isLoading = true;
+      isLoadingMore = false;
+      loadMoreFailed = false;
+      nextCursor = null;
+      error = null;
     });
+    try {
+      final page = await _fetchPage(null);
+      if (generation != _generation) return;
+      setState(() {
+        transactions = List<Map<String, dynamic>>.from(page['transactions']);
+        nextCursor = page['nextCursor'];
+      });
+    } catch (e) {
+      print('Error fetching transactions: $e');
+      if (generation == _generation) setState(() => error = 'Could not load transactions.');
+    } finally {
+      if (generation == _generation) setState(() => isLoading = false);
+    }
   }
 
-  List<Map<String, dynamic>> get filteredTransactions {
-    var txs = allTransactions;
-    if (selectedBank != 'All Banks') {
-      txs = txs.where((tx) => tx['bankId'] == selectedBank).toList();
-    }
-    if (selectedCategory != 'All') {
-      txs = txs.where((tx) => (tx['category'] ?? 'Others') == selectedCategory).toList();
+  Future<void> _loadMore() async {
+    if (isLoadingMore || nextCursor == null) return;
+    final generation = _generation;
+    setState(() {
+      isLoadingMore = true;
+      loadMoreFailed = false;
+    });
+    try {
+      final page = await _fetchPage(nextCursor);
+      if (generation != _generation) return;
+      setState(() {
+        transactions.addAll(List<Map<String, dynamic>>.from(page['transactions']));
+        nextCursor = page['nextCursor'];
+      });
+    } catch (e) {
+      print('Error fetching more transactions: $e');
+      if (generation == _generation) setState(() => loadMoreFailed = true);
+    } finally {
+      if (generation == _generation) setState(() => isLoadingMore = false);
     }
-    return txs;
   }
 
   @override
@@ -80,82 +131,102 @@ class _TransactionHistoryScreenState extends State<TransactionHistoryScreen> {
     final currencyFormat = NumberFormat.currency(locale: 'en_MY', symbol: 'RM');
     return Scaffold(
       appBar: AppBar(title: const Text('Transaction History')),
-      body: isLoading
-          ? const Center(child: CircularProgressIndicator())
-          : Column(
-              children: [
-                Padding(
-                  padding: const EdgeInsets.all(8.0),
-                  child: DropdownButton<String>(
-                    value: selectedBank,
-                    isExpanded: true,
-                    items: [
-                      const DropdownMenuItem(
-                        value: 'All Banks',
-                        child: Text('All Banks'),
-                      ),
-                      ...bankOptions.map((bank) => DropdownMenuItem(
-                            value: bank['id'],
-                            child: Text(bank['label']),
-                          )),
-                    ],
-                    onChanged: (val) {
-                      setState(() => selectedBank = val ?? 'All Banks');
-                    },
-                  ),
-                ),
-                Padding(
-                  padding: const EdgeInsets.symmetric(horizontal: 8.0),
-                  child: DropdownButton<String>(
-                    value: selectedCategory,
-                    isExpanded: true,
-                    items: categories
-                        .map((cat) => DropdownMenuItem(
-                              value: cat,
-                              child: Text(cat),
-                            ))
-                        .toList(),
-                    onChanged: (val) {
-                      setState(() => selectedCategory = val ?? 'All');
-                    },
-                  ),
-                ),
-                const Divider(),
-                Expanded(
-                  child: filteredTransactions.isEmpty
-                      ? const Center(child: Text('No transactions found.'))
-                      : ListView.builder(
-                          itemCount: filteredTransactions.length,
-                          itemBuilder: (context, idx) {
-                            final tx = filteredTransactions[idx];
-                            final dt = (tx['timestamp'] as Timestamp).toDate();
-                            final amountRaw = tx['amount'];
-                            final amount = amountRaw is num
-                                ? amountRaw.toDouble()
-                                : double.tryParse(amountRaw.toString()) ?? 0.0;
-                            return ListTile(
-                              title: Text(tx['merchant'] ?? 'Unknown'),
-                              subtitle: Text(currencyFormat.format(amount)),
-                              trailing: Row(
-                                mainAxisSize: MainAxisSize.min,
-                                children: [
-                                  Text(DateFormat('dd MMM yyyy, hh:mm a').format(dt)),
-                                  if (tx['category'] != null)
-                                    Padding(
-                                      padding: const EdgeInsets.only(left: 8.0),
-                                      child: Chip(
-                                        label: Text(tx['category']),
-                                        visualDensity: VisualDensity.compact,
-                                      ),
-                                    ),
-                                ],
-                              ),
-                            );
-                          },
-                        ),
+      body: Column(
+        children: [
+          Padding(
+            padding: const EdgeInsets.all(8.0),
+            child: DropdownButton<String>(
+              value: selectedBank,
+              isExpanded: true,
+              items: [
+                const DropdownMenuItem(
+                  value: 'All Banks',
+                  child: Text('All Banks'),
                 ),
+                ...bankOptions.map((bank) => DropdownMenuItem(
+                      value: bank['id'],
+                      child: Text(bank['label']),
+                    )),
               ],
+              onChanged: (val) {
+                setState(() => selectedBank = val ?? 'All Banks');
+                _reload();
+              },
+            ),
+          ),
+          Padding(
+            padding: const EdgeInsets.symmetric(horizontal: 8.0),
+            child: DropdownButton<String>(
+              value: selectedCategory,
+              isExpanded: true,
+              items: categories
+                  .map((cat) => DropdownMenuItem(
+                        value: cat,
+                        child: Text(cat),
+                      ))
+                  .toList(),
+              onChanged: (val) {
+                setState(() => selectedCategory = val ?? 'All');
+                _reload();
+              },
             ),
+          ),
+          const Divider(),
+          Expanded(
+            child: isLoading
+                ? const Center(child: CircularProgressIndicator())
+                : error != null
+                ? Center(child: Text(error!))
+                : transactions.isEmpty
+                ? const Center(child: Text('No transactions found.'))
+                : ListView.builder(
+                    itemCount: transactions.length + (nextCursor != null ? 1 : 0),
+                    itemBuilder: (context, idx) {
+                      if (idx == transactions.length) {
+                        if (loadMoreFailed) {
+                          return TextButton(
+                            onPressed: _loadMore,
+                            child: const Text('Could not load more. Tap to retry.'),
+                          );
+                        }
+                        // The end of the list came into view: fetch the next page
+                        WidgetsBinding.instance.addPostFrameCallback((_) => _loadMore());
+                        return const Padding(
+                          padding: EdgeInsets.all(16.0),
+                          child: Center(child: CircularProgressIndicator()),
+                        );
+                      }
+                      final tx = transactions[idx];
+                      // Seconds since the epoch, as sent by the server
+                      final dt = DateTime.fromMillisecondsSinceEpoch(
+                          ((tx['timestamp'] as num) * 1000).round());
+                      final amountRaw = tx['amount'];
+                      final amount = amountRaw is num
+                          ? amountRaw.toDouble()
+                          : double.tryParse(amountRaw.toString()) ?? 0.0;
+                      return ListTile(
+                        title: Text(tx['merchant'] ?? 'Unknown'),
+                        subtitle: Text(currencyFormat.format(amount)),
+                        trailing: Row(
+                          mainAxisSize: MainAxisSize.min,
+                          children: [
+                            Text(DateFormat('dd MMM yyyy, hh:mm a').format(dt)),
+                            if (tx['category'] != null)
+                              Padding(
+                                padding: const EdgeInsets.only(left: 8.0),
+                                child: Chip(
+                                  label: Text(tx['category']),
+                                  visualDensity: VisualDensity.compact,
+                                ),
+                              ),
+                          ],
+                        ),
+                      );
+                    },
+                  ),
+          ),
+        ],
+      ),
     );
   }
 }
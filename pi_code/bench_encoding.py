@@ -0,0 +1,62 @@
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from image_encoder import AdaptiveEncoder
+
+# === CONFIG ===
+UPLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
+REPEATS = 20                      # encodes per image per setting
+UPLINKS_KBPS = [250, 1000, 10000]  # uplink speeds for the adaptive runs and the transfer-time column
+FIXED_QUALITIES = [50, 70, 90]
+
+
+def load_frames():
+    frames = [cv2.imread(path) for path in sorted(glob.glob(os.path.join(UPLOADS_DIR, "*.jpg")))]
+    return [f for f in frames if f is not None]
+
+
+def run(name, encode, frames):
+    sizes, times = [], []
+    for frame in frames:
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            payload = encode(frame)
+            times.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(payload))
+    mean_bytes = float(np.mean(sizes))
+    transfer = "".join(f"{mean_bytes * 8 / kbps:>13.1f}" for kbps in UPLINKS_KBPS)
+    print(f"{name:<28}{mean_bytes:>10.0f}{np.mean(times):>10.2f}{np.percentile(times, 95):>10.2f}{transfer}")
+
+
+def fixed(codec, quality):
+    encoder = AdaptiveEncoder(codec=codec, min_quality=quality, max_quality=quality, max_bytes=1 << 30)
+    return lambda frame: encoder.encode(frame)[1]
+
+
+def adaptive(codec, kbps):
+    encoder = AdaptiveEncoder(codec=codec)
+    encoder.observe_upload(kbps * 1000 // 8, 1.0)  # as if one second moved kbps worth of payload
+
+    def encode(frame):
+        return encoder.encode(frame)[1]
+    return encode
+
+
+if __name__ == "__main__":
+    frames = load_frames()
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]} from {UPLOADS_DIR}")
+    print("No detector boxes here, so every crop is the centred square.\n")
+    header = "".join(f"{f'@{k}kbps ms':>13}" for k in UPLINKS_KBPS)
+    print(f"{'setting':<28}{'bytes':>10}{'enc ms':>10}{'p95 ms':>10}{header}")
+
+    run("full frame jpeg (default q)", lambda f: cv2.imencode(".jpg", f)[1], frames)
+    for codec in ("jpeg", "webp"):
+        for quality in FIXED_QUALITIES:
+            run(f"224px {codec} q{quality}", fixed(codec, quality), frames)
+    for codec in ("jpeg", "webp"):
+        for kbps in UPLINKS_KBPS:
+            run(f"224px {codec} adaptive@{kbps}k", adaptive(codec, kbps), frames)
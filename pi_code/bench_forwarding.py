@@ -0,0 +1,82 @@
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from http_client import MainServerClient
+
+# === CONFIG ===
+HOST, PORT = "127.0.0.1", 8089
+HANDSHAKE_DELAY = 0.08  # seconds added to every new connection, standing in for TCP + TLS to Render
+N_REQUESTS = 30
+IMAGE_PATH = os.path.join(os.path.dirname(__file__), "..", "uploads", "palm_20250717-030033.jpg")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Accepts /scanPalm-style multipart posts and answers like the main server."""
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        time.sleep(HANDSHAKE_DELAY)
+        super().setup()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"message": "Payment OK"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(label, post):
+    with open(IMAGE_PATH, "rb") as f:
+        image = f.read()
+    latencies = []
+    for i in range(N_REQUESTS):
+        files = {"image": ("palm.jpg", image, "image/jpeg")}
+        data = {"token": "bench", "merchant": "Tesco", "amount": "12.50"}
+        start = time.perf_counter()
+        response = post("/scanPalm", data, files)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+    latencies.sort()
+    print(f"  {label:<28} mean {statistics.mean(latencies):7.2f} ms | p50 {latencies[len(latencies) // 2]:7.2f} ms "
+          f"| p95 {latencies[int(len(latencies) * 0.95) - 1]:7.2f} ms")
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer((HOST, PORT), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://{HOST}:{PORT}"
+    print(f"📊 Forwarding {N_REQUESTS} payments to a stand-in server ({HANDSHAKE_DELAY * 1000:.0f} ms per new connection)")
+
+    measure("bare requests.post", lambda path, data, files: requests.post(f"{base_url}{path}", data=data, files=files))
+
+    client = MainServerClient(base_url)
+    client.warm()
+    measure("pooled MainServerClient", lambda path, data, files: client.post(path, data=data, files=files))
+    client.close()
+
+    try:
+        client = MainServerClient(base_url, http2=True)
+    except ImportError:
+        print("  (httpx[http2] not installed, skipping the HTTP/2 client)")
+    else:
+        # The stand-in only speaks HTTP/1.1, so this measures httpx's keep-alive path
+        client.warm()
+        measure("httpx MainServerClient", lambda path, data, files: client.post(path, data=data, files=files))
+        client.close()
+
+    server.shutdown()
@@ -0,0 +1,67 @@
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+import palm_detection
+
+# === CONFIG ===
+UPLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
+MODEL_PATH = os.getenv("PALM_MODEL_PATH", palm_detection.MODEL_PATH)
+THREAD_COUNTS = [1, 4]
+REPEATS = 10            # detect() calls per frame per configuration
+SCORE_THRESHOLD = 0.5
+
+
+def load_frames():
+    frames = [cv2.imread(path) for path in sorted(glob.glob(os.path.join(UPLOADS_DIR, "*.jpg")))]
+    return [f for f in frames if f is not None]
+
+
+def run(detector, frames):
+    """Returns (per-frame best detections, frames per second)."""
+    results = [detector.detect(frame, score_threshold=SCORE_THRESHOLD) for frame in frames]
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        for frame in frames:
+            detector.detect(frame, score_threshold=SCORE_THRESHOLD)
+    return results, REPEATS * len(frames) / (time.perf_counter() - start)
+
+
+def agreement(reference, results):
+    """Accuracy of a variant against the fp32 detections on the same frames."""
+    same_decision = ious = score_errors = keypoint_errors = 0
+    matched = 0
+    for ref, res in zip(reference, results):
+        ref_found, res_found = len(ref.scores) > 0, len(res.scores) > 0
+        same_decision += ref_found == res_found
+        if ref_found and res_found:
+            matched += 1
+            ious += palm_detection.box_iou(ref.boxes[:1], res.boxes[:1])[0, 0]
+            score_errors += abs(ref.scores[0] - res.scores[0])
+            keypoint_errors += np.linalg.norm(ref.keypoints[0] - res.keypoints[0], axis=1).mean()
+    n = max(matched, 1)
+    return same_decision / len(reference), ious / n, score_errors / n, keypoint_errors / n
+
+
+if __name__ == "__main__":
+    frames = load_frames()
+    print(f"{len(frames)} frames from {UPLOADS_DIR}, model {MODEL_PATH}\n")
+    print(f"{'variant':<8}{'threads':>8}{'fps':>9}{'ms/frame':>10}{'agree':>8}{'box IoU':>9}{'|dscore|':>10}{'kp err px':>11}")
+
+    reference = None
+    for variant in palm_detection.MODEL_VARIANTS:
+        for threads in THREAD_COUNTS:
+            try:
+                session = palm_detection.create_session(MODEL_PATH, variant=variant, threads=threads)
+            except FileNotFoundError as e:
+                print(f"{variant:<8}{threads:>8}  skipped: {e}")
+                break
+            results, fps = run(palm_detection.PalmDetector(session), frames)
+            if reference is None:
+                reference = results
+            agree, iou, score_error, keypoint_error = agreement(reference, results)
+            print(f"{variant:<8}{threads:>8}{fps:>9.1f}{1000 / fps:>10.2f}{agree:>8.0%}{iou:>9.3f}"
+                  f"{score_error:>10.4f}{keypoint_error:>11.2f}")
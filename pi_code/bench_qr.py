@@ -0,0 +1,82 @@
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+from pyzbar.pyzbar import decode
+
+from camera import FRAME_SIZE
+from qr_scanner import QRDecoder
+
+# === CONFIG ===
+UPLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
+QR_TEXT = "paypalm-bench-user-0001"
+CODE_SIZES = [240, 160, 96]  # pixels on a 640x480 frame: held close, arm's length, far
+FRAMES_PER_SIZE = 60
+EMPTY_FRAMES = 60            # frames with no code, as while waiting for the customer
+SEED = 7
+
+
+def recorded_frames(path):
+    frames = [cv2.imread(p) for p in sorted(glob.glob(os.path.join(path, "*.jpg")) + glob.glob(os.path.join(path, "*.png")))]
+    return [cv2.resize(f, FRAME_SIZE) for f in frames if f is not None]
+
+
+def synthetic_frames(size, count, rng, backgrounds):
+    """A QR code of the given size pasted on camera frames, drifting and slightly blurred like a hand-held phone."""
+    code = cv2.QRCodeEncoder.create().encode(QR_TEXT)
+    code = cv2.resize(code, (size, size), interpolation=cv2.INTER_NEAREST)
+    w, h = FRAME_SIZE
+    x, y = (w - size) // 2, (h - size) // 2
+    frames = []
+    for i in range(count):
+        x = int(np.clip(x + rng.integers(-6, 7), 0, w - size))
+        y = int(np.clip(y + rng.integers(-6, 7), 0, h - size))
+        frame = backgrounds[i % len(backgrounds)].copy()
+        frame[y:y + size, x:x + size] = cv2.cvtColor(code, cv2.COLOR_GRAY2BGR)
+        frames.append(cv2.GaussianBlur(frame, (3, 3), 0))
+    return frames
+
+
+def run(name, decode_frame, frames):
+    times, hits = [], 0
+    for frame in frames:
+        start = time.perf_counter()
+        codes = decode_frame(frame)
+        times.append((time.perf_counter() - start) * 1000)
+        hits += bool(codes)
+    print(f"  {name:<30}{np.mean(times):>9.2f}{np.percentile(times, 95):>9.2f}{hits / len(frames):>9.0%}")
+
+
+def baseline(frame):
+    """What capture_qr() used to do: every symbology on the full colour frame."""
+    return decode(frame)
+
+
+def compare(label, frames):
+    print(f"{label} ({len(frames)} frames)")
+    print(f"  {'decoder':<30}{'mean ms':>9}{'p95 ms':>9}{'found':>9}")
+    run("pyzbar, full colour frame", baseline, frames)
+    run("pyzbar, full grayscale frame", QRDecoder(levels=0).decode, frames)
+    for levels in (1, 2):
+        decoder = QRDecoder(levels=levels)
+        run(f"pyramid x{levels} + ROI lock", decoder.decode, frames)
+        print(f"  {'':<30}paths: {decoder.counters}")
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QR decode latency, full frame vs pyramid + ROI lock.")
+    parser.add_argument("--frames", help="Directory of recorded QR frames (default: synthetic codes on uploads/).")
+    args = parser.parse_args()
+
+    if args.frames:
+        compare(f"Recorded frames from {args.frames}", recorded_frames(args.frames))
+    else:
+        rng = np.random.default_rng(SEED)
+        backgrounds = recorded_frames(UPLOADS_DIR)
+        for size in CODE_SIZES:
+            compare(f"{size}px code", synthetic_frames(size, FRAMES_PER_SIZE, rng, backgrounds))
+        compare("No code in view", (backgrounds * EMPTY_FRAMES)[:EMPTY_FRAMES])
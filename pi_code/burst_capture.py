@@ -0,0 +1,81 @@
+import os
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from camera import RING_BUFFER_SIZE
+
+# === CONFIG ===
+# Frames taken from the running stream once a palm is first seen (at most the ring buffer)
+BURST_FRAMES = min(int(os.getenv("PALM_BURST_FRAMES", "5")), RING_BUFFER_SIZE)
+# Time from the first detection to the chosen frame, collecting and re-detecting included
+BURST_BUDGET = float(os.getenv("PALM_BURST_BUDGET_MS", "300")) / 1000
+# Sharpest frames re-checked by the detector; each costs one inference
+BURST_DETECT = int(os.getenv("PALM_BURST_DETECT", "3"))
+FOCUS_SIZE = 128     # palm crops are compared at this size, so scores do not depend on hand distance
+FOCUS_MARGIN = 0.1   # fraction of the box added on each side before measuring focus
+
+BurstPick = namedtuple("BurstPick", ["frame", "box", "confidence", "focus", "candidates"])
+
+
+def collect_burst(camera, trigger, n=BURST_FRAMES, deadline=None):
+    """
+    The trigger frame plus the frames the camera delivers after it, until n frames are
+    held or the deadline passes. Frames that arrive while waiting are picked up from the
+    ring buffer, so none are missed. Returns the newest n, oldest first.
+    """
+    frames = [trigger]
+    while len(frames) < n:
+        remaining = (deadline - time.monotonic()) if deadline is not None else 1.0
+        last_id = frames[-1].id
+        if remaining <= 0 or camera.wait_for_frame(last_id, remaining) is None:
+            break
+        frames.extend(f for f in camera.recent() if f.id > last_id)
+    return frames[-n:]
+
+
+def focus_scores(images, box, size=FOCUS_SIZE, margin=FOCUS_MARGIN):
+    """
+    Variance of the Laplacian over the palm region of each image: higher is sharper.
+    Each crop is shrunk to size x size grayscale, then the Laplacian and its variance
+    are computed for the whole [N, size, size] stack at once.
+    """
+    h, w = images[0].shape[:2]
+    x0, y0, x1, y1 = box
+    pad_x, pad_y = (x1 - x0) * margin, (y1 - y0) * margin
+    x0, y0 = max(int(x0 - pad_x), 0), max(int(y0 - pad_y), 0)
+    x1, y1 = min(int(x1 + pad_x), w), min(int(y1 + pad_y), h)
+    if x1 - x0 < 3 or y1 - y0 < 3:
+        x0, y0, x1, y1 = 0, 0, w, h
+
+    stack = np.empty((len(images), size, size), dtype=np.uint8)
+    for i, image in enumerate(images):
+        crop = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        cv2.resize(crop, (size, size), dst=stack[i], interpolation=cv2.INTER_AREA)
+    c = stack.astype(np.float32)
+    laplacian = 4 * c[:, 1:-1, 1:-1] - c[:, :-2, 1:-1] - c[:, 2:, 1:-1] - c[:, 1:-1, :-2] - c[:, 1:-1, 2:]
+    return laplacian.var(axis=(1, 2))
+
+
+def select_best(frames, box, detect, top_k=BURST_DETECT, deadline=None):
+    """
+    Ranks the burst by focus inside box, then runs detect(image) -> (box, confidence)
+    on the sharpest frames, best first, while the deadline allows (the sharpest one is
+    always checked). The pick maximises confidence x focus relative to the sharpest
+    frame. Returns a BurstPick, or None when the palm is in none of the checked frames.
+    """
+    focus = focus_scores([f.image for f in frames], box)
+    sharpest = float(focus.max()) or 1.0
+    best = None
+    for rank, i in enumerate(np.argsort(-focus)[:top_k]):
+        if rank and deadline is not None and time.monotonic() >= deadline:
+            break
+        found, confidence = detect(frames[i].image)
+        if found is None:
+            continue
+        quality = confidence * focus[i] / sharpest
+        if best is None or quality > best[0]:
+            best = (quality, BurstPick(frames[i], found, confidence, float(focus[i]), len(frames)))
+    return best[1] if best is not None else None
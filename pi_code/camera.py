@@ -0,0 +1,208 @@
+import os
+import glob
+import threading
+import time
+from collections import deque, namedtuple
+import cv2
+
+# === CONFIG ===
+FRAME_SIZE = (640, 480)
+RING_BUFFER_SIZE = 8
+# "picamera" for the sensor, or a path to a directory of JPEGs / a video file for testing
+CAMERA_SOURCE = os.getenv("CAMERA_SOURCE", "picamera")
+REPLAY_FPS = 30.0
+
+Frame = namedtuple("Frame", ["id", "timestamp", "image"])
+
+
+# === FRAME SOURCES ===
+class Picamera2Source:
+    """Live frames from the Pi camera, as BGR arrays ready for OpenCV."""
+
+    def __init__(self, size=FRAME_SIZE):
+        self.size = size
+        self.picam2 = None
+
+    def start(self):
+        from picamera2 import Picamera2
+        self.picam2 = Picamera2()
+        # picamera2's "RGB888" is laid out B, G, R in memory, which is what OpenCV expects
+        self.picam2.configure(self.picam2.create_preview_configuration(main={"format": "RGB888", "size": self.size}))
+        self.picam2.start()
+
+    def read(self):
+        return self.picam2.capture_array()
+
+    def stop(self):
+        if self.picam2 is not None:
+            self.picam2.stop()
+            self.picam2.close()
+            self.picam2 = None
+
+
+class DirectorySource:
+    """Replays the JPEGs in a directory (e.g. uploads/) in name order at a fixed frame rate."""
+
+    def __init__(self, path, fps=REPLAY_FPS, loop=True, size=FRAME_SIZE):
+        self.paths = sorted(glob.glob(os.path.join(path, "*.jpg")) + glob.glob(os.path.join(path, "*.jpeg")))
+        if not self.paths:
+            raise ValueError(f"No JPEG files found in {path}")
+        self.interval = 1.0 / fps
+        self.loop = loop
+        self.size = size
+        self._images = []
+        self._index = 0
+        self._next_time = 0.0
+
+    def start(self):
+        # Decode everything once so replay speed is not limited by the SD card
+        self._images = [cv2.resize(cv2.imread(p), self.size) for p in self.paths]
+        self._index = 0
+        self._next_time = time.monotonic()
+
+    def read(self):
+        if self._index >= len(self._images):
+            if not self.loop:
+                return None
+            self._index = 0
+        delay = self._next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_time = max(self._next_time, time.monotonic() - self.interval) + self.interval
+        frame = self._images[self._index].copy()
+        self._index += 1
+        return frame
+
+    def stop(self):
+        self._images = []
+
+
+class VideoSource:
+    """Frames from a recorded video file, paced to the file's own frame rate."""
+
+    def __init__(self, path, loop=True, size=FRAME_SIZE):
+        self.path = path
+        self.loop = loop
+        self.size = size
+        self.capture = None
+        self.interval = 1.0 / REPLAY_FPS
+        self._next_time = 0.0
+
+    def start(self):
+        self.capture = cv2.VideoCapture(self.path)
+        if not self.capture.isOpened():
+            raise ValueError(f"Could not open video {self.path}")
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        if fps and fps > 0:
+            self.interval = 1.0 / fps
+        self._next_time = time.monotonic()
+
+    def read(self):
+        ok, frame = self.capture.read()
+        if not ok and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.capture.read()
+        if not ok:
+            return None
+        delay = self._next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_time = max(self._next_time, time.monotonic() - self.interval) + self.interval
+        return cv2.resize(frame, self.size)
+
+    def stop(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+def create_frame_source(spec=CAMERA_SOURCE):
+    """Builds a frame source from a CAMERA_SOURCE value."""
+    if spec == "picamera":
+        return Picamera2Source()
+    if os.path.isdir(spec):
+        return DirectorySource(spec)
+    if os.path.isfile(spec):
+        return VideoSource(spec)
+    raise ValueError(f"Unknown camera source: {spec}")
+
+
+# === CAMERA SERVICE ===
+class CameraService:
+    """
+    Owns the camera for the life of the process.
+    A background thread keeps reading frames into a small ring buffer, so the QR and
+    palm stages get an already warmed-up stream without re-initialising the sensor.
+    """
+
+    def __init__(self, source, buffer_size=RING_BUFFER_SIZE):
+        self.source = source
+        self._frames = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._next_id = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.ready = threading.Event()  # set once the first frame has arrived
+
+    def start(self):
+        """Starts the capture thread. Calling it again while running does nothing."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self.source.start()
+        self._thread = threading.Thread(target=self._run, name="camera-service", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.source.stop()
+        self.ready.clear()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                image = self.source.read()
+            except Exception as e:
+                print(f"[Camera] Frame read failed: {e}")
+                time.sleep(0.1)
+                continue
+            if image is None:
+                print("[Camera] Frame source exhausted.")
+                break
+            with self._cond:
+                self._next_id += 1
+                self._frames.append(Frame(self._next_id, time.monotonic(), image))
+                self._cond.notify_all()
+            self.ready.set()
+
+    # === FRAME ACCESS ===
+    def latest(self):
+        """Most recent frame, or None before the first frame arrives."""
+        with self._cond:
+            return self._frames[-1] if self._frames else None
+
+    def recent(self, n=RING_BUFFER_SIZE):
+        """Up to n most recent frames, oldest first."""
+        with self._cond:
+            return list(self._frames)[-n:]
+
+    def wait_for_frame(self, after_id=0, timeout=1.0):
+        """Blocks until a frame newer than after_id is available. Returns None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frames and self._frames[-1].id > after_id, timeout):
+                return None
+            return self._frames[-1]
+
+    def frames(self, timeout=1.0):
+        """Yields each new frame as it arrives; stops when no frame arrives within timeout."""
+        latest = self.latest()
+        last_id = latest.id if latest else 0
+        while True:
+            frame = self.wait_for_frame(last_id, timeout)
+            if frame is None:
+                return
+            last_id = frame.id
+            yield frame
@@ -1,109 +1,189 @@
+import argparse
+import os
 import cv2
-import numpy as np
-import requests
 import time
-from picamera2 import Picamera2
-import onnxruntime as ort
+import palm_detection
+from camera import create_frame_source
+from pipeline import LatestSlot, Stage, PipelineStats
+from uploader import UploadQueue
+from perceptual_hash import RecentHashes, dhash
+from image_encoder import AdaptiveEncoder
 
 # === CONFIG ===
 MODEL_PATH = 'palm_detection_mediapipe_2023feb.onnx'
 SERVER_URL = 'http://172.20.10.3:5001/upload'
-INPUT_SIZE = 192
-CONF_THRESHOLD = 1
+CONF_THRESHOLD = 0.5  # palm probability after the sigmoid
 SEND_INTERVAL = 2.0  # seconds between uploads
 TRACKING_THRESHOLD = 30  # pixels movement to be considered "different"
 STEADY_TIME_REQUIRED = 0 # seconds the hand must stay still before upload
-
-# === INIT MODEL ===
-print("[INFO] Loading ONNX palm detection model...")
-ort_session = ort.InferenceSession(MODEL_PATH)
-
-# === INIT CAMERA ===
-picam2 = Picamera2()
-picam2.configure(picam2.create_preview_configuration(main={"format": "RGB888", "size": (640, 480)}))
-picam2.start()
-last_sent_time = 0
-
-# === TRACKING STATE ===
-prev_box = None
-steady_start_time = None
-
-print("[INFO] Starting palm detection...")
-
-# === MAIN LOOP ===
-while True:
-    frame = picam2.capture_array()
-    orig_h, orig_w = frame.shape[:2]
-
-    # Preprocess input
-    resized = cv2.resize(frame, (INPUT_SIZE, INPUT_SIZE)).astype(np.float32)
-    input_tensor = ((resized - 128) / 128).astype(np.float32)
-    input_tensor = np.expand_dims(input_tensor, axis=0)  # Shape: [1, 192, 192, 3]
-
-    # Run inference
-    outputs = ort_session.run(None, {ort_session.get_inputs()[0].name: input_tensor})
-    detections = outputs[0][0]  # Shape: [N, 18]
-
-    palm_detected = False
-
-    for det in detections:
-        score = det[2]
-        if score < CONF_THRESHOLD:
-            continue
-
-        palm_detected = True
-        x_center, y_center, w, h = det[0], det[1], det[3], det[4]
-        x0 = int((x_center - w / 2) * orig_w)
-        y0 = int((y_center - h / 2) * orig_h)
-        x1 = int((x_center + w / 2) * orig_w)
-        y1 = int((y_center + h / 2) * orig_h)
-
-        # Clamp
-        x0 = max(0, x0)
-        y0 = max(0, y0)
-        x1 = min(orig_w, x1)
-        y1 = min(orig_h, y1)
-
-        # Draw bounding box
-        cv2.rectangle(frame, (x0, y0), (x1, y1), (0, 255, 0), 2)
-
-        # Track movement
-        new_box = (x0, y0, x1, y1)
+STATS_INTERVAL = 30.0  # seconds between upload counter reports
+LIVE_STATS_INTERVAL = 5.0  # seconds between FPS / utilisation reports
+DEDUP_WINDOW = 10.0  # seconds a sent crop suppresses near-identical ones
+DEDUP_MAX_DISTANCE = 8  # dHash bits (of 64) two crops may differ by and still count as the same
+HEADLESS = os.getenv("CAPTURE_HEADLESS") == "1"  # no preview window at all (SSH, systemd)
+PREVIEW_FPS = float(os.getenv("CAPTURE_PREVIEW_FPS", "0"))  # preview refresh cap; 0 shows every frame
+
+
+# === STAGES ===
+# capture -> detect -> upload, with detect also feeding the preview. Every stage runs on its
+# own thread and hands over only its newest output through a single-slot buffer, so the frame
+# rate is set by the slowest stage instead of the sum of all of them, and a slow stage skips
+# stale frames instead of falling behind.
+class PalmDetectStage:
+    """Runs the detector on a frame. Returns (frame, best box clamped to the frame, or None)."""
+
+    def __init__(self, detector):
+        self.detector = detector
+
+    def __call__(self, frame):
+        detections = self.detector.detect(frame, score_threshold=CONF_THRESHOLD)
+        if not len(detections.boxes):  # best detection first
+            return frame, None
+        h, w = frame.shape[:2]
+        x0, y0, x1, y1 = (int(v) for v in detections.boxes[0])
+        return frame, (max(0, x0), max(0, y0), min(w, x1), min(h, y1))
+
+
+class UploadStage:
+    """
+    Uploads a crop once the hand has been steady for STEADY_TIME_REQUIRED, at most
+    every SEND_INTERVAL, skipping crops near-identical to one sent recently.
+    """
+
+    def __init__(self, encoder, uploader, recent_crops):
+        self.encoder = encoder
+        self.uploader = uploader
+        self.recent_crops = recent_crops
+        self.prev_box = None
+        self.steady_start_time = None
+        self.last_sent_time = 0
+
+    def __call__(self, item):
+        frame, box = item
+        if box is None:
+            return None
+        x0, y0, x1, y1 = box
         now = time.time()
 
-        # If no previous box or it moved significantly
-        if prev_box is None:
-            steady_start_time = now
-            prev_box = new_box
+        # Track movement: restart the steady timer when the box moves significantly
+        if self.prev_box is None:
+            self.steady_start_time = now
+            self.prev_box = box
         else:
-            dx = abs(prev_box[0] - new_box[0]) + abs(prev_box[2] - new_box[2])
-            dy = abs(prev_box[1] - new_box[1]) + abs(prev_box[3] - new_box[3])
-            movement = dx + dy
-
-            if movement > 30:  # less strict
-                steady_start_time = now
-                prev_box = new_box
-
-        # Allow upload if steady for 1 sec and time gap passed
-        if steady_start_time and now - steady_start_time > STEADY_TIME_REQUIRED and now - last_sent_time > SEND_INTERVAL:
-            palm_crop = frame[y0:y1, x0:x1]
-            if palm_crop.size > 0:
-                _, img_encoded = cv2.imencode('.jpg', palm_crop)
-                files = {'file': ('palm.jpg', img_encoded.tobytes(), 'image/jpeg')}
-                try:
-                    res = requests.post(SERVER_URL, files=files, timeout=3)
-                    print(f"[{res.status_code}] Palm sent at {time.strftime('%X')}")
-                    last_sent_time = now
-                except Exception as e:
-                    print("❌ Upload failed:", e)
-
-        break  # only first valid detection
-
-    # Display
-    cv2.imshow("Palm Detection", frame)
-    if cv2.waitKey(1) & 0xFF == ord("q"):
-        break
-
-# Cleanup
-picam2.stop()
-cv2.destroyAllWindows()
+            dx = abs(self.prev_box[0] - x0) + abs(self.prev_box[2] - x1)
+            dy = abs(self.prev_box[1] - y0) + abs(self.prev_box[3] - y1)
+            if dx + dy > TRACKING_THRESHOLD:
+                self.steady_start_time = now
+                self.prev_box = box
+
+        if now - self.steady_start_time > STEADY_TIME_REQUIRED and now - self.last_sent_time > SEND_INTERVAL:
+            try:
+                palm_crop = self.encoder.prepare(frame, box)
+            except ValueError:  # palm too small (or too far outside the frame) to crop
+                return None
+            crop_hash = dhash(palm_crop)
+            if not self.recent_crops.is_duplicate(crop_hash):
+                self.uploader.submit({'file': self.encoder.encode_roi(palm_crop)})
+                self.recent_crops.add(crop_hash)
+                self.last_sent_time = now
+        return None
+
+
+def draw(frame, box):
+    """Preview image: a copy of the frame with the palm box drawn on it (uploads never see the box)."""
+    image = frame.copy()
+    if box is not None:
+        cv2.rectangle(image, box[:2], box[2:], (0, 255, 0), 2)
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Continuous palm capture and upload.")
+    parser.add_argument("--headless", action="store_true", default=HEADLESS,
+                        help="Run without a preview window (or set CAPTURE_HEADLESS=1).")
+    parser.add_argument("--preview-fps", type=float, default=PREVIEW_FPS,
+                        help="Refresh the preview at most this often; 0 shows every frame.")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds.")
+    args = parser.parse_args()
+
+    # === INIT MODEL ===
+    print("[INFO] Loading ONNX palm detection model...")
+    # Variant (PALM_MODEL_VARIANT), threads, execution mode and arena (PALM_ORT_*) come from the environment
+    ort_session = palm_detection.create_session(MODEL_PATH)
+    palm_detector = palm_detection.PalmDetector(ort_session)
+
+    # === INIT CAMERA ===
+    # The Pi camera by default; CAMERA_SOURCE=<directory or video> replays recorded frames
+    camera = create_frame_source()
+    camera.start()
+
+    # === INIT ENCODER + UPLOADER ===
+    # Crops are resized to the server's input resolution and sized to the measured uplink;
+    # uploads run on background workers so a slow receiver never stalls the pipeline
+    encoder = AdaptiveEncoder()
+    uploader = UploadQueue(SERVER_URL, on_sent=encoder.observe_upload)
+
+    # === INIT DEDUP ===
+    # A still hand held in view would otherwise be re-sent every SEND_INTERVAL
+    recent_crops = RecentHashes(window=DEDUP_WINDOW, max_distance=DEDUP_MAX_DISTANCE)
+
+    # === INIT PIPELINE ===
+    to_detect, to_upload, to_preview = LatestSlot(), LatestSlot(), LatestSlot()
+    capture = Stage("capture", lambda image: image, source=camera.read, outboxes=[to_detect])
+    detect = Stage("detect", PalmDetectStage(palm_detector), inbox=to_detect,
+                   outboxes=[to_upload] if args.headless else [to_upload, to_preview])
+    upload = Stage("upload", UploadStage(encoder, uploader, recent_crops), inbox=to_upload)
+    # The preview window belongs to the main thread (GUI toolkits require it); this Stage only keeps its counters
+    preview = Stage("preview", None, inbox=to_preview)
+    workers = [capture, detect, upload]
+    stats = PipelineStats(workers if args.headless else workers + [preview])
+    for stage in workers:
+        stage.start()
+
+    print(f"[INFO] Starting palm detection ({'headless' if args.headless else 'with preview'})...")
+    started = last_live_stats = last_stats_time = time.time()
+    next_preview = 0.0
+
+    # === MAIN LOOP ===
+    try:
+        while args.duration is None or time.time() - started < args.duration:
+            if args.headless:
+                time.sleep(0.2)
+            else:
+                # Until the next preview is due, only pump the window's events; the newest
+                # frame is taken from the slot when it is
+                wait_ms = max(1, int((next_preview - time.monotonic()) * 1000))
+                item = to_preview.get(timeout=0.2) if wait_ms == 1 else None
+                if item is not None:
+                    start = time.perf_counter()
+                    cv2.imshow("Palm Detection", draw(*item))
+                    preview.record(time.perf_counter() - start)
+                    if args.preview_fps > 0:
+                        next_preview = time.monotonic() + 1.0 / args.preview_fps
+                if cv2.waitKey(min(wait_ms, 200)) & 0xFF == ord("q"):
+                    break
+
+            now = time.time()
+            if now - last_live_stats > LIVE_STATS_INTERVAL:
+                print(f"[INFO] {PipelineStats.format(stats.sample())}")
+                last_live_stats = now
+            if now - last_stats_time > STATS_INTERVAL:
+                print(f"[INFO] Uploads: {uploader.stats()}, dedup: {recent_crops.stats()}")
+                last_stats_time = now
+    except KeyboardInterrupt:
+        pass
+
+    # Cleanup
+    for stage in workers:
+        stage.stop()
+    for stage in workers:
+        stage.join(timeout=2)
+    camera.stop()
+    if not args.headless:
+        cv2.destroyAllWindows()
+    uploader.close(timeout=5)
+    print(f"[INFO] Uploads: {uploader.stats()}, dedup: {recent_crops.stats()}")
+
+
+if __name__ == "__main__":
+    main()
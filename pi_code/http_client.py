@@ -0,0 +1,105 @@
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# === CONFIG ===
+POOL_SIZE = 4
+CONNECT_TIMEOUT = 3.05   # seconds to establish TCP + TLS
+READ_TIMEOUT = 60        # seconds to wait for the main server (Render cold starts are slow)
+CONNECT_RETRIES = 2      # only connection setup is retried; a POST that reached the server is not
+KEEPALIVE_INTERVAL = 30  # seconds between background pings that keep a pooled connection warm
+
+
+def payment_form(merchant, amount):
+    """Form fields for the main server's /scanPalm: 'token' is a JSON string with the merchant and amount."""
+    return {'token': json.dumps({"merchant": merchant, "amount": str(amount)})}
+
+
+class MainServerClient:
+    """
+    Shared, thread-safe client for forwarding requests to the main server.
+    Connections are pooled and kept alive between payments, and a background
+    thread opens and periodically refreshes one, so a checkout does not pay a
+    fresh TCP + TLS handshake. With http2=True (needs httpx[http2]) requests
+    are multiplexed over a single connection instead.
+    """
+
+    def __init__(self, base_url, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, http2=False, keepalive_interval=KEEPALIVE_INTERVAL):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.keepalive_interval = keepalive_interval
+        self._stop_event = threading.Event()
+        self._warm_thread = None
+        self._httpx = None
+
+        if http2:
+            import httpx
+            self._httpx = httpx.Client(
+                http2=True,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=pool_size, keepalive_expiry=keepalive_interval * 2),
+                transport=httpx.HTTPTransport(http2=True, retries=CONNECT_RETRIES),
+            )
+        else:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=pool_size,
+                max_retries=Retry(total=None, connect=CONNECT_RETRIES, read=0, status=0, backoff_factor=0.2),
+            )
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+    def post(self, path, data=None, files=None, headers=None):
+        """POSTs to the main server. Connection failures raise requests.exceptions.ConnectionError."""
+        url = f"{self.base_url}{path}"
+        if self._httpx is None:
+            return self.session.post(url, data=data, files=files, headers=headers, timeout=self.timeout)
+
+        import httpx
+        if files:
+            # httpx only accepts bytes or file objects, not the memoryviews the capture path hands over
+            files = {name: tuple(bytes(part) if isinstance(part, memoryview) else part for part in spec)
+                     for name, spec in files.items()}
+        try:
+            return self._httpx.post(url, data=data, files=files, headers=headers)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+    # === PRE-WARMING ===
+    def warm(self):
+        """Opens (or refreshes) a pooled connection with a cheap request."""
+        try:
+            if self._httpx is None:
+                self.session.head(self.base_url, timeout=self.timeout)
+            else:
+                self._httpx.head(self.base_url)
+            return True
+        except Exception as e:
+            print(f"[Pi-Sub-Server] Main server warm-up failed: {e}")
+            return False
+
+    def start_prewarm(self):
+        """Warms the connection now and keeps it warm in a background thread."""
+        if self._warm_thread is not None:
+            return
+        self._warm_thread = threading.Thread(target=self._warm_loop, name="main-server-warm", daemon=True)
+        self._warm_thread.start()
+
+    def _warm_loop(self):
+        while True:
+            self.warm()
+            if self._stop_event.wait(self.keepalive_interval):
+                return
+
+    def close(self):
+        self._stop_event.set()
+        if self._httpx is not None:
+            self._httpx.close()
+        else:
+            self.session.close()
@@ -0,0 +1,128 @@
+import os
+import threading
+
+import cv2
+
+# === CONFIG ===
+UPLOAD_SIZE = int(os.getenv("UPLOAD_SIZE", "224"))         # px; the server decodes at 1/2 scale for its 112 px model input
+UPLOAD_CODEC = os.getenv("UPLOAD_CODEC", "jpeg")            # jpeg or webp
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", "16000"))
+UPLOAD_MIN_BYTES = 4000             # floor for the adaptive budget on a very slow link
+TARGET_UPLOAD_SECONDS = 0.1         # the budget shrinks so one upload takes about this long on the measured uplink
+ROI_MARGIN = 0.15                   # extra context around the detected palm box, per side
+MIN_ROI_SIZE = 32                   # px; a smaller crop holds no usable palm (and an empty one can't be encoded)
+MIN_QUALITY = 40
+MAX_QUALITY = 90
+SEARCH_STEPS = 4                    # encodes at most per image while searching for a quality that fits
+THROUGHPUT_SMOOTHING = 0.3          # weight of the newest uplink measurement
+
+CODECS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "palm.jpg", "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "palm.webp", "image/webp"),
+}
+
+
+def crop_square(image, box=None, margin=ROI_MARGIN):
+    """
+    Square region around a palm box (x0, y0, x1, y1) grown by margin on each side,
+    shifted to stay inside the image. Without a box, the centred square.
+    The server centre-crops to a square anyway, so nothing it uses is lost.
+    Raises ValueError when the square would be smaller than MIN_ROI_SIZE.
+    """
+    h, w = image.shape[:2]
+    if box is None:
+        side = min(h, w)
+        cx, cy = w / 2, h / 2
+    else:
+        x0, y0, x1, y1 = box
+        side = min(max(x1 - x0, y1 - y0) * (1 + 2 * margin), h, w)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    side = int(side)
+    if side < MIN_ROI_SIZE:
+        raise ValueError(f"Palm region too small to upload ({side} px, minimum {MIN_ROI_SIZE} px)")
+    left = int(min(max(cx - side / 2, 0), w - side))
+    top = int(min(max(cy - side / 2, 0), h - side))
+    return image[top:top + side, left:left + side]
+
+
+class AdaptiveEncoder:
+    """
+    Turns a camera frame into an upload payload: crop to the palm, resize to the
+    resolution the server model uses, and encode at the highest quality that fits
+    a byte budget. The budget is UPLOAD_MAX_BYTES until uploads are observed, then
+    follows the measured uplink throughput so a slow link gets smaller images.
+    The quality found for one frame is the starting point for the next.
+    """
+
+    def __init__(self, codec=UPLOAD_CODEC, size=UPLOAD_SIZE, max_bytes=UPLOAD_MAX_BYTES,
+                 min_bytes=UPLOAD_MIN_BYTES, target_seconds=TARGET_UPLOAD_SECONDS,
+                 min_quality=MIN_QUALITY, max_quality=MAX_QUALITY):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown upload codec: {codec}")
+        self.codec = codec
+        self.size = size
+        self.max_bytes = max_bytes
+        self.min_bytes = min_bytes
+        self.target_seconds = target_seconds
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.quality = max_quality
+        self.throughput = None  # bytes per second, smoothed
+        self._lock = threading.Lock()
+
+    # === BUDGET ===
+    def observe_upload(self, nbytes, seconds):
+        """Feeds one measured upload (payload size and transfer time) into the throughput estimate."""
+        if nbytes <= 0 or seconds <= 0:
+            return
+        rate = nbytes / seconds
+        with self._lock:
+            if self.throughput is None:
+                self.throughput = rate
+            else:
+                self.throughput += THROUGHPUT_SMOOTHING * (rate - self.throughput)
+
+    def budget(self):
+        with self._lock:
+            if self.throughput is None:
+                return self.max_bytes
+            return int(min(self.max_bytes, max(self.min_bytes, self.throughput * self.target_seconds)))
+
+    # === ENCODING ===
+    def prepare(self, image, box=None):
+        """Palm ROI resized to the upload resolution (never upscaled). Raises ValueError if it is too small."""
+        roi = crop_square(image, box)
+        if roi.shape[0] > self.size:
+            roi = cv2.resize(roi, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        return roi
+
+    def encode(self, image, box=None):
+        return self.encode_roi(self.prepare(image, box))
+
+    def encode_roi(self, roi):
+        """Returns (filename, encoded buffer, content_type) for a prepared ROI."""
+        ext, flag, filename, content_type = CODECS[self.codec]
+        budget = self.budget()
+        lo, hi = self.min_quality, self.max_quality
+        quality = self.quality
+        best = None
+        for _ in range(SEARCH_STEPS):
+            ok, encoded = cv2.imencode(ext, roi, [flag, quality])
+            if not ok:
+                raise ValueError(f"Could not encode image as {self.codec}")
+            if len(encoded) <= budget:
+                best = (quality, encoded)
+                # Close enough to the budget (or already at the top): stop searching
+                if len(encoded) >= 0.8 * budget or quality >= hi:
+                    break
+                lo = quality + 1
+            else:
+                hi = quality - 1
+            if lo > hi:
+                break
+            quality = (lo + hi + 1) // 2
+        if best is None:  # nothing fitted; send the smallest allowed
+            ok, encoded = cv2.imencode(ext, roi, [flag, self.min_quality])
+            best = (self.min_quality, encoded)
+        self.quality = best[0]
+        return filename, best[1].data, content_type
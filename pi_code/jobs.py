@@ -0,0 +1,158 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+# === CONFIG ===
+JOB_TIMEOUT = 60.0       # seconds a job may hold the camera before it is stopped
+MAX_QUEUED = 8           # jobs waiting for the camera; more are rejected
+JOB_RETENTION = 300.0    # seconds a finished job stays queryable
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED, TIMED_OUT = (
+    "queued", "running", "succeeded", "failed", "cancelled", "timed_out")
+FINISHED = (SUCCEEDED, FAILED, CANCELLED, TIMED_OUT)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    """One camera session (a scan or a registration) and its outcome."""
+
+    def __init__(self, kind, params, request_id=None, timeout=JOB_TIMEOUT):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.request_id = request_id
+        self.timeout = timeout
+        self.status = QUEUED
+        self.result = None       # response body from the main server (or the error body)
+        self.http_status = None  # status code that body came with
+        self.created = time.time()
+        self.started = self.finished = None
+        self.version = 0         # bumped on every change, for long-polling and SSE
+        self._cancel = threading.Event()
+        self._deadline = None
+
+    def should_stop(self):
+        """Polled by the camera loops: True once the job is cancelled or out of time."""
+        return self._cancel.is_set() or (self._deadline is not None and time.monotonic() > self._deadline)
+
+    def to_dict(self, queue_position=None):
+        body = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "version": self.version,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if queue_position is not None:
+            body["queue_position"] = queue_position
+        if self.status in FINISHED:
+            body["http_status"] = self.http_status
+            body["result"] = self.result
+        return body
+
+
+class JobQueue:
+    """
+    Runs camera jobs one at a time, in arrival order, on a single worker thread,
+    so concurrent checkouts queue for the camera instead of fighting over it.
+    handler(job) returns (body, http_status). It should poll job.should_stop() and
+    return None if it gave up because of it; the job is then reported as
+    cancelled or timed out. A result that arrives anyway (a payment already
+    forwarded when the cancel came in) is kept.
+    """
+
+    def __init__(self, handler, job_timeout=JOB_TIMEOUT, max_queued=MAX_QUEUED, retention=JOB_RETENTION):
+        self.handler = handler
+        self.job_timeout = job_timeout
+        self.max_queued = max_queued
+        self.retention = retention
+        self._jobs = {}
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name="camera-jobs", daemon=True)
+        self._worker.start()
+
+    def submit(self, kind, params=None, request_id=None):
+        with self._cond:
+            self._prune()
+            if len(self._queue) >= self.max_queued:
+                raise QueueFull(f"{len(self._queue)} jobs are already waiting for the camera")
+            job = Job(kind, params or {}, request_id, self.job_timeout)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._cond.notify_all()
+            return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def describe(self, job):
+        with self._cond:
+            position = next((i for i, queued in enumerate(self._queue) if queued is job), None)
+            return job.to_dict(position)
+
+    def wait(self, job, after_version, timeout):
+        """Blocks until the job changes past after_version or finishes, up to timeout seconds."""
+        with self._cond:
+            self._cond.wait_for(lambda: job.version > after_version or job.status in FINISHED, timeout)
+            return job.version
+
+    def cancel(self, job):
+        """Cancels a queued job at once; a running one stops at its next frame and frees the camera."""
+        with self._cond:
+            if job.status == QUEUED:
+                self._queue.remove(job)
+                self._finish(job, CANCELLED, {"error": "Cancelled"}, 499)
+            elif job.status == RUNNING:
+                job._cancel.set()
+                self._cond.notify_all()
+            return job.status
+
+    # === WORKER ===
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                job = self._queue.popleft()
+                job.status = RUNNING
+                job.started = time.time()
+                job._deadline = time.monotonic() + job.timeout
+                self._bump(job)
+
+            try:
+                outcome = self.handler(job)
+            except Exception as e:
+                print(f"[Pi-Sub-Server] ❌ Job {job.id} ({job.kind}) failed: {e}")
+                outcome = {"error": f"Internal sub-server error: {e}"}, 500
+
+            with self._cond:
+                if outcome is not None:
+                    body, http_status = outcome
+                    self._finish(job, SUCCEEDED if http_status < 400 else FAILED, body, http_status)
+                elif job._cancel.is_set():
+                    self._finish(job, CANCELLED, {"error": "Cancelled"}, 499)
+                else:
+                    self._finish(job, TIMED_OUT, {"error": f"Timed out after {job.timeout:.0f}s"}, 504)
+
+    def _finish(self, job, status, body, http_status):
+        job.status = status
+        job.result = body
+        job.http_status = http_status
+        job.finished = time.time()
+        self._bump(job)
+
+    def _bump(self, job):
+        job.version += 1
+        self._cond.notify_all()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self._jobs.values() if j.finished is not None and j.finished < cutoff]:
+            del self._jobs[job_id]
@@ -0,0 +1,130 @@
+import threading
+import time
+
+from jobs import CANCELLED, FAILED, FINISHED, QUEUED, RUNNING, SUCCEEDED, TIMED_OUT, JobQueue, QueueFull
+
+# Camera job queue: arrival order, timeouts, cancellation and a full queue.
+# Run from pi_code: python jobs_test.py (or pytest jobs_test.py)
+
+# === CONFIG ===
+WAIT = 5.0  # seconds any single step may take before the test fails
+
+
+def camera_loop(job):
+    """A handler like the scan loop: polls should_stop() and gives up with None."""
+    while not job.should_stop():
+        if job.params.get("done") is not None and job.params["done"].is_set():
+            return {"message": "Payment OK"}, 200
+        time.sleep(0.01)
+    return None
+
+
+def wait_finished(queue, job):
+    deadline = time.monotonic() + WAIT
+    while job.status not in FINISHED:
+        assert time.monotonic() < deadline, f"job still {job.status}"
+        queue.wait(job, job.version, 0.1)
+    return job
+
+
+def wait_status(job, status):
+    deadline = time.monotonic() + WAIT
+    while job.status != status:
+        assert time.monotonic() < deadline, f"job still {job.status}"
+        time.sleep(0.01)
+
+
+def test_jobs_run_in_arrival_order():
+    order = []
+    queue = JobQueue(lambda job: order.append(job.params["n"]) or ({"n": job.params["n"]}, 200))
+    jobs = [queue.submit("scan", {"n": n}) for n in range(4)]
+    for job in jobs:
+        wait_finished(queue, job)
+    assert order == [0, 1, 2, 3]
+    assert [job.status for job in jobs] == [SUCCEEDED] * 4
+    assert queue.describe(jobs[0])["result"] == {"n": 0}
+
+
+def test_job_times_out():
+    queue = JobQueue(camera_loop, job_timeout=0.2)
+    job = wait_finished(queue, queue.submit("scan"))
+    assert (job.status, job.http_status) == (TIMED_OUT, 504)
+    assert job.finished - job.started >= 0.2
+
+    # The next job gets the camera (and its own full timeout)
+    done = threading.Event()
+    done.set()
+    assert wait_finished(queue, queue.submit("scan", {"done": done})).status == SUCCEEDED
+
+
+def test_cancel_running_and_queued_jobs():
+    queue = JobQueue(camera_loop, job_timeout=WAIT * 2)
+    running, queued = queue.submit("scan"), queue.submit("register")
+    wait_status(running, RUNNING)
+    assert queue.describe(queued)["queue_position"] == 0
+
+    assert queue.cancel(queued) == CANCELLED  # never started: cancelled at once
+    assert (queued.status, queued.http_status, queued.started) == (CANCELLED, 499, None)
+
+    assert queue.cancel(running) == RUNNING  # stops at the camera loop's next check
+    assert wait_finished(queue, running).status == CANCELLED
+    assert running.result == {"error": "Cancelled"}
+
+
+def test_result_after_cancel_is_kept():
+    release = threading.Event()
+
+    def forward_payment(job):
+        release.wait(WAIT)  # the payment is already on its way to the main server
+        return {"message": "Payment OK"}, 200
+
+    queue = JobQueue(forward_payment)
+    job = queue.submit("scan")
+    wait_status(job, RUNNING)
+    queue.cancel(job)
+    release.set()
+    assert wait_finished(queue, job).status == SUCCEEDED
+
+
+def test_handler_error_and_rejected_payment():
+    outcomes = iter([RuntimeError("camera unplugged"), ({"error": "Palm not recognised"}, 404)])
+
+    def handler(job):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    queue = JobQueue(handler)
+    crashed, rejected = queue.submit("scan"), queue.submit("scan")
+    assert (wait_finished(queue, crashed).status, crashed.http_status) == (FAILED, 500)
+    assert "camera unplugged" in crashed.result["error"]
+    assert (wait_finished(queue, rejected).status, rejected.http_status) == (FAILED, 404)
+
+
+def test_full_queue_rejects_new_jobs():
+    release = threading.Event()
+    queue = JobQueue(lambda job: release.wait(WAIT) and ({}, 200), max_queued=2)
+    first = queue.submit("scan")
+    wait_status(first, RUNNING)
+    waiting = [queue.submit("scan"), queue.submit("scan")]
+    try:
+        queue.submit("scan")
+    except QueueFull:
+        pass
+    else:
+        raise AssertionError("expected QueueFull")
+    assert all(job.status == QUEUED for job in waiting)
+    release.set()
+    for job in [first] + waiting:
+        assert wait_finished(queue, job).status == SUCCEEDED
+
+
+if __name__ == "__main__":
+    test_jobs_run_in_arrival_order()
+    test_job_times_out()
+    test_cancel_running_and_queued_jobs()
+    test_result_after_cancel_is_kept()
+    test_handler_error_and_rejected_payment()
+    test_full_queue_rejects_new_jobs()
+    print("✅ Camera jobs run in order, time out and cancel")
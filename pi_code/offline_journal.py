@@ -0,0 +1,201 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import requests
+
+# === CONFIG ===
+OFFLINE_JOURNAL = os.getenv("OFFLINE_JOURNAL", "offline_payments.sqlite")
+FLUSH_INTERVAL = 1.0            # seconds between flush rounds while the main server is reachable
+FLUSH_BATCH_SIZE = 20           # entries forwarded per round, oldest first
+RETRY_BACKOFF = 2.0             # seconds before retrying after a failed round, doubled each time
+RETRY_BACKOFF_MAX = 60.0
+DELIVERED_RETENTION = 24 * 3600  # seconds a delivered or rejected entry is kept before pruning
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE NOT NULL,
+    path TEXT NOT NULL,
+    data TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    image BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    key TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    http_status INTEGER,
+    body TEXT,
+    finished REAL NOT NULL
+);
+"""
+
+
+class OfflineJournal:
+    """
+    Store-and-forward journal for payments, for when the main server is slow or down.
+
+    record() inserts the captured payment (its form fields and encoded palm) into a
+    local SQLite database in WAL mode and returns once the row is durable, so the
+    checkout is acknowledged at local-disk latency with a provisional result. A
+    flusher thread forwards pending entries oldest first, up to batch_size per round,
+    each with its Idempotency-Key: if an earlier attempt reached the server but the
+    reply was lost, the retry is answered from the server's idempotency cache instead
+    of charging the customer twice.
+
+    Entries are only ever inserted. A final outcome (delivered, or rejected with a 4xx)
+    goes into a separate table; connection errors, timeouts and 5xx/429 replies are
+    retried with exponential backoff and stop the round, so payments reach the server
+    in the order they were taken. Finished entries are pruned after `retention`.
+
+    send(path, data=..., files=..., headers=...) posts to the main server and returns the
+    response; MainServerClient.post fits.
+    """
+
+    def __init__(self, send, path=OFFLINE_JOURNAL, flush_interval=FLUSH_INTERVAL, batch_size=FLUSH_BATCH_SIZE,
+                 backoff=RETRY_BACKOFF, backoff_max=RETRY_BACKOFF_MAX, retention=DELIVERED_RETENTION):
+        self.send = send
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.retention = retention
+        self._lock = threading.Lock()        # one connection shared across threads
+        self._flush_lock = threading.Lock()  # one flush at a time, so an entry is never sent twice at once
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._counters = {"recorded": 0, "delivered": 0, "rejected": 0, "failed_attempts": 0}
+        self._last_error = None
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")  # WAL is only fsynced per commit with FULL
+        self.conn.executescript(SCHEMA)
+        pending = self.stats()["pending"]
+        if pending:
+            print(f"[Pi-Sub-Server] {pending} journalled payments waiting to be forwarded from {path}")
+        self._flusher = threading.Thread(target=self._flush_loop, name="journal-flusher", daemon=True)
+        self._flusher.start()
+
+    def record(self, path, data, files):
+        """Durably journals one upload (files holds a single 'image') and returns its idempotency key."""
+        filename, payload, content_type = files["image"]
+        key = uuid.uuid4().hex
+        row = (key, path, json.dumps(data), filename, content_type, bytes(payload), time.time())
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO entries (key, path, data, filename, content_type, image, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+            self._counters["recorded"] += 1
+        return key  # the flusher picks it up within flush_interval, or once its backoff ends
+
+    def stats(self):
+        """Queue depth, the age of the oldest pending entry (lag) and delivery counters."""
+        with self._lock:
+            pending, oldest = self.conn.execute(
+                "SELECT COUNT(*), MIN(e.created) FROM entries e "
+                "LEFT JOIN outcomes o ON o.key = e.key WHERE o.key IS NULL").fetchone()
+            return dict(self._counters, pending=pending,
+                        lag_seconds=round(time.time() - oldest, 3) if oldest else 0.0,
+                        last_error=self._last_error)
+
+    def rejected(self, limit=20):
+        """Most recent entries the server refused: payments that were acknowledged provisionally but failed."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT o.key, e.data, e.created, o.http_status, o.body FROM outcomes o "
+                "JOIN entries e ON e.key = o.key WHERE o.status = 'rejected' "
+                "ORDER BY o.finished DESC LIMIT ?", (limit,)).fetchall()
+        return [{"idempotency_key": key, "data": json.loads(data), "created": created,
+                 "http_status": http_status, "response": body}
+                for key, data, created, http_status, body in rows]
+
+    def prometheus(self, process):
+        """Queue depth and lag as Prometheus gauges, to append to the /metrics body."""
+        stats = self.stats()
+        lines = []
+        for name, help_text, value in (
+                ("paypalm_journal_pending", "Payments journalled but not yet forwarded.", stats["pending"]),
+                ("paypalm_journal_lag_seconds", "Age of the oldest unforwarded payment.", stats["lag_seconds"])):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f'{name}{{process="{process}"}} {value}']
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """
+        Forwards pending entries, oldest first, up to batch_size of them.
+        Returns False if the round stopped on a retryable failure.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT e.key, e.path, e.data, e.filename, e.content_type, e.image FROM entries e "
+                    "LEFT JOIN outcomes o ON o.key = e.key WHERE o.key IS NULL "
+                    "ORDER BY e.seq LIMIT ?", (self.batch_size,)).fetchall()
+            for key, path, data, filename, content_type, image in rows:
+                try:
+                    response = self.send(path, data=json.loads(data), files={"image": (filename, image, content_type)},
+                                         headers={IDEMPOTENCY_HEADER: key})
+                except requests.RequestException as e:
+                    return self._failed(f"{type(e).__name__}: {e}")
+                # 409: the server is still processing an earlier send of this entry
+                if response.status_code >= 500 or response.status_code in (409, 429):
+                    return self._failed(f"{path} answered {response.status_code}")
+                self._finish(key, response)
+            return True
+
+    def close(self):
+        """Stops the flusher after a final flush attempt."""
+        self._stop_event.set()
+        self._wake.set()
+        self._flusher.join()
+        self.flush()
+        with self._lock:
+            self.conn.close()
+
+    # === FLUSHER ===
+    def _finish(self, key, response):
+        status = "delivered" if response.status_code < 400 else "rejected"
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?, ?)",
+                              (key, status, response.status_code, response.text, time.time()))
+            self._counters[status] += 1
+        if status == "rejected":
+            print(f"[Pi-Sub-Server] ❌ Journalled payment {key} rejected with {response.status_code}: {response.text}")
+
+    def _failed(self, error):
+        with self._lock:
+            self._counters["failed_attempts"] += 1
+            self._last_error = error
+        print(f"[Pi-Sub-Server] Journal flush deferred: {error}")
+        return False
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM entries WHERE key IN (SELECT key FROM outcomes WHERE finished < ?)", (cutoff,))
+            self.conn.execute("DELETE FROM outcomes WHERE finished < ?", (cutoff,))
+
+    def _flush_loop(self):
+        delay = self.flush_interval
+        while not self._stop_event.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._stop_event.is_set():
+                return
+            try:
+                ok = self.flush()
+                self._prune()
+            except Exception as e:
+                ok = self._failed(str(e))
+            if not ok:
+                delay = min(max(delay * 2, self.backoff), self.backoff_max)
+            elif self.stats()["pending"]:
+                delay = 0  # more than one batch waiting, carry straight on
+            else:
+                delay = self.flush_interval
@@ -0,0 +1,131 @@
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import requests
+
+# The main server is started in-process from its own directory (on the fake Firestore)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "processing_server"))
+
+import load_test
+from http_client import MainServerClient, payment_form
+from idempotency import transaction_id_for
+from offline_journal import OfflineJournal
+
+# Checks that a payment journalled on the Pi is forwarded by the flusher and accepted by the
+# main server, so a provisional "pending confirmation" answer really ends in a transaction,
+# and how the journal handles retryable and final failures.
+# Run from pi_code: python offline_journal_test.py (or pytest offline_journal_test.py)
+
+
+# === CONFIG ===
+IMAGE = {"image": ("palm.jpg", b"\xff\xd8 palm", "image/jpeg")}
+
+
+def open_journal(send, path=None, **kwargs):
+    path = path or os.path.join(tempfile.mkdtemp(), "offline_payments.sqlite")
+    return OfflineJournal(send, path=path, flush_interval=3600, **kwargs)  # flushed by hand below
+
+
+class ScriptedServer:
+    """send() stand-in answering with the given status codes (or raising them) in turn, then 200."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.sent = []  # (amount, idempotency key) per attempt
+
+    def __call__(self, path, data, files, headers):
+        self.sent.append((data["amount"], headers["Idempotency-Key"]))
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(status_code=outcome, text=f'{{"status": {outcome}}}')
+
+
+def record(journal, amount):
+    return journal.record("/scanPalm", {"amount": amount}, IMAGE)
+
+
+def test_journalled_payment_is_accepted_by_the_server():
+    base_url, db = load_test.start_local_server()
+    import pc_image_receiver as server
+
+    images = load_test.load_images()[:1]
+    uid = load_test.enrol(base_url, images, db)[0]
+    name, image = images[0]
+
+    journal = open_journal(MainServerClient(base_url).post)
+    data = dict(payment_form("Tesco", "12.50"), captured_at=str(time.time()))
+    key = journal.record("/scanPalm", data, {"image": (name, image, "image/jpeg")})
+
+    assert journal.flush()
+    stats = journal.stats()
+    assert (stats["delivered"], stats["rejected"], stats["pending"]) == (1, 0, 0), stats
+    assert journal.rejected() == []
+
+    server.transaction_store.flush()
+    txn = server.transaction_store.backend.transactions[transaction_id_for(key)]
+    assert txn["user_id"] == uid
+    assert txn["data"]["merchant"] == "Tesco"
+    assert txn["data"]["amount"] == 12.5
+    journal.close()
+
+
+def test_retryable_failures_keep_the_order():
+    server = ScriptedServer(503, requests.ConnectionError("no route"), 409, 429)
+    journal = open_journal(server)
+    first, second = record(journal, "1.00"), record(journal, "2.00")
+
+    for _ in range(4):  # each failure stops the round before the second payment is tried
+        assert not journal.flush()
+    assert journal.stats()["pending"] == 2 and journal.stats()["failed_attempts"] == 4
+    assert journal.flush()
+    # The same key on every attempt, and the second payment only after the first got through
+    assert server.sent == [("1.00", first)] * 5 + [("2.00", second)]
+    assert journal.stats()["delivered"] == 2
+    journal.close()
+
+
+def test_rejected_payment_does_not_block_the_next():
+    server = ScriptedServer(404)
+    journal = open_journal(server)
+    refused, accepted = record(journal, "1.00"), record(journal, "2.00")
+    assert journal.flush()
+
+    stats = journal.stats()
+    assert (stats["delivered"], stats["rejected"], stats["pending"]) == (1, 1, 0)
+    [entry] = journal.rejected()
+    assert (entry["idempotency_key"], entry["http_status"], entry["data"]) == (refused, 404, {"amount": "1.00"})
+    assert [key for _, key in server.sent] == [refused, accepted]
+    journal.close()
+
+
+def test_pending_payments_survive_a_restart_and_finished_ones_are_pruned():
+    journal = open_journal(ScriptedServer(), retention=0)
+    delivered = record(journal, "1.00")
+    assert journal.flush()
+    journal.send = ScriptedServer(503)
+    waiting = record(journal, "2.00")
+    assert not journal.flush()
+    journal._prune()  # the delivered entry is past its retention, the pending one stays
+
+    # Reopened without close(), as if the Pi lost power before the final flush
+    server = ScriptedServer()
+    journal = open_journal(server, journal.path)
+    assert journal.stats()["pending"] == 1
+    assert journal.flush() and server.sent == [("2.00", waiting)]
+    with journal._lock:
+        keys = [key for (key,) in journal.conn.execute("SELECT key FROM entries")]
+    assert keys == [waiting] and delivered not in keys
+    journal.close()
+
+
+if __name__ == "__main__":
+    test_journalled_payment_is_accepted_by_the_server()
+    print("✅ Journalled payment accepted by the main server")
+    test_retryable_failures_keep_the_order()
+    test_rejected_payment_does_not_block_the_next()
+    test_pending_payments_survive_a_restart_and_finished_ones_are_pruned()
+    print("✅ Journal retries in order, records rejections and prunes finished payments")
@@ -0,0 +1,288 @@
+import os
+import threading
+from collections import namedtuple
+import cv2
+import numpy as np
+
+# === CONFIG ===
+INPUT_SIZE = 192
+NUM_KEYPOINTS = 7
+ANCHOR_STRIDES = (8, 16, 16, 16)  # MediaPipe palm detection SSD anchor layers
+SCORE_THRESHOLD = 0.5
+NMS_THRESHOLD = 0.3
+RAW_SCORE_CLIP = 100.0
+MAX_CANDIDATES = 100  # highest-scoring anchors kept for NMS; a frame never holds more palms than this
+
+# Runtime session options; prepare_model.py builds the int8 variant and the optimised graphs
+MODEL_PATH = "palm_detection_mediapipe_2023feb.onnx"
+MODEL_VARIANT = os.getenv("PALM_MODEL_VARIANT", "fp32")           # fp32 or int8
+ORT_THREADS = int(os.getenv("PALM_ORT_THREADS", "4"))             # intra-op threads; the Pi has 4 cores
+ORT_EXECUTION_MODE = os.getenv("PALM_ORT_EXECUTION_MODE", "sequential")  # sequential or parallel
+ORT_MEMORY_ARENA = os.getenv("PALM_ORT_MEMORY_ARENA", "1") == "1"
+MODEL_VARIANTS = ("fp32", "int8")
+
+# Boxes are [x0, y0, x1, y1] and keypoints [x, y] in original image pixels; scores are probabilities
+Detections = namedtuple("Detections", ["boxes", "keypoints", "scores"])
+# Maps model-input coordinates back to the original image: original = normalised * scale - pad
+LetterboxTransform = namedtuple("LetterboxTransform", ["scale", "pad"])
+
+
+def generate_anchors(input_size=INPUT_SIZE, strides=ANCHOR_STRIDES):
+    """
+    Builds the 2016 fixed-size SSD anchor centres used by palm_detection_mediapipe.
+    Consecutive layers that share a stride share one feature map, with two anchors
+    per layer per cell, so 24x24x2 + 12x12x6 = 2016 anchors for a 192x192 input.
+    """
+    anchors = []
+    layer = 0
+    while layer < len(strides):
+        stride = strides[layer]
+        per_cell = 0
+        while layer < len(strides) and strides[layer] == stride:
+            per_cell += 2
+            layer += 1
+        cells = int(np.ceil(input_size / stride))
+        ys, xs = np.meshgrid(np.arange(cells), np.arange(cells), indexing="ij")
+        centres = np.stack([(xs + 0.5) / cells, (ys + 0.5) / cells], axis=-1).reshape(-1, 2)
+        anchors.append(np.repeat(centres, per_cell, axis=0))
+    return np.concatenate(anchors).astype(np.float32)
+
+
+ANCHORS = generate_anchors()
+
+
+# === PREPROCESSING ===
+def preprocess(image, input_size=INPUT_SIZE):
+    """
+    Letterboxes a BGR frame into the model's [1, 192, 192, 3] RGB float32 input.
+    Returns the tensor and the transform needed to map detections back.
+    """
+    h, w = image.shape[:2]
+    ratio = min(input_size / h, input_size / w)
+    new_w, new_h = int(w * ratio), int(h * ratio)
+    left, top = (input_size - new_w) // 2, (input_size - new_h) // 2
+    resized = cv2.resize(image, (new_w, new_h))
+    padded = cv2.copyMakeBorder(resized, top, input_size - new_h - top, left, input_size - new_w - left,
+                                cv2.BORDER_CONSTANT, value=(0, 0, 0))
+    rgb = cv2.cvtColor(padded, cv2.COLOR_BGR2RGB)
+    tensor = (rgb.astype(np.float32) / 255.0)[np.newaxis]
+    return tensor, letterbox_transform(w, h, input_size)
+
+
+def letterbox_transform(width, height, input_size=INPUT_SIZE):
+    ratio = min(input_size / height, input_size / width)
+    left = (input_size - int(width * ratio)) // 2
+    top = (input_size - int(height * ratio)) // 2
+    return LetterboxTransform(input_size / ratio, np.array([left, top], dtype=np.float32) / ratio)
+
+
+# === POSTPROCESSING ===
+def split_outputs(outputs):
+    """Picks the [N, 18] regressors and [N] raw scores out of the session outputs."""
+    regressors = raw_scores = None
+    for output in outputs:
+        if output.shape[-1] == 4 + 2 * NUM_KEYPOINTS:
+            regressors = output.reshape(-1, output.shape[-1])
+        elif output.shape[-1] == 1:
+            raw_scores = output.reshape(-1)
+    if regressors is None or raw_scores is None:
+        raise ValueError(f"Unexpected palm detector outputs: {[o.shape for o in outputs]}")
+    return regressors, raw_scores
+
+
+def decode(regressors, raw_scores, transform, score_threshold=SCORE_THRESHOLD,
+           anchors=ANCHORS, input_size=INPUT_SIZE):
+    """
+    Applies the sigmoid and anchor offsets to every anchor at once and keeps the
+    candidates above score_threshold. Returns unsuppressed Detections.
+    """
+    # Threshold on logits so the sigmoid only runs on the few surviving candidates
+    logit_threshold = np.log(score_threshold / (1.0 - score_threshold))
+    keep = np.flatnonzero(raw_scores > logit_threshold)
+    if keep.size > MAX_CANDIDATES:
+        keep = keep[np.argpartition(-raw_scores[keep], MAX_CANDIDATES - 1)[:MAX_CANDIDATES]]
+    if keep.size == 0:
+        return Detections(np.empty((0, 4), np.float32), np.empty((0, NUM_KEYPOINTS, 2), np.float32),
+                          np.empty(0, np.float32))
+
+    scores = 1.0 / (1.0 + np.exp(-np.clip(raw_scores[keep], -RAW_SCORE_CLIP, RAW_SCORE_CLIP)))
+    deltas = regressors[keep] / input_size
+    centres = anchors[keep]
+
+    cxy = deltas[:, 0:2] + centres
+    half_wh = deltas[:, 2:4] / 2
+    boxes = np.concatenate([cxy - half_wh, cxy + half_wh], axis=1) * transform.scale - np.tile(transform.pad, 2)
+    keypoints = ((deltas[:, 4:].reshape(-1, NUM_KEYPOINTS, 2) + centres[:, None, :]) * transform.scale
+                 - transform.pad)
+    return Detections(boxes.astype(np.float32), keypoints.astype(np.float32), scores.astype(np.float32))
+
+
+def weighted_nms(detections, iou_threshold=NMS_THRESHOLD):
+    """
+    MediaPipe-style weighted non-maximum suppression.
+    Each kept detection is the score-weighted average of every candidate it
+    suppresses, which is steadier frame to frame than plain NMS.
+    """
+    boxes, keypoints, scores = detections
+    if len(scores) <= 1:
+        return detections
+
+    order = np.argsort(-scores)
+    boxes, keypoints, scores = boxes[order], keypoints[order], scores[order]
+
+    remaining = np.ones(len(scores), dtype=bool)
+    out_boxes, out_keypoints, out_scores = [], [], []
+    while remaining.any():
+        top = np.argmax(remaining)  # highest-scoring candidate still remaining
+        cluster = remaining & (box_iou(boxes[top:top + 1], boxes)[0] > iou_threshold)
+        cluster[top] = True
+        weights = scores[cluster] / scores[cluster].sum()
+        out_boxes.append(weights @ boxes[cluster])
+        out_keypoints.append(np.tensordot(weights, keypoints[cluster], axes=1))
+        out_scores.append(scores[top])
+        remaining &= ~cluster
+
+    return Detections(np.array(out_boxes, np.float32), np.array(out_keypoints, np.float32),
+                      np.array(out_scores, np.float32))
+
+
+def box_iou(a, b):
+    """Pairwise IoU between [N, 4] and [M, 4] boxes."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def clip_boxes(detections, width, height):
+    """
+    Clamps boxes to a width x height frame. A palm at the edge of the frame decodes to a
+    box reaching past it (or, for a barely visible hand, to a box entirely outside it).
+    """
+    boxes = detections.boxes.copy()
+    np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+    return detections._replace(boxes=boxes)
+
+
+def postprocess(outputs, transform, score_threshold=SCORE_THRESHOLD, iou_threshold=NMS_THRESHOLD,
+                frame_size=None):
+    """
+    Full post-processing for one frame: decode all anchors, then weighted NMS. Best detection first.
+    With frame_size (width, height), boxes are clamped to the frame.
+    """
+    regressors, raw_scores = split_outputs(outputs)
+    detections = weighted_nms(decode(regressors, raw_scores, transform, score_threshold), iou_threshold)
+    if frame_size is not None:
+        detections = clip_boxes(detections, *frame_size)
+    return detections
+
+
+# === SESSIONS ===
+def variant_path(model_path, variant):
+    """File of a model variant: the original for fp32, <name>.int8.onnx for the quantized build."""
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown palm model variant: {variant}")
+    if variant == "fp32":
+        return model_path
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{variant}{ext}"
+
+
+def optimized_model_path(model_path):
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.opt{ext}"
+
+
+def session_options(threads=ORT_THREADS, execution_mode=ORT_EXECUTION_MODE, memory_arena=ORT_MEMORY_ARENA):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1 if execution_mode == "sequential" else threads
+    options.execution_mode = (ort.ExecutionMode.ORT_SEQUENTIAL if execution_mode == "sequential"
+                              else ort.ExecutionMode.ORT_PARALLEL)
+    # The input shape never changes, so the arena and memory pattern let every run reuse one allocation plan
+    options.enable_cpu_mem_arena = memory_arena
+    options.enable_mem_pattern = memory_arena
+    return options
+
+
+def create_session(model_path=MODEL_PATH, variant=MODEL_VARIANT, threads=ORT_THREADS,
+                   execution_mode=ORT_EXECUTION_MODE, memory_arena=ORT_MEMORY_ARENA):
+    """
+    Creates the detector session for a model variant. When prepare_model.py has saved
+    an offline-optimised graph newer than the model, it is loaded with graph
+    optimisation off, so start-up skips the optimisation passes.
+    """
+    import onnxruntime as ort
+
+    path = variant_path(model_path, variant)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; run prepare_model.py to build the {variant} variant")
+    options = session_options(threads, execution_mode, memory_arena)
+    optimized_path = optimized_model_path(path)
+    if os.path.exists(optimized_path) and os.path.getmtime(optimized_path) >= os.path.getmtime(path):
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        path = optimized_path
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+# === DETECTOR ===
+class PalmDetector:
+    """
+    Runs the palm detector without per-frame allocations.
+    The letterbox canvas and the [1, 192, 192, 3] float32 input tensor are allocated
+    once and bound to the session with IOBinding, so each frame is resized and
+    normalised in place and the outputs land in preallocated arrays.
+    """
+
+    def __init__(self, session, input_size=INPUT_SIZE):
+        self.session = session
+        self.input_size = input_size
+        self.input_tensor = np.zeros((1, input_size, input_size, 3), dtype=np.float32)
+        self._canvas = np.zeros((input_size, input_size, 3), dtype=np.uint8)
+        self._resized = None
+        self._roi = None
+        self._frame_shape = None
+        self._transform = None
+        self._lock = threading.Lock()  # the buffers above are shared by every caller
+
+        self._binding = session.io_binding()
+        self._binding.bind_cpu_input(session.get_inputs()[0].name, self.input_tensor)
+        self._outputs = []
+        for output in session.get_outputs():
+            shape = [dim if isinstance(dim, int) else 1 for dim in output.shape]
+            array = np.empty(shape, dtype=np.float32)
+            self._binding.bind_output(output.name, "cpu", 0, np.float32, array.shape, array.ctypes.data)
+            self._outputs.append(array)
+
+    def _prepare(self, image):
+        """Letterboxes a BGR frame into the bound input tensor."""
+        h, w = image.shape[:2]
+        if self._frame_shape != (h, w):
+            # New frame size: recompute the layout and the buffers that depend on it
+            self._frame_shape = (h, w)
+            self._transform = letterbox_transform(w, h, self.input_size)
+            ratio = min(self.input_size / h, self.input_size / w)
+            new_w, new_h = int(w * ratio), int(h * ratio)
+            left, top = (self.input_size - new_w) // 2, (self.input_size - new_h) // 2
+            self._resized = np.empty((new_h, new_w, 3), dtype=np.uint8)
+            self._canvas[:] = 0
+            self._roi = self._canvas[top:top + new_h, left:left + new_w]
+
+        cv2.resize(image[:, :, :3], self._resized.shape[1::-1], dst=self._resized)
+        self._roi[:] = self._resized
+        # BGR -> RGB via a reversed view and /255 straight into the bound tensor
+        np.multiply(self._canvas[:, :, ::-1], np.float32(1 / 255.0), out=self.input_tensor[0])
+        return self._transform
+
+    def detect(self, image, score_threshold=SCORE_THRESHOLD, iou_threshold=NMS_THRESHOLD):
+        """Detects palms in a BGR frame. Returns Detections in frame pixel coordinates, best first."""
+        h, w = image.shape[:2]
+        with self._lock:
+            transform = self._prepare(image)
+            self.session.run_with_iobinding(self._binding)
+            return postprocess(self._outputs, transform, score_threshold, iou_threshold, frame_size=(w, h))
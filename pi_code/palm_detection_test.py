@@ -0,0 +1,107 @@
+import numpy as np
+
+import palm_detection
+from palm_detection import Detections, box_iou, clip_boxes, decode, letterbox_transform, weighted_nms
+
+# Anchor layout, decoding of raw model outputs and weighted NMS, on synthetic outputs
+# (no model file needed).
+# Run from pi_code: python palm_detection_test.py (or pytest palm_detection_test.py)
+
+# === CONFIG ===
+N_ANCHORS = 2016
+HIGH, LOW = 8.0, -8.0  # raw score logits well above / below the threshold
+
+
+def raw_outputs():
+    """All-zero regressors and scores far below the threshold, like an empty frame."""
+    regressors = np.zeros((N_ANCHORS, 4 + 2 * palm_detection.NUM_KEYPOINTS), np.float32)
+    return regressors, np.full(N_ANCHORS, LOW, np.float32)
+
+
+def detections(boxes, scores):
+    boxes = np.asarray(boxes, np.float32)
+    keypoints = np.repeat(boxes[:, None, :2], palm_detection.NUM_KEYPOINTS, axis=1)
+    return Detections(boxes, keypoints, np.asarray(scores, np.float32))
+
+
+def test_anchor_layout():
+    anchors = palm_detection.ANCHORS
+    assert anchors.shape == (N_ANCHORS, 2)
+    # Stride 8: 24x24 cells, 2 anchors each; then stride 16: 12x12 cells, 6 anchors each
+    assert np.allclose(anchors[0], anchors[1]) and np.allclose(anchors[0], [0.5 / 24, 0.5 / 24])
+    assert np.allclose(anchors[2], [1.5 / 24, 0.5 / 24])
+    assert np.allclose(anchors[24 * 24 * 2:24 * 24 * 2 + 6], [0.5 / 12, 0.5 / 12])
+    assert anchors.min() > 0 and anchors.max() < 1
+
+
+def test_letterbox_maps_back_to_the_frame():
+    transform = letterbox_transform(640, 480)  # 192x144 image with 24 px bands above and below
+    centre = np.array([0.5, 0.5]) * transform.scale - transform.pad
+    corner = np.array([0.0, 24 / 192]) * transform.scale - transform.pad
+    assert np.allclose(centre, [320, 240]) and np.allclose(corner, [0, 0])
+
+
+def test_decode_applies_anchor_offsets():
+    regressors, raw_scores = raw_outputs()
+    anchor = 24 * 24 * 2 + 6 * 50  # one stride-16 anchor
+    regressors[anchor, :4] = [12, -6, 48, 24]  # centre offset and size, in model-input pixels
+    regressors[anchor, 4:6] = [-10, 0]         # first keypoint, relative to the anchor
+    raw_scores[anchor] = HIGH
+
+    found = decode(regressors, raw_scores, letterbox_transform(192, 192))
+    assert len(found.scores) == 1 and found.scores[0] > 0.99
+    cx, cy = palm_detection.ANCHORS[anchor] * 192 + [12, -6]
+    assert np.allclose(found.boxes[0], [cx - 24, cy - 12, cx + 24, cy + 12], atol=1e-3)
+    assert np.allclose(found.keypoints[0, 0], palm_detection.ANCHORS[anchor] * 192 + [-10, 0], atol=1e-3)
+
+
+def test_decode_threshold_and_candidate_cap():
+    regressors, raw_scores = raw_outputs()
+    assert len(decode(regressors, raw_scores, letterbox_transform(192, 192)).scores) == 0
+
+    raw_scores[:] = np.linspace(-1, 1, N_ANCHORS)  # half the anchors above 0.5
+    found = decode(regressors, raw_scores, letterbox_transform(192, 192), score_threshold=0.5)
+    assert len(found.scores) == palm_detection.MAX_CANDIDATES
+    assert found.scores.min() >= 1 / (1 + np.exp(-raw_scores[-palm_detection.MAX_CANDIDATES])) - 1e-6
+
+
+def test_weighted_nms_merges_overlapping_boxes():
+    found = weighted_nms(detections([[0, 0, 100, 100], [10, 0, 110, 100], [300, 300, 350, 350]],
+                                    [0.6, 0.9, 0.8]))
+    assert list(found.scores) == [np.float32(0.9), np.float32(0.8)]  # best first, one per palm
+    # The merged box is the score-weighted average of the overlapping pair
+    assert np.allclose(found.boxes[0], [6, 0, 106, 100])
+    assert np.allclose(found.boxes[1], [300, 300, 350, 350])
+    assert found.keypoints.shape == (2, palm_detection.NUM_KEYPOINTS, 2)
+
+
+def test_box_iou_and_clip():
+    iou = box_iou(np.array([[0, 0, 10, 10]], np.float32), np.array([[0, 0, 10, 10], [5, 0, 15, 10],
+                                                                     [20, 20, 30, 30]], np.float32))
+    assert np.allclose(iou, [[1, 1 / 3, 0]])
+
+    clipped = clip_boxes(detections([[-20, -5, 700, 400], [650, 500, 700, 560]], [0.9, 0.8]), 640, 480)
+    assert np.array_equal(clipped.boxes, [[0, 0, 640, 400], [640, 480, 640, 480]])
+
+
+def test_split_outputs_rejects_unknown_shapes():
+    regressors, raw_scores = raw_outputs()
+    got = palm_detection.split_outputs([raw_scores.reshape(1, -1, 1), regressors[None]])
+    assert got[0].shape == regressors.shape and got[1].shape == raw_scores.shape
+    try:
+        palm_detection.split_outputs([regressors[None]])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+if __name__ == "__main__":
+    test_anchor_layout()
+    test_letterbox_maps_back_to_the_frame()
+    test_decode_applies_anchor_offsets()
+    test_decode_threshold_and_candidate_cap()
+    test_weighted_nms_merges_overlapping_boxes()
+    test_box_iou_and_clip()
+    test_split_outputs_rejects_unknown_shapes()
+    print("✅ Palm detector anchors, decoding and NMS")
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# === CONFIG ===
+HASH_SIZE = 8            # 8x8 difference hash -> 64 bits
+DEDUP_WINDOW = 10.0      # seconds a frame stays in the recent index
+DEDUP_MAX_DISTANCE = 8   # Hamming distance at or below which two frames count as the same
+DEDUP_CAPACITY = 64      # recent frames kept
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    64-bit difference hash of a BGR or grayscale image: shrink to (hash_size+1) x hash_size
+    and record whether each pixel is brighter than its right-hand neighbour.
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distances(hashes, value):
+    """Hamming distance from value to every hash in a uint64 array, without a Python loop."""
+    diff = hashes ^ np.uint64(value)
+    return _POPCOUNT[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class RecentHashes:
+    """
+    Small time-windowed index of recent frame hashes. is_duplicate() tells whether a
+    frame within `max_distance` bits was added in the last `window` seconds, so the
+    capture loop can skip uploading it. It only ever suppresses an upload; nothing
+    computed for one frame is handed to another.
+    """
+
+    def __init__(self, window=DEDUP_WINDOW, max_distance=DEDUP_MAX_DISTANCE, capacity=DEDUP_CAPACITY):
+        self.window = window
+        self.max_distance = max_distance
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._times = np.full(capacity, -np.inf)
+        self._next = 0
+        self._lock = threading.Lock()
+        self._counters = {"duplicates": 0, "unique": 0}
+
+    def is_duplicate(self, value_hash, now=None):
+        """Whether a recent frame is within max_distance bits of value_hash."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            distances = hamming_distances(self._hashes, value_hash)
+            distances[self._times < now - self.window] = 255  # expired slots never match
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                self._counters["unique"] += 1
+                return False
+            self._counters["duplicates"] += 1
+            return True
+
+    def add(self, value_hash, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slot = self._next
+            self._hashes[slot] = value_hash
+            self._times[slot] = now
+            self._next = (slot + 1) % len(self._hashes)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
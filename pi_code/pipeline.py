@@ -0,0 +1,141 @@
+import threading
+import time
+
+# === CONFIG ===
+GET_TIMEOUT = 0.5  # seconds a stage waits for input before checking whether it should stop
+SOURCE_ERROR_BACKOFF = 0.5  # seconds a stage waits after its source (the camera) raised
+
+
+class LatestSlot:
+    """
+    Single-slot buffer between two stages. put() replaces whatever is still waiting,
+    so a slow consumer always gets the newest item and a fast producer never blocks;
+    replaced items are counted as dropped.
+    """
+
+    def __init__(self):
+        self._item = None
+        self._has_item = False
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._has_item:
+                self.dropped += 1
+            self._item, self._has_item = item, True
+            self._cond.notify()
+
+    def get(self, timeout=GET_TIMEOUT):
+        """The waiting item, or None if nothing arrived within timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._has_item, timeout):
+                return None
+            item, self._item, self._has_item = self._item, None, False
+            return item
+
+
+class Stage:
+    """
+    One pipeline stage on its own thread: takes the newest item from its inbox (or
+    calls source() when it has none), runs fn on it and puts a non-None result into
+    every outbox. Counts items and busy time, so PipelineStats can report throughput and
+    utilisation (the fraction of wall time spent in fn). An exception from source() or fn
+    is logged and counted, and the stage carries on.
+    """
+
+    def __init__(self, name, fn, inbox=None, outboxes=(), source=None):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outboxes = list(outboxes)
+        self.source = source
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._items = 0
+        self._busy = 0.0
+        self._errors = 0
+        self._thread = threading.Thread(target=self._run, name=f"pipeline-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                item = self.source() if self.inbox is None else self.inbox.get()
+            except Exception as e:
+                print(f"[Pipeline] {self.name} source failed: {e}")
+                with self._lock:
+                    self._errors += 1
+                self._stop_event.wait(SOURCE_ERROR_BACKOFF)  # a failing camera would otherwise spin
+                continue
+            if item is None:
+                if self.inbox is None:
+                    self._stop_event.wait(0.01)  # source exhausted or not ready; don't spin
+                continue
+            start = time.perf_counter()
+            try:
+                result = self.fn(item)
+            except Exception as e:
+                print(f"[Pipeline] {self.name} failed: {e}")
+                result = None
+                with self._lock:
+                    self._errors += 1
+            with self._lock:
+                self._items += 1
+                self._busy += time.perf_counter() - start
+            if result is not None:
+                for outbox in self.outboxes:
+                    outbox.put(result)
+
+    def record(self, seconds):
+        """Counts one item handled outside the stage's own thread (the main-thread preview)."""
+        with self._lock:
+            self._items += 1
+            self._busy += seconds
+
+    def take_counters(self):
+        """(items, busy seconds, frames dropped at the inbox, errors) since the last call."""
+        with self._lock:
+            items, busy, errors = self._items, self._busy, self._errors
+            self._items, self._busy, self._errors = 0, 0.0, 0
+        dropped = 0
+        if self.inbox is not None:
+            dropped, self.inbox.dropped = self.inbox.dropped, 0
+        return items, busy, dropped, errors
+
+
+class PipelineStats:
+    """Turns the stages' counters into per-interval FPS, utilisation and drop rates."""
+
+    def __init__(self, stages):
+        self.stages = stages
+        self._since = time.perf_counter()
+
+    def sample(self):
+        """{stage name: {"fps", "utilisation", "dropped_per_s", "errors"}} since the previous sample."""
+        now = time.perf_counter()
+        elapsed = max(now - self._since, 1e-9)
+        self._since = now
+        report = {}
+        for stage in self.stages:
+            items, busy, dropped, errors = stage.take_counters()
+            report[stage.name] = {"fps": round(items / elapsed, 1),
+                                  "utilisation": round(busy / elapsed, 3),
+                                  "dropped_per_s": round(dropped / elapsed, 1),
+                                  "errors": errors}
+        return report
+
+    @staticmethod
+    def format(report):
+        return " | ".join(f"{name} {s['fps']:.1f} fps {s['utilisation']:.0%} busy"
+                          + (f" ({s['dropped_per_s']:.1f}/s skipped)" if s["dropped_per_s"] else "")
+                          + (f" [{s['errors']} errors]" if s["errors"] else "")
+                          for name, s in report.items())
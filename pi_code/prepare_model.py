@@ -0,0 +1,111 @@
+import argparse
+import glob
+import os
+
+import cv2
+
+import palm_detection
+
+# === CONFIG ===
+UPLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
+CALIBRATION_AUGMENTS = ("original", "flip", "dark", "bright")  # widen the activation ranges seen in calibration
+
+
+class UploadsCalibrationReader:
+    """
+    Feeds letterboxed sample palms to the static quantizer, exactly as the detector
+    sees them at runtime, plus flipped and re-exposed copies.
+    """
+
+    def __init__(self, input_name, image_dir=UPLOADS_DIR):
+        self.input_name = input_name
+        paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))
+        if not paths:
+            raise SystemExit(f"No calibration images found in {image_dir}")
+        self._tensors = []
+        for path in paths:
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            for augment in CALIBRATION_AUGMENTS:
+                self._tensors.append(palm_detection.preprocess(augmented(image, augment))[0])
+        self._iter = iter(self._tensors)
+
+    def get_next(self):
+        tensor = next(self._iter, None)
+        return None if tensor is None else {self.input_name: tensor}
+
+    def rewind(self):
+        self._iter = iter(self._tensors)
+
+
+def augmented(image, augment):
+    if augment == "flip":
+        return cv2.flip(image, 1)
+    if augment == "dark":
+        return cv2.convertScaleAbs(image, alpha=0.6)
+    if augment == "bright":
+        return cv2.convertScaleAbs(image, alpha=1.3, beta=20)
+    return image
+
+
+def quantize(model_path, output_path, image_dir=UPLOADS_DIR, per_channel=True):
+    """Builds a static INT8 (QDQ) copy of the detector calibrated on image_dir."""
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepared_path = output_path + ".prep.onnx"
+    quant_pre_process(model_path, prepared_path, skip_symbolic_shape=True)
+    input_name = ort.InferenceSession(prepared_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    try:
+        quantize_static(
+            prepared_path,
+            output_path,
+            UploadsCalibrationReader(input_name, image_dir),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=per_channel,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    finally:
+        os.remove(prepared_path)
+
+
+def save_optimized(model_path):
+    """
+    Runs the graph optimisations once and saves the result where create_session
+    looks for it. EXTENDED rather than ALL: the saved graph must not carry
+    CPU-specific layout transforms, so it can be built off the Pi.
+    """
+    import onnxruntime as ort
+
+    options = palm_detection.session_options()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = palm_detection.optimized_model_path(model_path)
+    ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+    return options.optimized_model_filepath
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the int8 palm detector and the offline-optimised graphs.")
+    parser.add_argument("--model", default=palm_detection.MODEL_PATH, help="fp32 palm detection model.")
+    parser.add_argument("--calibration-dir", default=UPLOADS_DIR, help="Sample palm images for calibration.")
+    parser.add_argument("--per-tensor", action="store_true", help="Quantize weights per tensor instead of per channel.")
+    parser.add_argument("--skip-int8", action="store_true", help="Only save the optimised fp32 graph.")
+    args = parser.parse_args()
+
+    variants = ["fp32"] if args.skip_int8 else ["fp32", "int8"]
+    int8_path = palm_detection.variant_path(args.model, "int8")
+    if "int8" in variants:
+        print(f"[INFO] Quantizing {args.model} -> {int8_path} (calibration: {args.calibration_dir})")
+        quantize(args.model, int8_path, args.calibration_dir, per_channel=not args.per_tensor)
+    for variant in variants:
+        path = palm_detection.variant_path(args.model, variant)
+        print(f"[INFO] {variant}: {os.path.getsize(path) / 1e6:.2f} MB, optimised graph -> {save_optimized(path)}")
+    print("[INFO] Select the runtime variant with PALM_MODEL_VARIANT=fp32|int8; compare with bench_palm_model.py")
+
+
+if __name__ == "__main__":
+    main()
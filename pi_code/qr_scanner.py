@@ -0,0 +1,165 @@
+import contextvars
+import os
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from pyzbar.pyzbar import decode, ZBarSymbol
+
+# === CONFIG ===
+# Halvings of the frame tried before full resolution: 1 decodes 640x480 at 320x240
+QR_PYRAMID_LEVELS = int(os.getenv("QR_PYRAMID_LEVELS", "1"))
+# Frames without a code between full-resolution attempts (a code too small for the pyramid still
+# gets read, without paying for a full-size decode on every empty frame)
+QR_FULL_RES_INTERVAL = int(os.getenv("QR_FULL_RES_INTERVAL", "3"))
+QR_ROI_MARGIN = 0.5  # fraction of the code's size added on each side of a locked ROI
+QR_ROI_MISSES = 5    # frames the ROI may miss before the lock is dropped
+
+QRCode = namedtuple("QRCode", ["data", "polygon", "rect", "path"])  # polygon and rect in frame pixels
+
+
+def _decode(gray, scale=1.0, offset=(0, 0)):
+    """pyzbar on a grayscale image, QR symbols only, with results mapped back to frame pixels."""
+    found = []
+    for symbol in decode(gray, symbols=[ZBarSymbol.QRCODE]):
+        polygon = [(int(p.x * scale + offset[0]), int(p.y * scale + offset[1])) for p in symbol.polygon]
+        r = symbol.rect
+        rect = (int(r.left * scale + offset[0]), int(r.top * scale + offset[1]),
+                int(r.width * scale), int(r.height * scale))
+        found.append((symbol.data.decode("utf-8"), polygon, rect))
+    return found
+
+
+class QRDecoder:
+    """
+    Multi-resolution QR decoding for a stream of frames.
+    Each frame is converted to grayscale once, then tried, cheapest first:
+      1. roi     - the full-resolution region around the code found in a recent frame
+      2. pyramid - the whole frame halved QR_PYRAMID_LEVELS times (smallest first)
+      3. full    - the whole frame at full resolution, right away while a code was seen in
+                   the last few frames (it moved or is too small for the pyramid), otherwise
+                   every QR_FULL_RES_INTERVAL empty frames
+    A code found by any path locks the ROI for the following frames.
+    """
+
+    def __init__(self, levels=QR_PYRAMID_LEVELS, full_res_interval=QR_FULL_RES_INTERVAL,
+                 roi_margin=QR_ROI_MARGIN, roi_misses=QR_ROI_MISSES):
+        self.levels = levels
+        self.full_res_interval = max(full_res_interval, 1)
+        self.roi_margin = roi_margin
+        self.roi_misses = roi_misses
+        self.roi = None  # (x0, y0, x1, y1) in frame pixels
+        self._misses = 0
+        self._empty_frames = 0
+        self.counters = {"frames": 0, "roi": 0, "pyramid": 0, "full": 0, "miss": 0, "errors": 0}
+
+    def reset(self):
+        self.roi = None
+        self._misses = self._empty_frames = 0
+
+    def decode(self, image):
+        """QR codes in a BGR or grayscale frame, as QRCode tuples (empty if none)."""
+        self.counters["frames"] += 1
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+        locked = self.roi is not None
+        if locked:
+            x0, y0, x1, y1 = self.roi
+            found = _decode(gray[y0:y1, x0:x1], offset=(x0, y0))
+            if found:
+                return self._found(found, "roi", gray.shape)
+            self._misses += 1
+            if self._misses > self.roi_misses:
+                self.roi = None
+
+        pyramid = [gray]
+        for _ in range(self.levels):
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        for level in range(self.levels, 0, -1):
+            found = _decode(pyramid[level], scale=2 ** level)
+            if found:
+                return self._found(found, "pyramid", gray.shape)
+
+        self._empty_frames += 1
+        if locked or self.levels == 0 or self._empty_frames >= self.full_res_interval:
+            self._empty_frames = 0
+            found = _decode(gray)
+            if found:
+                return self._found(found, "full", gray.shape)
+        self.counters["miss"] += 1
+        return []
+
+    def _found(self, found, path, shape):
+        self.counters[path] += 1
+        self._misses = self._empty_frames = 0
+        x, y, w, h = found[0][2]
+        pad_x, pad_y = int(w * self.roi_margin), int(h * self.roi_margin)
+        self.roi = (max(x - pad_x, 0), max(y - pad_y, 0), min(x + w + pad_x, shape[1]), min(y + h + pad_y, shape[0]))
+        return [QRCode(data, polygon, rect, path) for data, polygon, rect in found]
+
+
+class QRScanWorker:
+    """
+    Decodes on its own thread with latest-frame semantics: submit() replaces any frame
+    still waiting, so the caller (the preview loop) never blocks on a decode and the
+    decoder always works on the newest frame. The thread runs in a copy of the
+    caller's context, so its qr_decode stages land in the caller's request trace.
+    A frame the decoder raises on is logged, counted in decoder.counters["errors"] and skipped.
+    """
+
+    def __init__(self, decoder, metrics):
+        self.decoder = decoder
+        self.metrics = metrics
+        self.codes = []     # last codes found; set once, then the worker stops
+        self.last_seen = []  # codes in the most recently decoded frame, for the preview overlay
+        self._pending = None
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,),
+                                        name="qr-decoder", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame):
+        with self._cond:
+            self._pending = frame
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or self._pending is not None)
+                if self._stopped:
+                    return
+                frame, self._pending = self._pending, None
+            try:
+                with self.metrics.stage("qr_decode"):
+                    codes = self.decoder.decode(frame.image)
+            except Exception as e:
+                print(f"[QR] Decode failed, skipping frame: {e}")
+                self.decoder.counters["errors"] += 1
+                self.decoder.reset()  # don't keep cropping to an ROI that may be the cause
+                continue
+            self.last_seen = codes
+            if codes:
+                self.codes = codes
+                return
+
+
+def draw_codes(image, codes):
+    """Outlines and labels decoded codes on a preview frame (in place)."""
+    for code in codes:
+        if len(code.polygon) == 4:
+            cv2.polylines(image, [np.array(code.polygon)], isClosed=True, color=(0, 255, 0), thickness=2)
+        cv2.putText(image, code.data, (code.rect[0], code.rect[1] - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 2)
@@ -1,188 +1,234 @@
 import os
-from flask import Flask, request, jsonify
+import threading
+import time
+from flask import Flask, Response, request, jsonify
 import requests
 import json
-import io
-import random
-import time
-from PIL import Image # For simulating image capture
-import cv2
-import numpy as np
-from pyzbar.pyzbar import decode
-from picamera2 import Picamera2
-import onnxruntime as ort
+from http_client import MainServerClient, payment_form
+from jobs import JobQueue, QueueFull, FINISHED
+from offline_journal import OfflineJournal
+from metrics import Metrics, REQUEST_ID_HEADER, CONTENT_TYPE, endpoint_label
 from flask_cors import CORS
 from dotenv import load_dotenv
 load_dotenv()
+# OpenCV, ONNX Runtime, pyzbar and picamera2 are imported by terminal.py on the startup
+# thread, so the HTTP server is up (and /ready answers) while they load
+
+MODULE_LOADED = time.perf_counter()
 
 # === Flask App Init ===
 app = Flask(__name__)
 CORS(app)
 
+# Per-stage latency histograms, served on /metrics. Each checkout is traced under an
+# X-Request-ID that is forwarded to the main server, so both logs can be joined.
+metrics = Metrics("Pi-Sub-Server")
+
+@app.before_request
+def begin_trace():
+    metrics.begin_request(request.headers.get(REQUEST_ID_HEADER))
+
+@app.after_request
+def finish_trace(response):
+    response.headers.update(metrics.finish_request(endpoint_label(request.url_rule), response.status_code))
+    return response
+
 # --- Configuration ---
 # URL of your main Flask server
 MAIN_SERVER_URL = "https://paypalm-server.onrender.com" # Assuming your main server runs on 8080
+# Set MAIN_SERVER_HTTP2=1 to multiplex over one HTTP/2 connection (needs httpx[http2])
+MAIN_SERVER_HTTP2 = os.getenv("MAIN_SERVER_HTTP2") == "1"
+
+# Pooled keep-alive connection to the main server, shared by all requests
+main_server = MainServerClient(MAIN_SERVER_URL, http2=MAIN_SERVER_HTTP2)
 
-# --- Raspberry Pi Specific Functions (Simulated) ---
+# PI_OFFLINE_JOURNAL=1: payments are journalled to local SQLite (OFFLINE_JOURNAL path) and
+# acknowledged provisionally, then forwarded in the background with idempotency keys, so a
+# checkout does not wait on (or fail with) the main server. Registrations stay synchronous.
+offline_journal = OfflineJournal(main_server.post) if os.getenv("PI_OFFLINE_JOURNAL") == "1" else None
 
 MODEL_PATH = "palm_detection_mediapipe_2023feb.onnx"
-PALM_IMAGE_PATH = "palm_captured.jpg"
-INPUT_SIZE = 192
-CONFIDENCE_THRESHOLD = 1
-
-# Load model
-ort_session = ort.InferenceSession(MODEL_PATH)
-
-def preprocess(image):
-    image = cv2.resize(image, (INPUT_SIZE, INPUT_SIZE))
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    input_tensor = np.expand_dims(image.astype(np.float32) / 255.0, axis=0)
-    return input_tensor
-
-def detect_palm(image):
-    input_tensor = preprocess(image)
-    outputs = ort_session.run(None, {"input_1": input_tensor})
-    scores = outputs[0][0, :, 0]
-    max_score = np.max(scores)
-    return max_score >= CONFIDENCE_THRESHOLD
-def capture_palm():
-    print("Initializing camera...")
-    picam2 = Picamera2()
-    picam2.configure(picam2.create_preview_configuration(main={"size": (640, 480)}))
-    picam2.start()
-    
-    warmup_start = time.time()
-    while time.time() - warmup_start < 5:
-        frame = picam2.capture_array()
-        cv2.imshow("Palm Detection", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            picam2.stop()
-            cv2.destroyAllWindows()
-            return None
-
-    print("Starting palm detection...")
-
-    while True:
-        frame = picam2.capture_array()
-        if detect_palm(frame):
-            time.sleep(2)
-            frame = picam2.capture_array()
-            cv2.imwrite(PALM_IMAGE_PATH, frame)
-            print(f"Image saved as {PALM_IMAGE_PATH}")
-            break
-
-        cv2.imshow("Palm Detection", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-    picam2.stop()
-    cv2.destroyAllWindows()
-
-    with open(PALM_IMAGE_PATH, "rb") as f:
-        return ("palm.jpg", f.read(), "image/jpeg")
-
-def capture_qr():
-    picam2 = Picamera2()
-    config = picam2.create_preview_configuration(main={"size": (640, 480)})
-    picam2.configure(config)
-    picam2.start()
-    time.sleep(2)  # Warm-up time
-
-    print("Scanning for QR code... Press Ctrl+C to exit.")
-
-    while True:
-        frame = picam2.capture_array()
-
-        # Decode QR codes
-        qr_codes = decode(frame)
-        for qr in qr_codes:
-            qr_data = qr.data.decode('utf-8')
-            print(f"QR Code detected: {qr_data}")
-
-            # Draw bounding box
-            pts = qr.polygon
-            if len(pts) == 4:
-                pts = [(pt.x, pt.y) for pt in pts]
-                cv2.polylines(frame, [np.array(pts)], isClosed=True, color=(0, 255, 0), thickness=2)
-
-            # Display the decoded text
-            cv2.putText(frame, qr_data, (qr.rect.left, qr.rect.top - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 2)
-
-            cv2.imshow("QR Scanner", frame)
-            cv2.waitKey(1000)
-            cv2.destroyAllWindows()
-            picam2.close()
-            return qr_data
-
-        cv2.imshow("QR Scanner", frame)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-    cv2.destroyAllWindows()
-    picam2.close()
-    return None
-    ##backup
-    ##print("[Pi-Sub-Server] Simulating QR code capture and decoding...")
-    ##characters = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
-    ##user_id = os.getenv("ADMIN_ID")
-    ##print(f"[Pi-Sub-Server] Generated simulated QR User ID: {user_id}")
-    ##return user_id
+READY_WAIT = 10  # seconds a checkout waits for startup to finish before getting a 503
+MAX_LONG_POLL = 30  # seconds a GET /jobs/<id>?wait= may block
+SSE_KEEPALIVE = 15  # seconds between keep-alive comments on an idle event stream
+
+# --- Startup ---
+# Camera, model and decoders load on a background thread; checkouts wait for `ready`
+terminal = None
+ready = threading.Event()
+startup = {"steps": {}, "error": None, "time_to_ready": None}
+
+def process_age():
+    """Seconds since this process started (from /proc on the Pi), including interpreter start-up."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - MODULE_LOADED
+
+def load_terminal():
+    global terminal
+
+    def step(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        startup["steps"][name] = round(time.perf_counter() - start, 3)
+        return result
+
+    def import_terminal():
+        from terminal import Terminal
+        return Terminal
 
-# --- Flask Routes ---
+    try:
+        Terminal = step("imports", import_terminal)
+        terminal = Terminal(metrics, MODEL_PATH)
+        step("model_load", terminal.load_model)
+        step("camera_start", terminal.start_camera)
+        startup["time_to_ready"] = round(process_age(), 3)
+        ready.set()
+        steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in startup["steps"].items())
+        print(f"[Pi-Sub-Server] Ready to take payments {startup['time_to_ready']:.2f}s after process start ({steps})")
+    except Exception as e:
+        startup["error"] = str(e)
+        print(f"[Pi-Sub-Server] ❌ Startup failed: {e}")
+
+def start_loading():
+    threading.Thread(target=load_terminal, name="terminal-startup", daemon=True).start()
+
+def wait_until_ready():
+    """None once the terminal is ready, otherwise the (body, 503) outcome to report."""
+    if ready.wait(READY_WAIT):
+        return None
+    if startup["error"]:
+        return {"error": f"Terminal failed to start: {startup['error']}"}, 503
+    return {"error": "Terminal is still starting up, try again shortly"}, 503
+
+# --- Camera Jobs ---
+# One worker owns the camera and runs checkouts in arrival order; HTTP requests only
+# queue a job and return its ID, then clients poll, long-poll or stream /jobs/<id>
+
+def forward(path, data, files):
+    """Forwards a captured palm to the main server. Returns (response body, status code)."""
+    try:
+        # Make the POST request to the main server
+        start = time.perf_counter()
+        with metrics.stage("forward"):
+            response = main_server.post(path, data=data, files=files, headers=metrics.request_headers())
+        terminal.observe_uplink(response, len(files['image'][1]), time.perf_counter() - start)
 
-@app.route("/registerPalm", methods=["POST"])
-def sub_register_palm():
+        # Return the main server's response to the client
+        print(f"[Pi-Sub-Server] Main server response status: {response.status_code}")
+        print(f"[Pi-Sub-Server] Main server stages: {response.headers.get('Server-Timing', 'n/a')}")
+        print(f"[Pi-Sub-Server] Main server response body: {response.text}")
+        return response.json(), response.status_code
+    except requests.exceptions.ConnectionError:
+        return {"error": f"Could not connect to main server at {MAIN_SERVER_URL}. Is it running?"}, 503
+    except requests.exceptions.Timeout:
+        return {"error": f"Main server at {MAIN_SERVER_URL} timed out"}, 504
+    except json.JSONDecodeError:
+        return {"error": f"Main server response was not valid JSON: {response.text}"}, 500
+    except Exception as e:
+        print(f"[Pi-Sub-Server] Error forwarding {path} request: {e}")
+        return {"error": f"Internal sub-server error: {str(e)}"}, 500
+
+def run_register(job):
     """
-    Sub-server endpoint for registration.
-    Receives nothing from the client.
-    Generates a user ID via capture_qr() and an image via capture_palm().
-    Forwards these to the main server's /registerPalm endpoint.
+    Registration: generates a user ID via capture_qr() and an image via capture_palm(),
+    and forwards both to the main server's /registerPalm endpoint.
     """
-    print("\n[Pi-Sub-Server] Received request on /registerPalm")
-
-    # Generate user ID from simulated QR code capture
-    user_id = capture_qr()
+    # Generate user ID from the QR code capture
+    user_id = terminal.capture_qr(should_stop=job.should_stop)
     if not user_id:
-        return jsonify({"error": "Failed to generate user ID from QR capture"}), 500
+        return None if job.should_stop() else ({"error": "Failed to generate user ID from QR capture"}, 500)
 
-    # Capture palm image (returns filename, raw_bytes, content_type)
-    image_file_data = capture_palm()
+    # Capture palm image (returns filename, JPEG buffer, content_type)
+    image_file_data = terminal.capture_palm(should_stop=job.should_stop)
     if not image_file_data:
-        return jsonify({"error": "Failed to capture palm image"}), 500
+        return None if job.should_stop() else ({"error": "Failed to capture palm image"}, 500)
 
-    # Prepare data for the main server
     # requests will automatically handle the multipart/form-data encoding
-    # image_file_data is already in the (filename, raw_bytes, content_type) format
     files = {'image': image_file_data}
     data = {'token': user_id}
 
     print(f"[Pi-Sub-Server] Forwarding to main server /registerPalm with token: {user_id}")
+    return forward("/registerPalm", data, files)
+
+def run_scan(job):
+    """Payment: captures a palm and forwards it with the merchant and amount to /scanPalm."""
+    merchant, amount_str = job.params["merchant"], job.params["amount"]
+
+    # Capture palm image (returns filename, JPEG buffer, content_type)
+    image_file_data = terminal.capture_palm(should_stop=job.should_stop)
+    if not image_file_data:
+        return None if job.should_stop() else ({"error": "Failed to capture palm image"}, 500)
+
+    files = {'image': image_file_data}
+    # The main server reads the merchant and amount from the JSON 'token'; anything else is a 400,
+    # which a journalled payment would only find out after the customer was told it went through
+    data = payment_form(merchant, amount_str)
+
+    if offline_journal is not None:
+        data['captured_at'] = str(time.time())  # the transaction is dated when it was taken, not when forwarded
+        with metrics.stage("journal_write"):
+            key = offline_journal.record("/scanPalm", data, files)
+        print(f"[Pi-Sub-Server] Journalled payment {key} for {merchant}, amount: {amount_str}")
+        return {"message": "Payment accepted, pending confirmation", "provisional": True, "idempotency_key": key}, 202
+
+    print(f"[Pi-Sub-Server] Forwarding to main server /scanPalm with merchant: {merchant}, amount: {amount_str}")
+    return forward("/scanPalm", data, files)
+
+JOB_RUNNERS = {"registerPalm": run_register, "scanPalm": run_scan}
+
+def run_job(job):
+    """JobQueue handler; the job is traced under the request ID of the POST that queued it."""
+    not_ready = wait_until_ready()
+    if not_ready:
+        return not_ready
+    metrics.begin_request(job.request_id)
+    outcome = None
     try:
-        # Make the POST request to the main server
-        response = requests.post(f"{MAIN_SERVER_URL}/registerPalm", data=data, files=files)
+        print(f"\n[Pi-Sub-Server] Running {job.kind} job {job.id}")
+        outcome = JOB_RUNNERS[job.kind](job)
+        return outcome
+    finally:
+        metrics.finish_request(f"job:{job.kind}", outcome[1] if outcome else "stopped")
 
-        # Return the main server's response to the client
-        print(f"[Pi-Sub-Server] Main server response status: {response.status_code}")
-        print(f"[Pi-Sub-Server] Main server response body: {response.text}")
-        return jsonify(response.json()), response.status_code
-    except requests.exceptions.ConnectionError:
-        return jsonify({"error": f"Could not connect to main server at {MAIN_SERVER_URL}. Is it running?"}), 503
-    except json.JSONDecodeError:
-        return jsonify({"error": f"Main server response was not valid JSON: {response.text}"}), 500
-    except Exception as e:
-        print(f"[Pi-Sub-Server] Error forwarding /registerPalm request: {e}")
-        return jsonify({"error": f"Internal sub-server error: {str(e)}"}), 500
+jobs = JobQueue(run_job)
+
+def submit_job(kind, params=None):
+    """Queues a camera job and answers 202 with where to follow it."""
+    try:
+        job = jobs.submit(kind, params, request_id=metrics.current_request_id())
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    print(f"[Pi-Sub-Server] Queued {kind} job {job.id}")
+    body = jobs.describe(job)
+    body["status_url"] = f"/jobs/{job.id}"
+    body["events_url"] = f"/jobs/{job.id}/events"
+    return jsonify(body), 202, {"Location": body["status_url"]}
+
+# --- Flask Routes ---
+
+@app.route("/registerPalm", methods=["POST"])
+def sub_register_palm():
+    """
+    Sub-server endpoint for registration.
+    Receives nothing from the client. Queues a registration job (QR code, then palm)
+    and returns 202 with its job ID straight away.
+    """
+    print("\n[Pi-Sub-Server] Received request on /registerPalm")
+    return submit_job("registerPalm")
 
 @app.route("/scanPalm", methods=["POST"])
 def sub_scan_palm():
     """
     Sub-server endpoint for scanning.
     Receives a JSON body with {"merchant": merchant_name, "amount": amount} from the client.
-    Captures an image via capture_palm().
-    Forwards the merchant/amount (as separate form fields) and a dummy token JSON string
-    to the main server's /scanPalm endpoint.
+    Queues a payment job and returns 202 with its job ID straight away; the job captures
+    the palm and forwards the merchant/amount (as the JSON 'token' form field) to the main server.
     """
     print("\n[Pi-Sub-Server] Received request on /scanPalm")
 
@@ -204,39 +250,89 @@ def sub_scan_palm():
         print(f"[Pi-Sub-Server] Error parsing client JSON for /scanPalm: {e}")
         return jsonify({"error": "Invalid JSON format or missing data in request body"}), 400
 
-    # Capture palm image (returns filename, raw_bytes, content_type)
-    image_file_data = capture_palm()
-    if not image_file_data:
-        return jsonify({"error": "Failed to capture palm image"}), 500
-
-    # Prepare data for the main server's /scanPalm endpoint
-    # image_file_data is already in the (filename, raw_bytes, content_type) format
-    dummy_token_json_string = json.dumps({"dummy_key": "dummy_value"})
+    return submit_job("scanPalm", {"merchant": merchant, "amount": amount_str})
 
-    files = {'image': image_file_data}
-    data = {
-        'token': os.getenv("ADMIN_ID"), # Required by main server's parsing, but content not used for merchant/amount
-        'merchant': merchant,             # Actual merchant name
-        'amount': amount_str              # Actual amount
-    }
+def find_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return None, (jsonify({"error": f"Unknown job {job_id}"}), 404)
+    return job, None
 
-    print(f"[Pi-Sub-Server] Forwarding to main server /scanPalm with merchant: {merchant}, amount: {amount_str}")
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """
+    Job state. With ?wait=<seconds> this long-polls: it answers as soon as the job
+    moves past ?version=<n> (default: its current version) or finishes.
+    """
+    job, error = find_job(job_id)
+    if error:
+        return error
     try:
-        # Make the POST request to the main server
-        response = requests.post(f"{MAIN_SERVER_URL}/scanPalm", data=data, files=files)
-
-        # Return the main server's response to the client
-        print(f"[Pi-Sub-Server] Main server response status: {response.status_code}")
-        print(f"[Pi-Sub-Server] Main server response body: {response.text}")
-        return jsonify(response.json()), response.status_code
-    except requests.exceptions.ConnectionError:
-        return jsonify({"error": f"Could not connect to main server at {MAIN_SERVER_URL}. Is it running?"}), 503
-    except json.JSONDecodeError:
-        return jsonify({"error": f"Main server response was not valid JSON: {response.text}"}), 500
-    except Exception as e:
-        print(f"[Pi-Sub-Server] Error forwarding /scanPalm request: {e}")
-        return jsonify({"error": f"Internal sub-server error: {str(e)}"}), 500
+        wait = min(float(request.args.get("wait", 0)), MAX_LONG_POLL)
+        version = int(request.args.get("version", job.version))
+    except ValueError:
+        return jsonify({"error": "'wait' and 'version' must be numbers"}), 400
+    if wait > 0:
+        jobs.wait(job, version, wait)
+    return jsonify(jobs.describe(job)), 200
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Server-sent events: one 'status' event per job change, ending once the job finishes."""
+    job, error = find_job(job_id)
+    if error:
+        return error
+
+    def stream():
+        sent = -1
+        while True:
+            version = jobs.wait(job, sent, SSE_KEEPALIVE)
+            if version > sent:
+                sent = version
+                body = jobs.describe(job)
+                yield f"event: status\ndata: {json.dumps(body)}\n\n"
+                if body["status"] in FINISHED:
+                    return
+            else:
+                yield ": keep-alive\n\n"
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    """Cancels a job. A queued job is dropped; a running one releases the camera at its next frame."""
+    job, error = find_job(job_id)
+    if error:
+        return error
+    jobs.cancel(job)
+    return jsonify(jobs.describe(job)), 200
+
+@app.route("/journal", methods=["GET"])
+def journal_status():
+    """Offline journal queue depth, lag and counters, plus recently rejected payments."""
+    if offline_journal is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **offline_journal.stats(), "rejected": offline_journal.rejected()}), 200
+
+@app.route("/ready", methods=["GET"])
+def readiness():
+    """Readiness probe: 200 once the camera and model are loaded, 503 (with progress) until then."""
+    body = {"ready": ready.is_set(), "uptime": round(process_age(), 3), **startup}
+    return jsonify(body), 200 if ready.is_set() else 503
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Per-stage and per-endpoint latency histograms in the Prometheus text format."""
+    body = metrics.render()
+    if offline_journal is not None:
+        body += offline_journal.prometheus(metrics.process)
+    return body, 200, {"Content-Type": CONTENT_TYPE}
 
 if __name__ == "__main__":
     print(f"Raspberry Pi Sub-server starting on port 5001. Main server URL: {MAIN_SERVER_URL}")
-    app.run(host="0.0.0.0", port=5001, debug=True)
+    start_loading()
+    main_server.start_prewarm()
+    # The reloader would start a second process that fights this one for the camera;
+    # PI_DEBUG=1 turns on Flask's debugger without it
+    app.run(host="0.0.0.0", port=5001, debug=os.getenv("PI_DEBUG") == "1", use_reloader=False)
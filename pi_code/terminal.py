@@ -0,0 +1,151 @@
+import time
+import cv2
+from camera import CameraService, create_frame_source
+import palm_detection
+from image_encoder import AdaptiveEncoder
+import burst_capture
+import qr_scanner
+
+# === CONFIG ===
+CONFIDENCE_THRESHOLD = 0.5  # palm probability after the sigmoid
+CAMERA_READY_TIMEOUT = 5    # seconds to wait for the first frame
+
+
+class Terminal:
+    """
+    The checkout hardware: camera, palm detector and upload encoder.
+    Everything heavy (OpenCV, ONNX Runtime, pyzbar, the camera) is imported and
+    opened here, so server.py can answer HTTP while this loads in the background.
+    """
+
+    def __init__(self, metrics, model_path=palm_detection.MODEL_PATH):
+        self.metrics = metrics
+        self.model_path = model_path
+        self.palm_detector = None
+        # Camera is opened once and kept streaming for the life of the process
+        self.camera = CameraService(create_frame_source())
+        # Uploads are cropped to the palm, resized for the server model and sized to the uplink
+        # (UPLOAD_CODEC, UPLOAD_SIZE and UPLOAD_MAX_BYTES configure it)
+        self.image_encoder = AdaptiveEncoder()
+        # Grayscale, downscaled-first QR decoding that locks onto the code once found
+        # (QR_PYRAMID_LEVELS and QR_FULL_RES_INTERVAL configure it)
+        self.qr_decoder = qr_scanner.QRDecoder()
+
+    def load_model(self):
+        # Variant (PALM_MODEL_VARIANT), threads, execution mode and arena (PALM_ORT_*) come from the
+        # environment; the offline-optimised graph from prepare_model.py is used when present
+        session = palm_detection.create_session(self.model_path)
+        self.palm_detector = palm_detection.PalmDetector(session)
+
+    def start_camera(self):
+        """Starts the camera if needed and waits for its first frame (instant once it is streaming)."""
+        with self.metrics.stage("camera_warmup"):
+            self.camera.start()
+            return self.camera.ready.wait(timeout=CAMERA_READY_TIMEOUT)
+
+    def detect_palm(self, image):
+        """Returns the best palm box (x0, y0, x1, y1), or None."""
+        return self.detect_palm_scored(image)[0]
+
+    def detect_palm_scored(self, image):
+        """Returns (box, confidence) of the best palm, or (None, 0.0)."""
+        with self.metrics.stage("palm_detect"):
+            detections = self.palm_detector.detect(image, score_threshold=CONFIDENCE_THRESHOLD)
+        if not len(detections.scores):
+            return None, 0.0
+        return detections.boxes[0], float(detections.scores[0])
+
+    def capture_palm(self, should_stop=None):
+        """Waits for a palm and returns the encoded upload, or None if none was captured or should_stop() fired."""
+        self.start_camera()
+        print("Starting palm detection...")
+
+        captured = box = None
+        for frame in self.camera.frames(timeout=5):
+            if should_stop is not None and should_stop():
+                break
+            box = self.detect_palm(frame.image)
+            if box is not None:
+                pick = self.capture_burst(frame, box)
+                if pick is None:
+                    # The hand left or blurred out in every frame of the burst; keep looking
+                    print("Palm lost during burst, retrying...")
+                    continue
+                captured, box = pick.frame.image, pick.box
+                print(f"Palm image captured (sharpest of {pick.candidates} frames, "
+                      f"confidence {pick.confidence:.2f}, focus {pick.focus:.0f})")
+                break
+
+            cv2.imshow("Palm Detection", frame.image)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+
+        cv2.destroyAllWindows()
+        if captured is None:
+            return None
+
+        # Encode straight to memory; the uploader reads the encoded buffer without copying it
+        try:
+            with self.metrics.stage("jpeg_encode"):
+                return self.image_encoder.encode(captured, box)
+        except (ValueError, cv2.error) as e:  # palm too small to crop, or the encoder failed
+            print(f"[Pi-Sub-Server] {e}")
+            return None
+
+    def capture_burst(self, trigger, box):
+        """
+        Takes a burst from the running stream after the first detection and returns the
+        sharpest frame that still holds the palm (a BurstPick), or None, within
+        PALM_BURST_BUDGET_MS.
+        """
+        with self.metrics.stage("burst_select"):
+            deadline = time.monotonic() + burst_capture.BURST_BUDGET
+            frames = burst_capture.collect_burst(self.camera, trigger, deadline=deadline)
+            return burst_capture.select_best(frames, box, self.detect_palm_scored, deadline=deadline)
+
+    def observe_uplink(self, response, nbytes, elapsed):
+        """Feeds the upload time (forward time minus the server's own stages) to the encoder."""
+        server_ms = 0.0
+        for entry in response.headers.get("Server-Timing", "").split(","):
+            _, _, duration = entry.partition("dur=")
+            if duration:
+                server_ms += float(duration)
+        self.image_encoder.observe_upload(nbytes, max(elapsed - server_ms / 1000, 0.001))
+
+    def capture_qr(self, should_stop=None):
+        """Scans until a QR code is read and returns its text, or None if should_stop() fired first."""
+        self.start_camera()
+        print("Scanning for QR code... Press q in the preview window to cancel.")
+
+        # Decoding runs on a worker thread that always takes the newest frame, so the
+        # preview keeps its frame rate however long a decode takes
+        self.qr_decoder.reset()
+        worker = qr_scanner.QRScanWorker(self.qr_decoder, self.metrics)
+        worker.start()
+        codes = []
+        try:
+            for frame in self.camera.frames(timeout=5):
+                if should_stop is not None and should_stop():
+                    break
+                worker.submit(frame)
+                codes = worker.codes
+                image = frame.image.copy()  # drawn on below; the ring buffer copy stays clean
+                qr_scanner.draw_codes(image, codes or worker.last_seen)
+                cv2.imshow("QR Scanner", image)
+                if codes:
+                    print(f"QR Code detected: {codes[0].data} (via {codes[0].path})")
+                    cv2.waitKey(1000)
+                    break
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        finally:
+            worker.stop()
+
+        cv2.destroyAllWindows()
+        return codes[0].data if codes else None
+        ##backup
+        ##print("[Pi-Sub-Server] Simulating QR code capture and decoding...")
+        ##characters = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+        ##user_id = os.getenv("ADMIN_ID")
+        ##print(f"[Pi-Sub-Server] Generated simulated QR User ID: {user_id}")
+        ##return user_id
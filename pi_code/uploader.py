@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import deque
+import requests
+
+# === CONFIG ===
+UPLOAD_WORKERS = 2
+UPLOAD_QUEUE_SIZE = 8
+UPLOAD_TIMEOUT = 3        # seconds per attempt
+UPLOAD_RETRIES = 3        # extra attempts after the first failure
+UPLOAD_BACKOFF = 0.5      # seconds before the first retry, doubled each time
+UPLOAD_BACKOFF_MAX = 8.0
+RETRYABLE_STATUSES = (408, 429)  # client errors that mean "try again later"; every 5xx is retried too
+
+
+class UploadQueue:
+    """
+    Bounded background uploader.
+    submit() never blocks the caller: when the queue is full the oldest pending
+    upload is dropped, since a newer frame of the same hand is more useful.
+    Worker threads post with retry and exponential backoff on connection errors, 5xx,
+    408 and 429; any other 4xx is counted as rejected and not retried.
+    on_sent(nbytes, seconds), if given, is called after each successful post with the
+    payload size and time taken.
+    """
+
+    def __init__(self, url, workers=UPLOAD_WORKERS, max_size=UPLOAD_QUEUE_SIZE, timeout=UPLOAD_TIMEOUT,
+                 retries=UPLOAD_RETRIES, backoff=UPLOAD_BACKOFF, backoff_max=UPLOAD_BACKOFF_MAX, on_sent=None):
+        self.url = url
+        self.on_sent = on_sent
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._pending = deque(maxlen=max_size)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._closed = False
+        self._counters = {"queued": 0, "sent": 0, "dropped": 0, "failed": 0, "rejected": 0, "retried": 0}
+        self._workers = [threading.Thread(target=self._worker_loop, name=f"uploader-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, files, data=None):
+        """Queues an upload. Returns immediately."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("UploadQueue is closed")
+            if len(self._pending) == self._pending.maxlen:
+                self._counters["dropped"] += 1  # deque(maxlen) discards the oldest on append
+            self._pending.append((files, data))
+            self._counters["queued"] += 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters, pending=len(self._pending), in_flight=self._in_flight)
+
+    def close(self, timeout=None):
+        """Stops accepting uploads and waits up to timeout seconds for the queue to drain."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(None if deadline is None else max(0, deadline - time.monotonic()))
+
+    def _worker_loop(self):
+        session = requests.Session()  # one session per worker keeps its connection alive
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                files, data = self._pending.popleft()
+                self._in_flight += 1
+            try:
+                outcome = self._send(session, files, data)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._counters[outcome] += 1
+
+    def _send(self, session, files, data):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self._cond:
+                    self._counters["retried"] += 1
+                time.sleep(delay)
+                delay = min(delay * 2, self.backoff_max)
+            try:
+                start = time.monotonic()
+                res = session.post(self.url, files=files, data=data, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"❌ Upload attempt {attempt + 1} failed: {e}")
+                continue
+            if res.status_code < 400:
+                print(f"[{res.status_code}] Palm sent at {time.strftime('%X')}")
+                if self.on_sent is not None:
+                    self.on_sent(sum(len(spec[1]) for spec in files.values()), time.monotonic() - start)
+                return "sent"
+            if res.status_code < 500 and res.status_code not in RETRYABLE_STATUSES:
+                print(f"❌ Upload rejected with {res.status_code}: {res.text[:200]}")
+                return "rejected"
+            print(f"❌ Upload attempt {attempt + 1} got {res.status_code}")
+            delay = max(delay, min(_retry_after(res), self.backoff_max))
+        return "failed"
+
+
+def _retry_after(res):
+    """Seconds the server asked us to wait (a numeric Retry-After header), or 0."""
+    try:
+        return max(float(res.headers.get("Retry-After", 0)), 0.0)
+    except ValueError:
+        return 0.0
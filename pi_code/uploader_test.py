@@ -0,0 +1,111 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from uploader import UploadQueue
+
+# Background uploader against a scripted local HTTP server: retries, Retry-After and
+# which failures are given up on.
+# Run from pi_code: python uploader_test.py (or pytest uploader_test.py)
+
+# === CONFIG ===
+PALM = {"file": ("palm.jpg", b"\xff\xd8" + b"\x00" * 1000, "image/jpeg")}
+BACKOFF = 0.01  # seconds; the tests only wait longer when the server asks for it
+
+
+def scripted_server(responses):
+    """
+    Serves POSTs with the given (status, headers) in turn, then 200s.
+    Returns (url, monotonic arrival time of each request).
+    """
+    responses = list(responses)
+    arrivals = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            arrivals.append(time.monotonic())
+            status, headers = responses.pop(0) if responses else (200, {})
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/upload", arrivals
+
+
+def upload_once(url, **kwargs):
+    sent = []
+    queue = UploadQueue(url, workers=1, backoff=BACKOFF, on_sent=lambda nbytes, seconds: sent.append(nbytes),
+                        **kwargs)
+    queue.submit(PALM)
+    queue.close(timeout=10)
+    return queue.stats(), sent
+
+
+def test_server_errors_are_retried():
+    url, arrivals = scripted_server([(503, {}), (500, {}), (429, {})])
+    stats, sent = upload_once(url)
+    assert (stats["sent"], stats["retried"], stats["failed"]) == (1, 3, 0)
+    assert len(arrivals) == 4 and sent == [len(PALM["file"][1])]
+
+
+def test_retry_after_is_honoured_and_capped():
+    url, arrivals = scripted_server([(503, {"Retry-After": "0.3"}), (429, {"Retry-After": "30"})])
+    stats, _ = upload_once(url, backoff_max=0.5)
+    assert stats["sent"] == 1 and len(arrivals) == 3
+    assert arrivals[1] - arrivals[0] >= 0.3                # waited as long as asked
+    assert 0.5 <= arrivals[2] - arrivals[1] < 5            # 30 s asked, capped at backoff_max
+
+
+def test_client_errors_are_not_retried():
+    url, arrivals = scripted_server([(400, {})])
+    stats, sent = upload_once(url)
+    assert (stats["rejected"], stats["retried"], stats["sent"]) == (1, 0, 0)
+    assert len(arrivals) == 1 and sent == []
+
+    # 408 (and 429) mean "later", not "never"
+    url, arrivals = scripted_server([(408, {})])
+    assert upload_once(url)[0]["sent"] == 1 and len(arrivals) == 2
+
+
+def test_gives_up_after_the_retries():
+    url, arrivals = scripted_server([(502, {})] * 10)
+    stats, _ = upload_once(url, retries=2)
+    assert (stats["failed"], stats["retried"], len(arrivals)) == (1, 2, 3)
+
+    # Nothing listening: connection errors are retried the same way
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        closed_port = s.getsockname()[1]
+    stats, _ = upload_once(f"http://127.0.0.1:{closed_port}/upload", retries=1)
+    assert (stats["failed"], stats["retried"]) == (1, 1)
+
+
+def test_full_queue_drops_the_oldest():
+    url, arrivals = scripted_server([])
+    queue = UploadQueue(url, workers=1, max_size=2, backoff=BACKOFF)
+    with queue._cond:  # hold the worker back until everything is queued
+        for n in range(4):
+            queue.submit({"file": (f"palm-{n}.jpg", b"x", "image/jpeg")})
+    queue.close(timeout=10)
+    stats = queue.stats()
+    assert (stats["queued"], stats["dropped"], stats["sent"]) == (4, 2, 2)
+    assert len(arrivals) == 2
+
+
+if __name__ == "__main__":
+    test_server_errors_are_retried()
+    test_retry_after_is_honoured_and_capped()
+    test_client_errors_are_not_retried()
+    test_gives_up_after_the_retries()
+    test_full_queue_drops_the_oldest()
+    print("✅ Uploader retries, honours Retry-After and drops the oldest when full")
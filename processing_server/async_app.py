@@ -0,0 +1,250 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import firebase_admin
+from firebase_admin import firestore_async
+from quart import Quart, request, jsonify
+
+import pc_image_receiver as core
+import palm_template
+import spend_rollups
+from transaction_history import HistoryRequest, read_history, read_history_async
+from user_cache import firestore_async_profile_loader
+from metrics import REQUEST_ID_HEADER, CONTENT_TYPE, endpoint_label
+from idempotency import IDEMPOTENCY_HEADER
+
+metrics = core.metrics
+
+# === Config ===
+# Threads for image decoding and preprocessing; inference itself runs on the embedder's batch thread
+CPU_WORKERS = int(os.getenv("ASYNC_CPU_WORKERS", os.cpu_count() or 1))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# === Async Firestore Init ===
+# Reuses the Firebase app initialised by pc_image_receiver. Without one (offline runs on a fake
+# Firestore) the blocking client calls are moved onto the default executor instead.
+async_db = None
+profile_loader = None
+
+def init_async_services(database):
+    global async_db, profile_loader
+    async_db = database
+    profile_loader = firestore_async_profile_loader(database) if database is not None else None
+
+try:
+    firebase_admin.get_app()
+    init_async_services(firestore_async.client())
+except ValueError:
+    print("Async Firestore client not available; falling back to the blocking client in an executor.")
+
+cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="palm-cpu")
+
+# === Quart App Init ===
+# Same contract as pc_image_receiver.app, served by an ASGI server: hypercorn async_app:app
+app = Quart(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+
+@app.before_request
+async def begin_trace():
+    metrics.begin_request(request.headers.get(REQUEST_ID_HEADER))
+
+
+@app.after_request
+async def finish_trace(response):
+    response.headers.update(metrics.finish_request(endpoint_label(request.url_rule), response.status_code))
+    return response
+
+
+async def run_blocking(fn, *args, executor=None):
+    # Run under a copy of this request's context so stages timed in the thread land in its trace
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+async def generate_vector(image_bytes):
+    """Decodes on the CPU pool, then awaits the embedder's micro-batch without holding a thread."""
+    with metrics.stage("decode"):
+        tensor = await run_blocking(core.embedder.preprocess, image_bytes, executor=cpu_pool)
+    with metrics.stage("embed"):
+        embedding = await asyncio.wrap_future(core.embedder.submit(tensor))
+    return core.ToVector(embedding)
+
+
+async def read_upload():
+    """Returns (token, image bytes or None, validation error). The multipart body is parsed as it streams in."""
+    with metrics.stage("multipart_parse"):
+        form = await request.form
+        files = await request.files
+    token = form.get("token")
+    image = files.get("image")
+    error = core.validate_upload(token, image)
+    if error:
+        return token, None, error
+    return token, image.read(), None
+
+
+async def load_profile(uid):
+    if profile_loader is not None:
+        with metrics.stage("firestore_read"):
+            return await profile_loader(uid)
+    return await run_blocking(core.user_cache.loader, uid)  # already timed as firestore_read
+
+
+@app.route("/registerPalm", methods=["POST"])
+async def register_palm():
+    """Async /registerPalm: same form fields, responses and status codes as the Flask server."""
+    token, image_bytes, error = await read_upload()
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        vector = await generate_vector(image_bytes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        template = palm_template.encode(vector)
+        with metrics.stage("firestore_write"):
+            if async_db is not None:
+                await async_db.collection("users").document(token).set({"palmHash": template}, merge=True)
+            else:
+                user_ref = core.db.collection("users").document(token)
+                await run_blocking(lambda: user_ref.set({"palmHash": template}, merge=True))
+        core.user_cache.invalidate(token)
+        core.palm_index.add(token, palm_template.decode(template))
+
+        print(f"✅ Registered vector for {token}")
+        return jsonify({"message": "Registration OK", "uid": token}), 200
+    except Exception as e:
+        print(f"❌ Error in registerPalm: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/scanPalm", methods=["POST"])
+async def scan_palm():
+    """Async /scanPalm: same form fields, responses and status codes as the Flask server."""
+    reserved_key = None
+    try:
+        token_raw, image_bytes, error = await read_upload()
+        if error:
+            return jsonify({"error": error}), 400
+
+        try:
+            merchant, amount = core.parse_payment_token(token_raw)
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            replayed = core.replay_payment(idempotency_key)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if replayed is not None:
+            return jsonify(replayed[0]), replayed[1]
+        reserved_key = idempotency_key
+
+        try:
+            query_vector = await generate_vector(image_bytes)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # A 1:N search over a large gallery is milliseconds of NumPy; keep it off the event loop
+        match = await run_blocking(core.match_palm, query_vector, executor=cpu_pool)
+        if match is None:
+            return jsonify({"error": "Palm not recognised"}), 404
+        user_id, _ = match
+
+        user_data = await core.user_cache.get_async(user_id, load_profile)
+        if user_data is None:
+            return jsonify({"error": "User not found"}), 404
+        if not user_data.get("palm_enrolled"):
+            core.unenroll(user_id)
+            return jsonify({"error": "Palm not recognised"}), 404
+
+        default_acc = user_data.get("default_acc")
+        if not default_acc:
+            core.user_cache.invalidate(user_id)
+            return jsonify({"error": "No default account set for this user"}), 400
+
+        # The journal append fsyncs, so keep it off the event loop
+        timestamp = core.payment_timestamp((await request.form).get("captured_at"))
+        transaction_id = await run_blocking(core.record_payment, user_id, default_acc, merchant, amount,
+                                            idempotency_key, timestamp)
+        body = {"message": "Payment OK", "transaction_id": transaction_id}
+        if idempotency_key:
+            core.idempotency_cache.put(idempotency_key, body, 200)
+        return jsonify(body), 200
+
+    except Exception as e:
+        print(f"❌ Error in scanPalm: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if reserved_key:
+            core.idempotency_cache.release(reserved_key)
+
+
+@app.route("/spend/<uid>", methods=["GET"])
+async def monthly_spend(uid):
+    """Async /spend/<uid>: same query parameters and response as the Flask server."""
+    denied = await run_blocking(core.authorize_user, uid, request.headers.get("Authorization"))
+    if denied:
+        return jsonify({"error": denied[0]}), denied[1]
+    try:
+        month = spend_rollups.validate_month(request.args.get("month"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    account_id = request.args.get("account")
+    try:
+        with metrics.stage("firestore_read"):
+            if async_db is not None:
+                if account_id is None:
+                    ref = spend_rollups.user_rollup_ref(async_db, uid, month)
+                else:
+                    ref = spend_rollups.account_rollup_ref(async_db, uid, account_id, month)
+                body = spend_rollups.format_rollup(uid, month, (await ref.get()).to_dict(), account_id)
+            else:
+                body = await run_blocking(spend_rollups.read_monthly_spend, core.db, uid, month, account_id)
+        return jsonify(body), 200
+    except Exception as e:
+        print(f"❌ Error in monthly_spend: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/transactions/<uid>", methods=["GET"])
+async def transaction_history(uid):
+    """Async /transactions/<uid>: same paging, filters and first-page cache as the Flask server."""
+    # Verifying the token may fetch Google's signing certificates, so keep it off the event loop
+    denied = await run_blocking(core.authorize_user, uid, request.headers.get("Authorization"))
+    if denied:
+        return jsonify({"error": denied[0]}), denied[1]
+    try:
+        req = HistoryRequest.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        body = core.history_cache.get(uid, req.cache_key) if req.first_page else None
+        if body is None:
+            with metrics.stage("firestore_read"):
+                if async_db is not None:
+                    body = await read_history_async(async_db, uid, req)
+                else:
+                    body = await run_blocking(read_history, core.db, uid, req)
+            if req.first_page:
+                core.history_cache.put(uid, req.cache_key, body)
+        return jsonify(body), 200
+    except Exception as e:
+        print(f"❌ Error in transaction_history: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/stats", methods=["GET"])
+async def stats():
+    return jsonify(core.collect_stats()), 200
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": CONTENT_TYPE}
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=8080)
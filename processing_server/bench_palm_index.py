@@ -0,0 +1,54 @@
+import time
+import numpy as np
+from palm_index import PalmIndex, EMBEDDING_DIM
+
+# === CONFIG ===
+GALLERY_SIZES = [10_000, 100_000, 1_000_000]
+N_QUERIES = 500
+QUERY_NOISE = 0.05   # std-dev of noise added to an enrolled vector to simulate a re-scan
+TOP_K = 5
+SEED = 42
+
+
+def make_gallery(n, rng):
+    """Random unit-length palm templates standing in for real enrolments."""
+    vectors = rng.standard_normal((n, EMBEDDING_DIM), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [f"user_{i}" for i in range(n)], vectors
+
+
+def make_queries(ids, vectors, rng):
+    picks = rng.choice(len(ids), N_QUERIES, replace=False)
+    noise = rng.standard_normal((N_QUERIES, EMBEDDING_DIM), dtype=np.float32) * QUERY_NOISE
+    return [ids[i] for i in picks], vectors[picks] + noise
+
+
+def run(label, index, ids, vectors, expected, queries):
+    start = time.perf_counter()
+    index.build(ids, vectors)
+    build_s = time.perf_counter() - start
+
+    hits = 0
+    start = time.perf_counter()
+    for uid, query in zip(expected, queries):
+        matches = index.search(query, k=TOP_K)
+        hits += bool(matches) and matches[0][0] == uid
+    elapsed = time.perf_counter() - start
+
+    print(f"  {label:<24} build {build_s:7.2f}s | {N_QUERIES / elapsed:9.1f} q/s "
+          f"| {elapsed / N_QUERIES * 1000:7.3f} ms/query | recall@1 {hits / N_QUERIES:.3f}")
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(SEED)
+    for n in GALLERY_SIZES:
+        print(f"\n📊 Gallery of {n:,} users ({n * EMBEDDING_DIM * 4 / 2**20:.0f} MiB of templates)")
+        ids, vectors = make_gallery(n, rng)
+        expected, queries = make_queries(ids, vectors, rng)
+
+        run("flat", PalmIndex(n_lists=1), ids, vectors, expected, queries)
+        n_lists = int(np.sqrt(n))
+        for n_probe in (8, 24):
+            run(f"ivf{n_lists} nprobe={n_probe}", PalmIndex(n_lists=n_lists, n_probe=n_probe),
+                ids, vectors, expected, queries)
+        del ids, vectors
@@ -0,0 +1,65 @@
+import time
+import numpy as np
+import palm_template
+from palm_index import PalmIndex, EMBEDDING_DIM
+from bench_palm_index import make_gallery, make_queries
+
+# === CONFIG ===
+GALLERY_SIZE = 100_000
+SEED = 42
+LEGACY_DECIMALS = 8  # what /registerPalm used to round each float to
+
+
+def legacy_load(gallery):
+    """Legacy documents arrive as lists of Python floats; this is the cost of turning them into a matrix."""
+    start = time.perf_counter()
+    vectors = np.asarray(gallery, dtype=np.float32)
+    return vectors, time.perf_counter() - start
+
+
+def binary_load(blobs):
+    start = time.perf_counter()
+    vectors, _ = palm_template.decode_many(blobs, EMBEDDING_DIM)
+    return vectors, time.perf_counter() - start
+
+
+def accuracy(ids, vectors, expected, queries, reference_scores):
+    """recall@1 on noisy re-scans, and the mean |score error| against float32 templates."""
+    index = PalmIndex(n_lists=1)
+    index.build(ids, vectors)
+    hits, errors = 0, []
+    for uid, query, reference in zip(expected, queries, reference_scores):
+        (best, score), = index.search(query, k=1)
+        hits += best == uid
+        errors.append(abs(score - reference))
+    return hits / len(expected), float(np.mean(errors))
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(SEED)
+    ids, vectors = make_gallery(GALLERY_SIZE, rng)
+    expected, queries = make_queries(ids, vectors, rng)
+    reference_index = PalmIndex(n_lists=1)
+    reference_index.build(ids, vectors)
+    reference_scores = [reference_index.search(q, k=1)[0][1] for q in queries]
+
+    print(f"📊 {GALLERY_SIZE:,} templates of {EMBEDDING_DIM} dims, {len(queries)} noisy re-scan queries\n")
+    print(f"  {'format':<18}{'bytes':>7}{'total MiB':>11}{'encode us':>11}{'load s':>9}{'recall@1':>10}{'|dscore|':>11}")
+
+    legacy = [[round(float(v), LEGACY_DECIMALS) for v in row] for row in vectors]
+    loaded, load_s = legacy_load(legacy)
+    recall, error = accuracy(ids, loaded, expected, queries, reference_scores)
+    size = EMBEDDING_DIM * 8  # Firestore stores each array element as a double
+    print(f"  {'legacy float list':<18}{size:>7}{size * GALLERY_SIZE / 2**20:>11.1f}{'-':>11}{load_s:>9.3f}"
+          f"{recall:>10.3f}{error:>11.5f}")
+    del legacy, loaded
+
+    for codec in palm_template.CODECS:
+        start = time.perf_counter()
+        blobs = [palm_template.encode(v, codec=codec) for v in vectors]
+        encode_us = (time.perf_counter() - start) / GALLERY_SIZE * 1e6
+        loaded, load_s = binary_load(blobs)
+        recall, error = accuracy(ids, loaded, expected, queries, reference_scores)
+        size = len(blobs[0])
+        print(f"  {codec:<18}{size:>7}{size * GALLERY_SIZE / 2**20:>11.1f}{encode_us:>11.1f}{load_s:>9.3f}"
+              f"{recall:>10.3f}{error:>11.5f}")
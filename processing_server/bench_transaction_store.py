@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+import time
+from transaction_store import TransactionStore, SQLiteBackend
+
+# === CONFIG ===
+N_TRANSACTIONS = 2000
+N_THREADS = 8            # concurrent /scanPalm request threads
+FIRESTORE_RTT = 0.03     # seconds per commit round-trip simulated on top of the local SQLite stand-in
+SAMPLE = {"amount": 12.5, "merchant": "Tesco", "category": "Groceries", "status": "success"}
+
+
+class SlowBackend:
+    """Wraps a local backend and adds a fixed round-trip per commit, like a remote Firestore call."""
+
+    def __init__(self, inner, rtt=FIRESTORE_RTT):
+        self.inner = inner
+        self.rtt = rtt
+
+    def commit(self, transactions):
+        time.sleep(self.rtt)
+        self.inner.commit(transactions)
+
+
+def percentile(values, p):
+    return sorted(values)[min(len(values) - 1, int(len(values) * p))]
+
+
+def drive(record):
+    """Calls record(i) N_TRANSACTIONS times from N_THREADS threads. Returns (elapsed, latencies in ms)."""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        local = []
+        for i in range(offset, N_TRANSACTIONS, N_THREADS):
+            start = time.perf_counter()
+            record(i)
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(N_THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies
+
+
+def report(label, elapsed, latencies, extra=""):
+    print(f"  {label:<22} {len(latencies) / elapsed:8.0f} acks/s | ack p50 {percentile(latencies, 0.5):7.3f} ms "
+          f"p99 {percentile(latencies, 0.99):7.3f} ms{extra}")
+
+
+if __name__ == "__main__":
+    print(f"📊 {N_TRANSACTIONS} payments from {N_THREADS} threads, {FIRESTORE_RTT * 1000:.0f} ms per backend commit")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Baseline: every request commits its own transaction inline, like the old .add()
+        backend = SlowBackend(SQLiteBackend(os.path.join(tmp, "inline.sqlite")))
+        elapsed, latencies = drive(lambda i: backend.commit([{
+            "id": str(i), "user_id": f"user_{i % 100}", "account_id": "acc_1",
+            "data": dict(SAMPLE, timestamp=time.time())}]))
+        report("inline commit", elapsed, latencies)
+
+        backend = SlowBackend(SQLiteBackend(os.path.join(tmp, "batched.sqlite")))
+        store = TransactionStore(backend, journal_path=os.path.join(tmp, "bench.journal"))
+        elapsed, latencies = drive(lambda i: store.record(f"user_{i % 100}", "acc_1", SAMPLE))
+        start = time.perf_counter()
+        store.close()
+        stats = store.stats()
+        report("write-behind journal", elapsed, latencies,
+               f" | drained in {time.perf_counter() - start:.2f}s, {stats['batches']} batches total, "
+               f"{backend.inner.count()} rows")
@@ -0,0 +1,256 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import signal
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from palm_embedder import load_embedder, ALLOW_STANDIN, EMBEDDING_MODEL_PATH
+import palm_template
+
+# === CONFIG ===
+UPLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+COMMIT_SIZE = 500         # users per Firestore batch commit; Firestore allows at most 500 writes per batch
+CHUNK_SIZE = 64           # images decoded and embedded per task; one batched inference call each
+IN_FLIGHT_PER_WORKER = 2  # chunks queued per worker, so workers never wait on the parent
+REPORT_INTERVAL = 5.0     # seconds between progress lines
+CHECKPOINT = "enroll.progress"
+
+
+# === INPUT ===
+def scan_directory(image_dir):
+    """
+    (uid, path) pairs from a directory. A file directly in it is enrolled under its
+    file name without the extension (the uploads/ layout); a sub-directory is one
+    user named after it, enrolled with its first image.
+    """
+    pairs = []
+    for entry in sorted(os.scandir(image_dir), key=lambda e: e.name):
+        if entry.is_dir():
+            images = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(entry.path, pattern)))
+            if images:
+                pairs.append((entry.name, images[0]))
+        elif os.path.splitext(entry.name)[1].lower() in {p[1:] for p in IMAGE_PATTERNS}:
+            pairs.append((os.path.splitext(entry.name)[0], entry.path))
+    return pairs
+
+
+def read_manifest(manifest_path):
+    """(uid, path) pairs from a CSV with uid,path columns; relative paths are relative to the manifest."""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline="") as f:
+        return [(row["uid"], os.path.join(base, row["path"])) for row in csv.DictReader(f)]
+
+
+def synthetic(pairs, count):
+    """count users cycling through the given images, for throughput runs on the small sample set."""
+    return [(f"bulk-{i:07d}", pairs[i % len(pairs)][1]) for i in range(count)]
+
+
+# === CHECKPOINT ===
+def load_checkpoint(path):
+    """UIDs already committed by an earlier run."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    return set(lines[:-1])  # the last element is "" or a line torn by a crash
+
+
+class Checkpoint:
+    """Append-only list of committed UIDs, fsynced after every commit so a restart skips them."""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def add(self, uids):
+        self._file.write("".join(f"{uid}\n" for uid in uids))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+# === WRITERS ===
+class FirestoreWriter:
+    """Sets users/{uid}.palmHash (merged, like /registerPalm) in batched writes."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def commit(self, uids, vectors):
+        batch = self.db.batch()
+        for uid, vector in zip(uids, vectors):
+            batch.set(self.db.collection("users").document(uid), {"palmHash": palm_template.encode(vector)}, merge=True)
+        batch.commit()
+
+
+class SQLiteWriter:
+    """Local stand-in for Firestore: one row per user with the binary template."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS palm_templates (uid TEXT PRIMARY KEY, palmHash BLOB)")
+
+    def commit(self, uids, vectors):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO palm_templates VALUES (?, ?)",
+                                  [(uid, palm_template.encode(v)) for uid, v in zip(uids, vectors)])
+
+
+def create_writer(spec):
+    """Builds a writer from a --target value: firestore, fake[:latency seconds] or sqlite[:path]."""
+    if spec == "firestore":
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        firebase_admin.initialize_app(credentials.Certificate(json.loads(os.environ["FIREBASE_CREDS"])))
+        return FirestoreWriter(firestore.client())
+    if spec.startswith("fake"):
+        from fake_firestore import FakeFirestore
+        _, _, latency = spec.partition(":")
+        return FirestoreWriter(FakeFirestore(latency=float(latency or 0)))
+    if spec.startswith("sqlite"):
+        _, _, path = spec.partition(":")
+        return SQLiteWriter(path or "palm_templates.sqlite")
+    raise ValueError(f"Unknown enrolment target: {spec}")
+
+
+# === WORKERS ===
+_embedder = None
+
+
+def _init_worker(model_path, threads):
+    global _embedder
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl-C and shuts the pool down
+    _embedder = load_embedder(model_path, threads=threads)
+
+
+def embed_chunk(pairs):
+    """Runs in a pool worker: decodes a chunk and embeds it in one batch. Returns (uids, vectors, failures)."""
+    uids, tensors, failures = [], [], []
+    for uid, path in pairs:
+        try:
+            with open(path, "rb") as f:
+                tensors.append(_embedder.preprocess(f.read()))
+            uids.append(uid)
+        except (OSError, ValueError) as e:
+            failures.append((uid, path, str(e)))
+    vectors = _embedder.embed_batch(np.stack(tensors)) if tensors else np.empty((0, 0), dtype=np.float32)
+    return uids, vectors, failures
+
+
+# === DRIVER ===
+def enroll(pairs, writer, checkpoint_path=CHECKPOINT, workers=None, chunk_size=CHUNK_SIZE,
+           model_path=EMBEDDING_MODEL_PATH, commit_size=COMMIT_SIZE):
+    """
+    Embeds every (uid, image path) pair not already in the checkpoint across a process
+    pool and commits the vectors in batches of commit_size. Returns a stats dict.
+    """
+    workers = workers or os.cpu_count() or 1
+    done = load_checkpoint(checkpoint_path)
+    seen = set()
+    todo = []
+    for uid, path in pairs:
+        if uid not in done and uid not in seen:
+            seen.add(uid)
+            todo.append((uid, path))
+    skipped = len(pairs) - len(todo)
+    print(f"[INFO] {len(todo)} users to enrol ({skipped} already done or duplicated), "
+          f"{workers} workers, chunks of {chunk_size}, commits of {commit_size}")
+
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+    checkpoint = Checkpoint(checkpoint_path)
+    pending_uids, pending_vectors = [], []
+    stats = {"enrolled": 0, "failed": 0, "skipped": skipped, "commits": 0, "interrupted": False}
+    start = last_report = time.perf_counter()
+
+    def commit(n):
+        writer.commit(pending_uids[:n], pending_vectors[:n])
+        checkpoint.add(pending_uids[:n])
+        stats["enrolled"] += len(pending_uids[:n])
+        stats["commits"] += 1
+        del pending_uids[:n], pending_vectors[:n]
+
+    # Each worker runs single-threaded inference; the pool, not ONNX Runtime, provides the parallelism
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path, 1))
+    next_chunk = 0
+    running = set()
+    try:
+        while next_chunk < len(chunks) or running:
+            while next_chunk < len(chunks) and len(running) < workers * IN_FLIGHT_PER_WORKER:
+                running.add(pool.submit(embed_chunk, chunks[next_chunk]))
+                next_chunk += 1
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                uids, vectors, failures = future.result()
+                for uid, path, error in failures:
+                    print(f"❌ {uid} ({path}): {error}")
+                stats["failed"] += len(failures)
+                pending_uids.extend(uids)
+                pending_vectors.extend(vectors)
+                while len(pending_uids) >= commit_size:
+                    commit(commit_size)
+
+            now = time.perf_counter()
+            if now - last_report >= REPORT_INTERVAL:
+                last_report = now
+                processed = stats["enrolled"] + len(pending_uids) + stats["failed"]
+                rate = processed / (now - start)
+                eta = (len(todo) - processed) / rate if rate else float("inf")
+                print(f"[INFO] {processed}/{len(todo)} images, {rate:.0f} images/s, ETA {eta:.0f}s")
+        if pending_uids:
+            commit(len(pending_uids))
+    except KeyboardInterrupt:
+        # Only committed users are in the checkpoint; the uncommitted rest are redone on resume
+        print(f"[INFO] Interrupted after {stats['enrolled']} users; rerun with the same checkpoint to resume.")
+        stats["interrupted"] = True
+    finally:
+        checkpoint.close()
+        pool.shutdown(wait=True, cancel_futures=True)  # workers ignore Ctrl-C and finish their current chunk
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["images_per_second"] = round((stats["enrolled"] + stats["failed"]) / elapsed, 1) if elapsed else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enrol palm images without going through /registerPalm.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--dir", default=UPLOADS_DIR, help="Image directory: one file or one sub-directory per user.")
+    source.add_argument("--manifest", help="CSV with uid,path columns.")
+    parser.add_argument("--target", default="sqlite",
+                        help="firestore, fake[:latency seconds] or sqlite[:path] (default: palm_templates.sqlite).")
+    parser.add_argument("--checkpoint", default=CHECKPOINT, help="Progress file; rerun with the same one to resume.")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU).")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Images per batched inference call.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_PATH, help="Palm embedding model.")
+    parser.add_argument("--synthetic", type=int, help="Enrol this many synthetic users cycling through the images.")
+    args = parser.parse_args()
+
+    # Checked here, so a missing model is one clear error instead of every worker failing to start
+    if not os.path.exists(args.model) and not ALLOW_STANDIN:
+        raise SystemExit(f"Embedding model {args.model} not found (EMBEDDING_ALLOW_STANDIN=1 enrols with the stand-in)")
+
+    pairs = read_manifest(args.manifest) if args.manifest else scan_directory(args.dir)
+    if not pairs:
+        raise SystemExit("No images to enrol")
+    if args.synthetic:
+        pairs = synthetic(pairs, args.synthetic)
+
+    stats = enroll(pairs, create_writer(args.target), args.checkpoint, args.workers, args.chunk_size, args.model)
+    print(f"{'⏸️' if stats['interrupted'] else '✅'} Enrolled {stats['enrolled']} users in {stats['seconds']:.1f}s ({stats['images_per_second']:.0f} images/s), "
+          f"{stats['failed']} failed, {stats['skipped']} skipped, {stats['commits']} batched commits")
+    print("[INFO] Restart the server (or call load_palm_index) so the in-memory index picks the new users up.")
+
+
+if __name__ == "__main__":
+    main()
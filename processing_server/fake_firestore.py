@@ -0,0 +1,273 @@
+import copy
+import threading
+import time
+import uuid
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+
+# === CONFIG ===
+DEFAULT_LATENCY = 0.0  # seconds added to every simulated RPC
+
+
+class FakeFirestore:
+    """
+    In-process stand-in for the subset of the firebase_admin Firestore client the
+    main server uses: documents, subcollections, batched writes and simple
+    queries. Lets the server run and be load-tested entirely offline.
+    """
+
+    def __init__(self, latency=DEFAULT_LATENCY):
+        self.latency = latency
+        self._collections = {}  # collection path tuple -> {doc id: data}
+        self._update_times = {}  # (collection path, doc id) -> counter bumped on every write
+        self._clock = 0
+        self._lock = threading.RLock()  # re-entered by batch commits
+        self.reads = 0
+        self.writes = 0
+
+    def collection(self, name):
+        return FakeCollection(self, (name,))
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def write_option(self, last_update_time):
+        """Precondition for batch.update(): fail unless the document is unchanged since it was read."""
+        return FakeWriteOption(last_update_time)
+
+    def _rpc(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _read(self, coll_path, doc_id):
+        with self._lock:
+            self.reads += 1
+            data = self._collections.get(coll_path, {}).get(doc_id)
+            return copy.deepcopy(data) if data is not None else None
+
+    def _write(self, coll_path, doc_id, data, merge):
+        with self._lock:
+            self.writes += 1
+            docs = self._collections.setdefault(coll_path, {})
+            current = docs.get(doc_id) if merge else None
+            docs[doc_id] = _apply(copy.deepcopy(current) if current else {}, data)
+            self._clock += 1
+            self._update_times[(coll_path, doc_id)] = self._clock
+
+    def _delete(self, coll_path, doc_id):
+        with self._lock:
+            self.writes += 1
+            self._collections.get(coll_path, {}).pop(doc_id, None)
+            self._update_times.pop((coll_path, doc_id), None)
+
+    def _scan(self, coll_path):
+        with self._lock:
+            docs = list(self._collections.get(coll_path, {}).items())
+            self.reads += len(docs)
+            return [(doc_id, copy.deepcopy(data)) for doc_id, data in docs]
+
+
+def _apply(target, data):
+    """Applies a write, resolving sentinels such as SERVER_TIMESTAMP and Increment."""
+    for key, value in data.items():
+        name = type(value).__name__
+        if name == "Sentinel":  # firestore.SERVER_TIMESTAMP
+            value = time.time()
+        elif name == "Increment":
+            value = target.get(key, 0) + value.value
+        elif isinstance(value, dict):
+            value = _apply(target.get(key) if isinstance(target.get(key), dict) else {}, value)
+        target[key] = value
+    return target
+
+
+def _field(data, path):
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+class FakeWriteOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        return _field(self._data, field_path)
+
+
+class FakeDocument:
+    def __init__(self, db, coll_path, doc_id):
+        self._db = db
+        self._coll_path = coll_path
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return "/".join(self._coll_path + (self.id,))
+
+    def collection(self, name):
+        return FakeCollection(self._db, self._coll_path + (self.id, name))
+
+    @property
+    def _update_time(self):
+        return self._db._update_times.get((self._coll_path, self.id))
+
+    def get(self, field_paths=None):
+        self._db._rpc()
+        data = self._db._read(self._coll_path, self.id)
+        if data is not None and field_paths is not None:
+            data = {f: _field(data, f) for f in field_paths if _field(data, f) is not None}
+        return FakeDocumentSnapshot(self, data, self._update_time)
+
+    def set(self, data, merge=False):
+        self._db._rpc()
+        self._db._write(self._coll_path, self.id, data, merge)
+
+    def update(self, data):
+        self.set(data, merge=True)
+
+    def delete(self):
+        self._db._rpc()
+        self._db._delete(self._coll_path, self.id)
+
+
+class FakeCollection:
+    """A collection reference, which is also the root of a query."""
+
+    def __init__(self, db, path, filters=(), orders=(), limit=None, cursor=None, fields=None):
+        self._db = db
+        self._path = path
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+        self.id = path[-1]
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                     cursor=self._cursor, fields=self._fields)
+        state.update(changes)
+        return FakeCollection(self._db, self._path, **state)
+
+    def document(self, doc_id=None):
+        return FakeDocument(self._db, self._path, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return time.time(), ref
+
+    # === QUERIES ===
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        if isinstance(document_fields_or_snapshot, FakeDocumentSnapshot):
+            document_fields_or_snapshot = document_fields_or_snapshot.to_dict()
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def get(self):
+        return list(self.stream())
+
+    def stream(self):
+        self._db._rpc()
+        docs = [(doc_id, data) for doc_id, data in self._db._scan(self._path)
+                if all(_matches(_field(data, f), op, v) for f, op, v in self._filters)]
+        for field_path, direction in reversed(self._orders):
+            docs = [d for d in docs if _field(d[1], field_path) is not None]
+            docs.sort(key=lambda d: _field(d[1], field_path), reverse=direction == "DESCENDING")
+        if self._cursor is not None and self._orders:
+            docs = [d for d in docs if _after(d[1], self._cursor, self._orders)]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        for doc_id, data in docs:
+            if self._fields is not None:
+                data = {f: _field(data, f) for f in self._fields if _field(data, f) is not None}
+            ref = self.document(doc_id)
+            yield FakeDocumentSnapshot(ref, data, ref._update_time)
+
+
+def _matches(actual, op, expected):
+    if op == "==":
+        return actual == expected
+    if op == "in":
+        return actual in expected
+    if actual is None:
+        return False
+    return {"<": actual < expected, "<=": actual <= expected,
+            ">": actual > expected, ">=": actual >= expected}[op]
+
+
+def _after(data, cursor, orders):
+    """True when data sorts strictly after the cursor values under the query's ordering."""
+    for field_path, direction in orders:
+        a, b = _field(data, field_path), _field(cursor, field_path)
+        if a == b:
+            continue
+        return a < b if direction == "DESCENDING" else a > b
+    return False
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def create(self, reference, data):
+        self._ops.append(("create", reference, data, False, None))
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(("set", reference, data, merge, None))
+
+    def update(self, reference, data, option=None):
+        self._ops.append(("set", reference, data, True, option))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference, None, False, None))
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        self._db._rpc()
+        with self._db._lock:  # all or nothing, like a real batch
+            for op, ref, _, _, option in self._ops:
+                if op == "create" and ref.id in self._db._collections.get(ref._coll_path, {}):
+                    self._ops = []
+                    raise AlreadyExists(f"Document already exists: {ref.path}")
+                if option is not None and ref._update_time != option.last_update_time:
+                    self._ops = []
+                    raise FailedPrecondition(f"Document changed since it was read: {ref.path}")
+            for op, ref, data, merge, _ in self._ops:
+                if op == "delete":
+                    self._db._delete(ref._coll_path, ref.id)
+                else:
+                    self._db._write(ref._coll_path, ref.id, data, merge)
+        self._ops = []
@@ -0,0 +1,48 @@
+import hashlib
+import os
+import shutil
+import sys
+import urllib.request
+
+from palm_embedder import EMBEDDING_MODEL_PATH
+
+# === CONFIG ===
+# The palm embedding model is not in the repo; the deploy build downloads it from here
+EMBEDDING_MODEL_URL = os.getenv("EMBEDDING_MODEL_URL")
+EMBEDDING_MODEL_SHA256 = os.getenv("EMBEDDING_MODEL_SHA256")  # optional, checked when set
+DOWNLOAD_TIMEOUT = 120  # seconds
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch(url=EMBEDDING_MODEL_URL, path=EMBEDDING_MODEL_PATH, sha256=EMBEDDING_MODEL_SHA256):
+    """
+    Makes sure the embedding model is at path, downloading it from url if needed.
+    Raises SystemExit when there is no model and nowhere to get it from, so the
+    build fails instead of deploying a server that can't start.
+    """
+    if os.path.exists(path) and (not sha256 or sha256_of(path) == sha256):
+        print(f"✅ Embedding model already at {path}")
+        return
+    if not url:
+        raise SystemExit(f"{path} is missing and EMBEDDING_MODEL_URL is not set")
+
+    print(f"Downloading the embedding model from {url}...")
+    partial = f"{path}.part"
+    with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response, open(partial, "wb") as f:
+        shutil.copyfileobj(response, f)
+    if sha256 and sha256_of(partial) != sha256:
+        os.remove(partial)
+        raise SystemExit(f"Downloaded model does not match EMBEDDING_MODEL_SHA256 ({sha256})")
+    os.replace(partial, path)  # never leave a half-written model where the server looks for it
+    print(f"✅ Embedding model saved to {path} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    fetch(*sys.argv[1:2])
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# === CONFIG ===
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))  # seconds
+IDEMPOTENCY_IN_FLIGHT_TIMEOUT = float(os.getenv("IDEMPOTENCY_IN_FLIGHT_TIMEOUT", "60"))  # seconds a reservation holds a key
+MAX_KEY_LENGTH = 128
+
+# Answer to a retry that arrives while the first request with its key is still being processed
+IN_PROGRESS = ({"error": f"A request with this {IDEMPOTENCY_HEADER} is still being processed"}, 409)
+
+_NAMESPACE = uuid.UUID("6f1c1a4e-2b8d-4d55-9a57-3c1f0b7d9e21")
+
+
+def transaction_id_for(key):
+    """Fixed transaction ID for an idempotency key, so a replayed payment overwrites its own document."""
+    return uuid.uuid5(_NAMESPACE, key).hex
+
+
+class IdempotencyCache:
+    """
+    Bounded cache of responses by Idempotency-Key, with a TTL.
+    A retried request with a key the server already answered gets the same body and
+    status back without being processed again. Only successful responses are kept,
+    so a request that failed can be retried for real. Entries are per process; the
+    fixed transaction ID from transaction_id_for() still stops a retry that lands on
+    another worker (or after a restart) from writing a second transaction.
+
+    reserve() claims a key before the request is processed, so a concurrent retry
+    gets IN_PROGRESS instead of being processed a second time alongside it.
+    """
+
+    def __init__(self, max_size=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, body, status); status None while reserved
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "stored": 0, "reserved": 0, "in_progress": 0}
+
+    def _live_entry(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _set(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Returns (body, status) stored for key, or None."""
+        with self._lock:
+            entry = self._live_entry(key, time.monotonic())
+            if entry is None or entry[2] is None:
+                return None
+            self._counters["hits"] += 1
+            return entry[1], entry[2]
+
+    def reserve(self, key, timeout=IDEMPOTENCY_IN_FLIGHT_TIMEOUT):
+        """
+        Returns the stored (body, status) for key, IN_PROGRESS if another request holds
+        it, or None once the caller holds it. The holder must put() or release() the key;
+        a reservation nobody settles lapses after timeout seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live_entry(key, now)
+            if entry is None:
+                self._set(key, (now + timeout, None, None))
+                self._counters["reserved"] += 1
+                return None
+            if entry[2] is None:
+                self._counters["in_progress"] += 1
+                return IN_PROGRESS
+            self._counters["hits"] += 1
+            return entry[1], entry[2]
+
+    def release(self, key):
+        """Drops a reservation that ended without a stored response; a stored response is kept."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is None:
+                del self._entries[key]
+
+    def put(self, key, body, status):
+        if status >= 300:
+            self.release(key)
+            return
+        with self._lock:
+            self._set(key, (time.monotonic() + self.ttl, body, status))
+            self._counters["stored"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, size=len(self._entries))
@@ -0,0 +1,93 @@
+import json
+import threading
+
+import requests
+
+import load_test
+from idempotency import IN_PROGRESS, IdempotencyCache
+
+# Checks that a payment retried with the same Idempotency-Key while the first attempt is
+# still running is not recorded twice.
+# Run from processing_server: python idempotency_test.py (or pytest idempotency_test.py)
+
+# === CONFIG ===
+PAYMENT = {"merchant": "Tesco", "amount": "12.50"}
+
+
+def test_reserve_put_release():
+    cache = IdempotencyCache()
+    assert cache.reserve("key-1") is None             # the first request holds the key
+    assert cache.reserve("key-1") == IN_PROGRESS      # a concurrent retry is turned away
+    assert cache.get("key-1") is None                 # nothing to replay yet
+
+    cache.put("key-1", {"transaction_id": "t1"}, 200)
+    cache.release("key-1")                            # settling again keeps the stored response
+    assert cache.reserve("key-1") == ({"transaction_id": "t1"}, 200)
+
+    # A failed attempt frees the key so the retry is processed for real
+    assert cache.reserve("key-2") is None
+    cache.put("key-2", {"error": "Palm not recognised"}, 404)
+    assert cache.reserve("key-2") is None
+    cache.release("key-2")
+    assert cache.get("key-2") is None
+
+    # A reservation nobody settles lapses
+    assert cache.reserve("key-3", timeout=0) is None
+    assert cache.reserve("key-3") is None
+
+
+def test_concurrent_retries_record_once():
+    base_url, db = load_test.start_local_server()
+    import pc_image_receiver as server
+
+    images = load_test.load_images()[:1]
+    load_test.enrol(base_url, images, db)
+    name, image = images[0]
+
+    # Hold the first request inside the embedding until the retry has been answered
+    first_started, retry_answered = threading.Event(), threading.Event()
+    generate_vector, record_payment = server.GenerateVector, server.record_payment
+    recorded = []
+
+    def slow_generate_vector(data):
+        if not first_started.is_set():
+            first_started.set()
+            retry_answered.wait(10)
+        return generate_vector(data)
+
+    def counting_record_payment(*args, **kwargs):
+        recorded.append(args)
+        return record_payment(*args, **kwargs)
+
+    def scan(responses):
+        responses.append(requests.post(f"{base_url}/scanPalm", data={"token": json.dumps(PAYMENT)},
+                                       files={"image": (name, image, "image/jpeg")},
+                                       headers={"Idempotency-Key": "retried-payment"}, timeout=30))
+
+    server.GenerateVector, server.record_payment = slow_generate_vector, counting_record_payment
+    try:
+        first_responses, retry_responses = [], []
+        first = threading.Thread(target=scan, args=(first_responses,))
+        first.start()
+        assert first_started.wait(10)
+        scan(retry_responses)
+        retry_answered.set()
+        first.join(30)
+    finally:
+        server.GenerateVector, server.record_payment = generate_vector, record_payment
+
+    assert retry_responses[0].status_code == 409, retry_responses[0].text
+    assert first_responses[0].status_code == 200, first_responses[0].text
+    assert len(recorded) == 1
+
+    # Once the first attempt has finished, a retry replays its answer
+    replay = []
+    scan(replay)
+    assert replay[0].json() == first_responses[0].json()
+    assert len(recorded) == 1
+
+
+if __name__ == "__main__":
+    test_reserve_put_release()
+    test_concurrent_retries_record_once()
+    print("✅ A concurrent retry with the same Idempotency-Key is not recorded twice")
@@ -0,0 +1,266 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+from server_test import MERCHANTS
+from fake_firestore import FakeFirestore
+
+# === CONFIG ===
+UPLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
+DEFAULT_CONCURRENCY = 8
+DEFAULT_REQUESTS = 500
+WARMUP_REQUESTS = 20
+HOST = "127.0.0.1"
+
+
+# === LOCAL SERVER ===
+def start_local_server(firestore_latency=0.0, port=0, asgi=False):
+    """
+    Imports pc_image_receiver with Firestore swapped for an in-process fake and
+    serves its app on a background thread (async_app under Hypercorn with asgi=True).
+    Returns (base_url, fake db).
+    """
+    # No embedding model is shipped with the repo; identical images still match on the stand-in
+    os.environ.setdefault("EMBEDDING_ALLOW_STANDIN", "1")
+    # Transactions go to an in-memory backend through a throwaway journal
+    os.environ.setdefault("TRANSACTION_BACKEND", "memory")
+    os.environ.setdefault("TRANSACTION_JOURNAL", os.path.join(tempfile.mkdtemp(), "transactions.journal"))
+    import pc_image_receiver
+
+    db = FakeFirestore(latency=firestore_latency)
+    pc_image_receiver.init_services(db)
+    if asgi:
+        return _serve_asgi(port), db
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no access log line per request
+    server = make_server(HOST, port, pc_image_receiver.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="load-test-server", daemon=True).start()
+    return f"http://{HOST}:{server.server_port}", db
+
+
+def _serve_asgi(port):
+    import asyncio
+    import socket
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+    import async_app
+
+    async_app.init_async_services(None)  # blocking fake Firestore calls go through the executor
+    if not port:
+        with socket.socket() as s:
+            s.bind((HOST, 0))
+            port = s.getsockname()[1]
+    config = Config()
+    config.bind = [f"{HOST}:{port}"]
+    config.accesslog = None
+
+    async def run():
+        await serve(async_app.app, config, shutdown_trigger=asyncio.Event().wait)  # until the process exits
+
+    threading.Thread(target=asyncio.run, args=(run(),), name="load-test-server", daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return f"http://{HOST}:{port}"
+
+
+def load_images():
+    paths = sorted(glob.glob(os.path.join(UPLOADS_DIR, "*.jpg")))
+    if not paths:
+        raise SystemExit(f"No sample images found in {UPLOADS_DIR}")
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append((os.path.basename(path), f.read()))
+    return images
+
+
+def enrol(base_url, images, db=None):
+    """Registers one user per sample image, with a linked default account when db is the fake."""
+    uids = []
+    for i, (name, data) in enumerate(images):
+        uid = f"loadtest-user-{i}"
+        if db is not None:
+            db.collection("users").document(uid).set({"default_acc": f"acc-{i}"}, merge=True)
+        r = requests.post(f"{base_url}/registerPalm", data={"token": uid},
+                          files={"image": (name, data, "image/jpeg")})
+        if r.status_code != 200:
+            raise SystemExit(f"Enrolment of {name} failed: {r.status_code} {r.text}")
+        uids.append(uid)
+    return uids
+
+
+# === REQUESTS ===
+_local = threading.local()
+
+
+def _session():
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def make_sender(base_url, images, mix):
+    """
+    Returns send(i) -> (endpoint, status). mix is the fraction of /registerPalm
+    requests; the rest are /scanPalm payments with a random merchant and amount.
+    """
+    def send(i):
+        rng = random.Random(i)
+        name, data = images[i % len(images)]
+        files = {"image": (name, data, "image/jpeg")}
+        if rng.random() < mix:
+            endpoint = "registerPalm"
+            form = {"token": f"loadtest-user-{i % len(images)}"}
+        else:
+            endpoint = "scanPalm"
+            form = {"token": json.dumps({"merchant": rng.choice(MERCHANTS),
+                                         "amount": round(rng.uniform(1.5, 50.0), 2)})}
+        try:
+            r = _session().post(f"{base_url}/{endpoint}", data=form, files=files, timeout=30)
+            return endpoint, r.status_code
+        except requests.exceptions.RequestException as e:
+            return endpoint, type(e).__name__
+    return send
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {}  # endpoint -> list of ms
+        self.statuses = {}   # endpoint -> Counter of status code or exception name
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, status, latency_ms):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(latency_ms)
+            self.statuses.setdefault(endpoint, Counter())[status] += 1
+
+
+# === DRIVERS ===
+def closed_loop(send, concurrency, total, duration):
+    """concurrency workers each send their next request as soon as the previous one returns."""
+    results = Results()
+    counter = iter(range(total if total else 1 << 62))
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def worker():
+        while deadline is None or time.perf_counter() < deadline:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            endpoint, status = send(i)
+            results.add(endpoint, status, (time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - start
+
+
+def open_loop(send, rate, total, duration, max_in_flight):
+    """
+    Requests arrive on a fixed schedule of rate per second whether or not earlier
+    ones have finished. Latency is measured from the scheduled arrival, so time
+    spent queued behind a saturated server is counted.
+    """
+    results = Results()
+    n = total if total else int(rate * duration)
+    if duration:
+        n = min(n, int(rate * duration))
+    interval = 1.0 / rate
+
+    def fire(i, scheduled):
+        endpoint, status = send(i)
+        results.add(endpoint, status, (time.perf_counter() - scheduled) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for i in range(n):
+            scheduled = start + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, i, scheduled)
+    return results, time.perf_counter() - start
+
+
+# === REPORT ===
+def percentile(values, p):
+    return sorted(values)[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(results, elapsed):
+    total = sum(len(v) for v in results.latencies.values())
+    print(f"\n{total} requests in {elapsed:.2f}s -> {total / elapsed:.1f} req/s")
+    print(f"{'endpoint':<14}{'count':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>9}")
+    for endpoint in sorted(results.latencies):
+        lat = results.latencies[endpoint]
+        statuses = results.statuses[endpoint]
+        errors = sum(c for s, c in statuses.items() if s != 200)
+        print(f"{endpoint:<14}{len(lat):>7}{len(lat) / elapsed:>9.1f}{percentile(lat, 0.50):>9.1f}"
+              f"{percentile(lat, 0.95):>9.1f}{percentile(lat, 0.99):>9.1f}{max(lat):>9.1f}"
+              f"{errors / len(lat):>8.1%}")
+        print(f"{'':<14}statuses: {dict(statuses)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /registerPalm and /scanPalm.")
+    parser.add_argument("--target", help="Base URL of a running server. Default: a local app on a fake Firestore.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Closed-loop workers, or the in-flight cap with --rate.")
+    parser.add_argument("--rate", type=float, help="Open-loop arrival rate in requests per second.")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Total requests (0 = until --duration).")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds.")
+    parser.add_argument("--mix", type=float, default=0.0, help="Fraction of requests sent to /registerPalm.")
+    parser.add_argument("--firestore-latency", type=float, default=0.0,
+                        help="Seconds added to every fake Firestore call.")
+    parser.add_argument("--asgi", action="store_true", help="Serve the local instance with async_app instead.")
+    args = parser.parse_args()
+
+    images = load_images()
+    db = None
+    if args.target:
+        base_url = args.target.rstrip("/")
+    else:
+        base_url, db = start_local_server(args.firestore_latency, asgi=args.asgi)
+        print(f"Local {'ASGI' if args.asgi else 'WSGI'} server on {base_url} (fake Firestore, {args.firestore_latency * 1000:.0f} ms per call)")
+
+    print(f"Enrolling {len(images)} sample palms...")
+    enrol(base_url, images, db)
+
+    send = make_sender(base_url, images, args.mix)
+    for i in range(WARMUP_REQUESTS):
+        send(i)
+
+    total = args.requests if not (args.duration and args.requests == DEFAULT_REQUESTS) else 0
+    if args.rate:
+        print(f"Open loop: {args.rate:g} req/s, up to {args.concurrency} in flight")
+        results, elapsed = open_loop(send, args.rate, total, args.duration, args.concurrency)
+    else:
+        print(f"Closed loop: {args.concurrency} concurrent clients")
+        results, elapsed = closed_loop(send, args.concurrency, total, args.duration)
+    report(results, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import bisect
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# pi_code and processing_server are deployed separately, so each carries this module.
+# Keep the two copies identical: processing_server/metrics_test.py fails when they drift.
+
+# === CONFIG ===
+REQUEST_ID_HEADER = "X-Request-ID"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # seconds
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"  # Prometheus text exposition format
+UNMATCHED_ENDPOINT = "unmatched"  # label for requests that matched no route
+
+
+def endpoint_label(url_rule):
+    """
+    The endpoint label for a request: its route pattern (/transactions/<uid>), not the
+    path, so per-user URLs and random 404 paths can't grow the number of series.
+    """
+    return url_rule.rule if url_rule is not None else UNMATCHED_ENDPOINT
+
+
+class Histogram:
+    """Cumulative latency histogram with fixed buckets, in the Prometheus style."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class RequestTrace:
+    """Per-request stage timings, keyed by stage name: [total seconds, calls]."""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def server_timing(self):
+        """Stage totals as a Server-Timing header value."""
+        return ", ".join(f"{stage};dur={total * 1000:.1f}" for stage, (total, _) in self.stages.items())
+
+    def summary(self):
+        parts = []
+        for stage, (total, calls) in self.stages.items():
+            parts.append(f"{stage}={total * 1000:.1f}ms" + (f" (x{calls})" if calls > 1 else ""))
+        return " ".join(parts)
+
+
+_current = contextvars.ContextVar("request_trace", default=None)
+
+
+class Metrics:
+    """
+    Stage and request latency histograms for one process, served on /metrics.
+
+    Code times a stage with `with metrics.stage("palm_detect"):`. Each observation
+    goes into that stage's histogram and, inside a request, into the request's
+    trace, which is printed with the request ID when the request finishes. The
+    request ID comes from the X-Request-ID header (or is generated) and is passed
+    on to the next hop so both processes log the same ID.
+
+    Counts are per process; with several gunicorn workers each reports its own.
+    """
+
+    def __init__(self, process):
+        self.process = process
+        self._stages = {}
+        self._requests = {}  # (endpoint, status) -> Histogram
+        self._lock = threading.Lock()
+
+    # === TIMING ===
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = Histogram()
+            histogram.observe(seconds)
+        trace = _current.get()
+        if trace is not None:
+            trace.add(name, seconds)
+
+    def timed(self, name, fn):
+        """Wraps fn so every call is timed as stage name."""
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    # === REQUESTS ===
+    def begin_request(self, request_id=None):
+        trace = RequestTrace(request_id or uuid.uuid4().hex[:16])
+        _current.set(trace)
+        return trace
+
+    def current_request_id(self):
+        trace = _current.get()
+        return trace.request_id if trace is not None else None
+
+    def request_headers(self):
+        """Headers that carry the current request ID to the next hop."""
+        request_id = self.current_request_id()
+        return {REQUEST_ID_HEADER: request_id} if request_id else {}
+
+    def finish_request(self, endpoint, status):
+        """Records the request's total latency, logs its breakdown and returns the response headers to add."""
+        trace = _current.get()
+        if trace is None:
+            return {}
+        _current.set(None)
+        elapsed = time.perf_counter() - trace.started
+        with self._lock:
+            key = (endpoint, str(status))
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = Histogram()
+            histogram.observe(elapsed)
+        if trace.stages:
+            print(f"[{self.process}] request {trace.request_id} {endpoint} {status} "
+                  f"in {elapsed * 1000:.1f}ms: {trace.summary()}")
+        headers = {REQUEST_ID_HEADER: trace.request_id}
+        if trace.stages:
+            headers["Server-Timing"] = trace.server_timing()
+        return headers
+
+    # === EXPOSITION ===
+    def render(self):
+        """Prometheus text exposition of every histogram."""
+        lines = []
+        with self._lock:
+            self._render_family(lines, "paypalm_stage_seconds", "Latency of one pipeline stage.",
+                                [({"stage": name}, h) for name, h in sorted(self._stages.items())])
+            self._render_family(lines, "paypalm_request_seconds", "End-to-end latency of an HTTP request.",
+                                [({"endpoint": e, "status": s}, h) for (e, s), h in sorted(self._requests.items())])
+        return "\n".join(lines) + "\n"
+
+    def _render_family(self, lines, name, help_text, series):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series:
+            base = ",".join([f'process="{self.process}"'] + [f'{k}="{v}"' for k, v in labels.items()])
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{base}}} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{{{base}}} {histogram.count}")
@@ -0,0 +1,19 @@
+import os
+
+import metrics
+
+# The Pi and the main server each ship a copy of metrics.py; this fails when they drift.
+# Run from processing_server: python metrics_test.py (or pytest metrics_test.py)
+
+# === CONFIG ===
+PI_METRICS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pi_code", "metrics.py")
+
+
+def test_pi_copy_matches():
+    with open(metrics.__file__, "rb") as ours, open(PI_METRICS, "rb") as pi:
+        assert ours.read() == pi.read(), "pi_code/metrics.py and processing_server/metrics.py differ"
+
+
+if __name__ == "__main__":
+    test_pi_copy_matches()
+    print("✅ pi_code and processing_server carry the same metrics.py")
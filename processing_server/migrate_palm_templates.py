@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import time
+
+import palm_template
+from palm_index import EMBEDDING_DIM
+from transaction_store import MAX_BATCH_SIZE
+
+
+def migrate(db, codec=palm_template.TEMPLATE_CODEC, batch_size=MAX_BATCH_SIZE, dry_run=False, collection="users"):
+    """
+    Rewrites every legacy palmHash (a list of floats) as a binary template, in batched
+    updates. Documents that already hold a template are left alone, so the migration
+    can be stopped and rerun at any time. Each update only applies if the document is
+    unchanged since it was read, so a user who re-registers while the migration runs
+    keeps their new palm: a batch that fails the precondition is retried one document
+    at a time and the changed ones are counted as skipped.
+    """
+    from google.api_core.exceptions import FailedPrecondition
+
+    stats = {"migrated": 0, "already_binary": 0, "invalid": 0, "skipped": 0, "bytes_before": 0, "bytes_after": 0}
+    pending = []  # (snapshot, template) of the current batch
+
+    def update(batch, doc, template):
+        batch.update(doc.reference, {"palmHash": template},
+                     option=db.write_option(last_update_time=doc.update_time))
+
+    def migrated(doc, template):
+        stats["migrated"] += 1
+        stats["bytes_before"] += len(doc.get("palmHash")) * 8  # Firestore stores each array element as a double
+        stats["bytes_after"] += len(template)
+
+    def commit():
+        if not pending:
+            return
+        batch = db.batch()
+        for doc, template in pending:
+            update(batch, doc, template)
+        try:
+            if not dry_run:
+                batch.commit()
+            for doc, template in pending:
+                migrated(doc, template)
+        except FailedPrecondition:
+            for doc, template in pending:
+                single = db.batch()
+                update(single, doc, template)
+                try:
+                    single.commit()
+                    migrated(doc, template)
+                except FailedPrecondition:
+                    print(f"Skipping {doc.id}: palmHash changed since it was read")
+                    stats["skipped"] += 1
+        pending.clear()
+
+    for doc in db.collection(collection).select(["palmHash"]).stream():
+        value = (doc.to_dict() or {}).get("palmHash")
+        if value is None:
+            continue
+        if palm_template.is_template(value):
+            stats["already_binary"] += 1
+            continue
+        if len(value) != EMBEDDING_DIM:
+            stats["invalid"] += 1
+            continue
+        pending.append((doc, palm_template.encode(value, codec=codec)))
+        if len(pending) >= batch_size:
+            commit()
+    commit()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert legacy palmHash float arrays to binary templates.")
+    parser.add_argument("--codec", default=palm_template.TEMPLATE_CODEC, choices=sorted(palm_template.CODECS))
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing.")
+    args = parser.parse_args()
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    firebase_admin.initialize_app(credentials.Certificate(json.loads(os.environ["FIREBASE_CREDS"])))
+
+    start = time.perf_counter()
+    stats = migrate(firestore.client(), args.codec, dry_run=args.dry_run)
+    saved = 1 - stats["bytes_after"] / stats["bytes_before"] if stats["bytes_before"] else 0.0
+    print(f"{'[DRY RUN] ' if args.dry_run else ''}✅ {stats['migrated']} templates migrated to {args.codec} "
+          f"in {time.perf_counter() - start:.1f}s ({saved:.0%} smaller), {stats['already_binary']} already binary, "
+          f"{stats['invalid']} with the wrong dimension left alone, {stats['skipped']} changed while migrating")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import numpy as np
+
+import migrate_palm_templates
+import palm_template
+from fake_firestore import FakeCollection, FakeFirestore
+
+# Runs the palmHash migration on the fake Firestore.
+# Run from processing_server: python migrate_palm_templates_test.py (or pytest)
+
+
+def seed_legacy_users(db, n, rng):
+    for i in range(n):
+        db.collection("users").document(f"user-{i}").set({"palmHash": rng.standard_normal(128).tolist(),
+                                                          "default_acc": f"acc-{i}"})
+
+
+def palm(db, uid):
+    return db.collection("users").document(uid).get().to_dict()["palmHash"]
+
+
+def test_migrates_legacy_arrays_and_is_rerunnable():
+    db = FakeFirestore()
+    seed_legacy_users(db, 5, np.random.default_rng(0))
+    stats = migrate_palm_templates.migrate(db, batch_size=2)
+    assert (stats["migrated"], stats["skipped"]) == (5, 0)
+    assert all(palm_template.is_template(palm(db, f"user-{i}")) for i in range(5))
+    assert migrate_palm_templates.migrate(db)["already_binary"] == 5
+
+
+def test_reregistration_during_migration_is_kept():
+    rng = np.random.default_rng(1)
+    db = FakeFirestore()
+    seed_legacy_users(db, 5, rng)
+    new_template = palm_template.encode(rng.standard_normal(128).astype(np.float32))
+
+    # user-2 registers again after the migration read their old palm, before its batch commits
+    stream = FakeCollection.stream
+    def racing_stream(self):
+        for doc in stream(self):
+            yield doc
+            if doc.id == "user-2":
+                db.collection("users").document("user-2").set({"palmHash": new_template}, merge=True)
+    FakeCollection.stream = racing_stream
+    try:
+        stats = migrate_palm_templates.migrate(db)
+    finally:
+        FakeCollection.stream = stream
+
+    assert (stats["migrated"], stats["skipped"]) == (4, 1)
+    assert palm(db, "user-2") == new_template
+    assert all(palm_template.is_template(palm(db, f"user-{i}")) for i in range(5))
+
+
+if __name__ == "__main__":
+    test_migrates_legacy_arrays_and_is_rerunnable()
+    test_reregistration_during_migration_is_kept()
+    print("✅ Migration keeps palms re-registered while it runs")
@@ -0,0 +1,177 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import cv2
+import numpy as np
+
+# === CONFIG ===
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "palm_embedding.onnx")
+EMBEDDING_DIM = 128
+# Without the model, refuse to start unless this is set: the projection stand-in matches
+# identical images only, which is fine for offline tests and benchmarks but not for payments
+ALLOW_STANDIN = os.getenv("EMBEDDING_ALLOW_STANDIN") == "1"
+EMBED_INPUT_SIZE = 112          # used when the model input has no fixed spatial size
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", os.cpu_count() or 1))
+MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH", "16"))
+MAX_BATCH_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+DECODE_FLAGS = cv2.IMREAD_REDUCED_COLOR_2  # let libjpeg decode at half resolution
+PIXEL_MEAN = 127.5
+PIXEL_SCALE = 1 / 128.0
+
+
+def optimized_model_path(model_path):
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.opt{ext}"
+
+
+def create_session(model_path=EMBEDDING_MODEL_PATH, threads=EMBED_THREADS):
+    """
+    Creates a tuned ONNX Runtime session.
+    The first load runs the graph optimisations and saves the result next to the
+    model; later loads (other workers, restarts) read the saved graph directly.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+
+    optimized_path = optimized_model_path(model_path)
+    if os.path.exists(optimized_path) and os.path.getmtime(optimized_path) >= os.path.getmtime(model_path):
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        path = optimized_path
+    else:
+        # EXTENDED rather than ALL: the saved graph must not carry CPU-specific layout transforms
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        options.optimized_model_filepath = optimized_path
+        path = model_path
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class _OnnxModel:
+    """Runs the palm embedding network on NCHW float32 batches."""
+
+    def __init__(self, session):
+        self.session = session
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        _, _, h, w = model_input.shape
+        self.input_size = (w if isinstance(w, int) else EMBED_INPUT_SIZE,
+                           h if isinstance(h, int) else EMBED_INPUT_SIZE)
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+
+    def run(self, batch):
+        if self.dynamic_batch:
+            return self.session.run(None, {self.input_name: batch})[0]
+        return np.concatenate([self.session.run(None, {self.input_name: item[None]})[0] for item in batch])
+
+
+class _ProjectionModel:
+    """
+    Stand-in for offline runs without the ONNX model (EMBEDDING_ALLOW_STANDIN=1): a
+    fixed random projection of the normalised image. Identical captures map to identical vectors, so enrolment and
+    identification still work end to end, but it is not a biometric model.
+    """
+
+    def __init__(self, input_size=32, seed=1234):
+        self.input_size = (input_size, input_size)
+        rng = np.random.default_rng(seed)
+        self.projection = rng.standard_normal((3 * input_size * input_size, EMBEDDING_DIM)).astype(np.float32)
+        self.dynamic_batch = True
+
+    def run(self, batch):
+        return batch.reshape(len(batch), -1) @ self.projection
+
+
+class PalmEmbedder:
+    """
+    Turns uploaded palm JPEGs into L2-normalised 128-d embeddings.
+
+    Decoding and preprocessing run on the calling request thread; inference goes
+    through a micro-batcher so concurrent requests share one batched session.run.
+    That needs several requests in flight in one process (async_app, or threaded
+    workers): a sync worker serves one request at a time, so its batches are always 1.
+    """
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._batch_loop, name="embed-batcher", daemon=True)
+        self._worker.start()
+
+    # === PREPROCESSING ===
+    def preprocess(self, image_bytes):
+        """Decodes a JPEG at reduced resolution, centre-crops, resizes and normalises to CHW float32."""
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), DECODE_FLAGS)
+        if image is None:
+            raise ValueError("Could not decode image")
+        h, w = image.shape[:2]
+        side = min(h, w)
+        top, left = (h - side) // 2, (w - side) // 2
+        crop = image[top:top + side, left:left + side]
+        resized = cv2.resize(crop, self.model.input_size, interpolation=cv2.INTER_AREA)
+        rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+        tensor = (rgb.astype(np.float32) - PIXEL_MEAN) * PIXEL_SCALE
+        return np.ascontiguousarray(tensor.transpose(2, 0, 1))
+
+    # === INFERENCE ===
+    def embed(self, image_bytes):
+        """Returns the embedding for one image, blocking until its batch has run."""
+        return self.submit(self.preprocess(image_bytes)).result()
+
+    def submit(self, tensor):
+        future = Future()
+        self._queue.put((tensor, future))
+        return future
+
+    def embed_batch(self, tensors):
+        """Runs inference directly on a stacked [N, 3, H, W] batch."""
+        embeddings = np.asarray(self.model.run(tensors), dtype=np.float32).reshape(len(tensors), -1)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+    def _batch_loop(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                embeddings = self.embed_batch(np.stack([tensor for tensor, _ in items]))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(items, embeddings):
+                future.set_result(embedding)
+
+
+def load_embedder(model_path=EMBEDDING_MODEL_PATH, threads=EMBED_THREADS):
+    """
+    Creates the per-worker embedder. A missing model raises FileNotFoundError unless
+    EMBEDDING_ALLOW_STANDIN=1, which uses the projection stand-in instead.
+    """
+    if os.path.exists(model_path):
+        print(f"Loading palm embedding model from {model_path}...")
+        return PalmEmbedder(_OnnxModel(create_session(model_path, threads=threads)))
+    if not ALLOW_STANDIN:
+        raise FileNotFoundError(f"Embedding model {model_path} not found. Deploy it, or set "
+                                f"EMBEDDING_ALLOW_STANDIN=1 for an offline run on the projection stand-in.")
+    print("!" * 72)
+    print(f"WARNING: embedding model {model_path} not found; EMBEDDING_ALLOW_STANDIN=1 is set,")
+    print("so palms are embedded with the projection STAND-IN. It only matches identical")
+    print("images and is NOT a biometric model. Never serve payments with it.")
+    print("!" * 72)
+    return PalmEmbedder(_ProjectionModel())
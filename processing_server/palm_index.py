@@ -0,0 +1,305 @@
+import threading
+import numpy as np
+import palm_template
+
+# === CONFIG ===
+EMBEDDING_DIM = 128
+AUTO_IVF_MIN_USERS = 100_000  # below this a flat scan is already sub-millisecond
+MIN_POINTS_PER_LIST = 39      # fewer training points than this per list gives poor centroids
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+ASSIGN_CHUNK = 65536          # rows per block when assigning vectors to centroids
+
+
+class _Shard:
+    """A growable, contiguous block of gallery vectors and their user IDs."""
+
+    def __init__(self, dim, capacity=1024):
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.sq_norms = np.empty(capacity, dtype=np.float32)
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, uid, vector):
+        row = len(self.ids)
+        if row == self.vectors.shape[0]:
+            self._grow(row * 2)
+        self.vectors[row] = vector
+        self.sq_norms[row] = vector @ vector
+        self.ids.append(uid)
+        return row
+
+    def extend(self, ids, vectors):
+        start = len(self.ids)
+        end = start + len(ids)
+        if end > self.vectors.shape[0]:
+            self._grow(max(end, start * 2))
+        self.vectors[start:end] = vectors
+        self.sq_norms[start:end] = np.einsum("ij,ij->i", vectors, vectors)
+        self.ids.extend(ids)
+
+    def remove(self, row):
+        """Swap-removes a row. Returns the user ID that moved into `row`, if any."""
+        last = len(self.ids) - 1
+        moved = None
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.sq_norms[row] = self.sq_norms[last]
+            self.ids[row] = self.ids[last]
+            moved = self.ids[row]
+        self.ids.pop()
+        return moved
+
+    def _grow(self, capacity):
+        vectors = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        n = len(self.ids)
+        vectors[:n] = self.vectors[:n]
+        sq_norms[:n] = self.sq_norms[:n]
+        self.vectors, self.sq_norms = vectors, sq_norms
+
+
+class PalmIndex:
+    """
+    In-memory 1:N palm identification index.
+
+    Enrolled palmHash vectors are kept in contiguous float32 matrices so that a
+    query is answered with one matrix-vector product per shard. With n_lists=1
+    the whole gallery is a single shard (exact flat search). With n_lists>1 the
+    gallery is IVF-partitioned: vectors are assigned to their nearest k-means
+    centroid and a query only scans the n_probe closest partitions.
+
+    metric="cosine" scores are similarities (higher is better);
+    metric="l2" scores are squared distances (lower is better).
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, metric="cosine", n_lists=None, n_probe=16):
+        if metric not in ("cosine", "l2"):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.dim = dim
+        self.metric = metric
+        self.n_lists = n_lists  # None picks flat or IVF automatically in build()
+        self.n_probe = n_probe
+        self._centroids = None
+        self._centroid_sq_norms = None
+        self._shards = [_Shard(dim)]
+        self._locations = {}  # uid -> (shard number, row)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, uid):
+        return uid in self._locations
+
+    # === BUILD / UPDATE ===
+    def build(self, ids, vectors):
+        """
+        Replaces the index contents with the given gallery in one bulk load.
+        A uid listed more than once keeps its last vector, as if added in order.
+        """
+        vectors = self._prepare(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length")
+        last_row = {uid: row for row, uid in enumerate(ids)}
+        if len(last_row) < len(ids):
+            rows = np.fromiter(last_row.values(), dtype=np.int64, count=len(last_row))
+            ids, vectors = list(last_row), vectors[rows]
+
+        n_lists = self.n_lists
+        if n_lists is None:
+            n_lists = 1 if len(ids) < AUTO_IVF_MIN_USERS else int(np.sqrt(len(ids)))
+        n_lists = max(1, min(n_lists, len(ids) // MIN_POINTS_PER_LIST))
+
+        with self._lock:
+            if n_lists == 1:
+                self._centroids = self._centroid_sq_norms = None
+                assignments = np.zeros(len(ids), dtype=np.int64)
+            else:
+                self._set_centroids(self._train_centroids(vectors, n_lists))
+                assignments = self._nearest_centroids(vectors)
+
+            self._shards = []
+            self._locations = {}
+            order = np.argsort(assignments, kind="stable")
+            bounds = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+            for shard_no in range(n_lists):
+                rows = order[bounds[shard_no]:bounds[shard_no + 1]]
+                shard = _Shard(self.dim, capacity=max(16, len(rows) * 2))
+                shard_ids = [ids[i] for i in rows]
+                shard.extend(shard_ids, vectors[rows])
+                for row, uid in enumerate(shard_ids):
+                    self._locations[uid] = (shard_no, row)
+                self._shards.append(shard)
+
+    def add(self, uid, vector):
+        """Inserts or replaces the vector for a user."""
+        vector = self._prepare(vector)[0]
+        with self._lock:
+            if uid in self._locations:
+                self._remove_locked(uid)
+            shard_no = 0 if self._centroids is None else int(self._nearest_centroids(vector[None, :])[0])
+            row = self._shards[shard_no].append(uid, vector)
+            self._locations[uid] = (shard_no, row)
+
+    def remove(self, uid):
+        with self._lock:
+            if uid in self._locations:
+                self._remove_locked(uid)
+
+    def _remove_locked(self, uid):
+        shard_no, row = self._locations.pop(uid)
+        moved = self._shards[shard_no].remove(row)
+        if moved is not None:
+            self._locations[moved] = (shard_no, row)
+
+    # === SEARCH ===
+    def search(self, query, k=1):
+        """Returns up to k (uid, score) pairs for one query, best match first."""
+        return self.search_batch(query, k)[0]
+
+    def search_batch(self, queries, k=1):
+        """Returns one list of (uid, score) pairs per query row."""
+        queries = self._prepare(queries)
+        with self._lock:
+            if not self._locations:
+                return [[] for _ in range(len(queries))]
+            if self._centroids is None:
+                return self._search_shards(queries, [0], k)
+            probes = self._nearest_centroids(queries, n=min(self.n_probe, len(self._shards)))
+            return [self._search_shards(q[None, :], np.atleast_1d(probe), k)[0]
+                    for q, probe in zip(queries, probes)]
+
+    def _search_shards(self, queries, shard_nos, k):
+        """Scans the given shards for every query row and takes one top-k over all of them."""
+        shards = [self._shards[int(no)] for no in shard_nos if len(self._shards[int(no)])]
+        if not shards:
+            return [[] for _ in range(len(queries))]
+        blocks = []
+        for shard in shards:
+            n = len(shard)
+            block = queries @ shard.vectors[:n].T
+            if self.metric == "l2":
+                block = shard.sq_norms[:n] - 2 * block
+            blocks.append(block)
+        scores = blocks[0] if len(blocks) == 1 else np.concatenate(blocks, axis=1)
+        if self.metric == "l2":
+            scores += np.einsum("ij,ij->i", queries, queries)[:, None]
+
+        offsets = np.cumsum([0] + [len(shard) for shard in shards])
+        top = _top_k(scores, k, largest=self.metric == "cosine")
+        owner = np.searchsorted(offsets, top, side="right") - 1
+        return [[(shards[o].ids[j - offsets[o]], float(scores[qi, j])) for j, o in zip(row, owner_row)]
+                for qi, (row, owner_row) in enumerate(zip(top, owner))]
+
+    # === HELPERS ===
+    def _prepare(self, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if vectors.shape[-1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d vectors, got {vectors.shape[-1]}")
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors
+
+    def _set_centroids(self, centroids):
+        self._centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self._centroid_sq_norms = np.einsum("ij,ij->i", self._centroids, self._centroids)
+
+    def _nearest_centroids(self, vectors, n=1):
+        """Indices of the n nearest centroids per row (shape [rows] when n == 1)."""
+        out = np.empty((len(vectors), n), dtype=np.int64)
+        for start in range(0, len(vectors), ASSIGN_CHUNK):
+            block = vectors[start:start + ASSIGN_CHUNK]
+            dist = self._centroid_sq_norms - 2 * (block @ self._centroids.T)
+            out[start:start + len(block)] = _top_k(dist, n, largest=False)
+        return out[:, 0] if n == 1 else out
+
+    def _train_centroids(self, vectors, n_lists):
+        rng = np.random.default_rng(0)
+        n_sample = min(len(vectors), n_lists * KMEANS_SAMPLE_PER_LIST)
+        sample = vectors[rng.choice(len(vectors), n_sample, replace=False)]
+        centroids = sample[rng.choice(n_sample, n_lists, replace=False)].copy()
+
+        for _ in range(KMEANS_ITERATIONS):
+            self._set_centroids(centroids)
+            assign = self._nearest_centroids(sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            sums = np.stack([np.bincount(assign, weights=sample[:, d], minlength=n_lists)
+                             for d in range(self.dim)], axis=1)
+            filled = counts > 0  # empty lists keep their previous centroid
+            centroids[filled] = sums[filled] / counts[filled, None]
+            if self.metric == "cosine":
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        return centroids
+
+
+def _top_k(scores, k, largest=True):
+    """Column indices of the k best entries per row of a 2-D array, best first."""
+    k = min(k, scores.shape[1])
+    keyed = -scores if largest else scores
+    if k < scores.shape[1]:
+        part = np.argpartition(keyed, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(np.take_along_axis(keyed, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def load_palm_index(db, collection="users", field="palmHash", model_version=palm_template.MODEL_VERSION,
+                    **index_kwargs):
+    """
+    Builds a PalmIndex from every user document that has a palm template.
+    Binary templates are decoded in bulk, one vectorised pass per template length (codec);
+    legacy float lists are still read. Templates from another embedding model version are
+    skipped (their users need to re-enrol).
+    """
+    index = PalmIndex(**index_kwargs)
+    legacy_ids, legacy_vectors = [], []
+    by_length = {}  # template length -> ([uid], [template bytes])
+    for doc in db.collection(collection).select([field]).stream():
+        value = (doc.to_dict() or {}).get(field)
+        if value is None:
+            continue
+        if palm_template.is_template(value):
+            uids, blobs = by_length.setdefault(len(value), ([], []))
+            uids.append(doc.id)
+            blobs.append(bytes(value))
+        elif len(value) == index.dim:
+            legacy_ids.append(doc.id)
+            legacy_vectors.append(value)
+
+    ids = list(legacy_ids)
+    parts = [np.asarray(legacy_vectors, dtype=np.float32).reshape(-1, index.dim)]
+    skipped = 0
+    for uids, blobs in by_length.values():
+        try:
+            vectors, headers = palm_template.decode_many(blobs, index.dim)
+        except palm_template.TemplateError:
+            # A corrupt template in the group: fall back to checking them one at a time
+            good = [i for i, blob in enumerate(blobs) if _readable(blob, index.dim)]
+            if not good:
+                skipped += len(blobs)
+                continue
+            skipped += len(blobs) - len(good)
+            uids = [uids[i] for i in good]
+            vectors, headers = palm_template.decode_many([blobs[i] for i in good], index.dim)
+        current = headers["model_version"] == model_version
+        skipped += int((~current).sum())
+        ids.extend(uid for uid, keep in zip(uids, current) if keep)
+        parts.append(vectors[current])
+    if skipped:
+        print(f"Skipped {skipped} palm templates that are unreadable or from another model version.")
+    index.build(ids, np.concatenate(parts))
+    return index
+
+
+def _readable(blob, dim):
+    try:
+        return palm_template.read_header(blob).dim == dim
+    except palm_template.TemplateError:
+        return False
@@ -0,0 +1,126 @@
+import numpy as np
+
+from palm_index import PalmIndex, load_palm_index
+import palm_template
+from fake_firestore import FakeFirestore
+
+# Exact (flat) and IVF search over a small synthetic gallery.
+# Run from processing_server: python palm_index_test.py (or pytest palm_index_test.py)
+
+# === CONFIG ===
+DIM = 32
+GALLERY_SIZE = 400
+NOISE = 0.05  # query = enrolled vector + noise, well inside the match threshold
+
+
+def gallery(n=GALLERY_SIZE, seed=0):
+    rng = np.random.default_rng(seed)
+    return [f"user-{i}" for i in range(n)], rng.standard_normal((n, DIM)).astype(np.float32)
+
+
+def noisy(vector, seed=1):
+    return vector + NOISE * np.random.default_rng(seed).standard_normal(vector.shape).astype(np.float32)
+
+
+def test_build_flat_finds_every_user():
+    ids, vectors = gallery()
+    index = PalmIndex(dim=DIM, n_lists=1)
+    index.build(ids, vectors)
+    assert len(index) == GALLERY_SIZE
+    results = index.search_batch(noisy(vectors), k=3)
+    assert [r[0][0] for r in results] == ids
+    assert all(r[0][1] > 0.99 and r[0][1] >= r[1][1] >= r[2][1] for r in results)
+
+
+def test_ivf_agrees_with_flat():
+    ids, vectors = gallery()
+    flat = PalmIndex(dim=DIM, n_lists=1)
+    flat.build(ids, vectors)
+    ivf = PalmIndex(dim=DIM, n_lists=4, n_probe=4)  # probing every list is exact
+    ivf.build(ids, vectors)
+    assert len(ivf._shards) == 4 and ivf._centroids is not None
+
+    queries = noisy(vectors[:50])
+    assert [r[0][0] for r in ivf.search_batch(queries)] == [r[0][0] for r in flat.search_batch(queries)]
+    # With one probe only the nearest list is scanned, which is the list each vector was stored in
+    ivf.n_probe = 1
+    assert [r[0][0] for r in ivf.search_batch(vectors)] == ids
+
+
+def test_too_small_for_ivf_falls_back_to_flat():
+    ids, vectors = gallery(n=50)
+    index = PalmIndex(dim=DIM, n_lists=8)
+    index.build(ids, vectors)
+    assert len(index._shards) == 1 and index._centroids is None
+
+
+def test_add_replace_and_remove():
+    ids, vectors = gallery()
+    for n_lists in (1, 4):
+        index = PalmIndex(dim=DIM, n_lists=n_lists)
+        index.build(ids, vectors)
+
+        new = np.random.default_rng(2).standard_normal(DIM).astype(np.float32)
+        index.add("newcomer", new)
+        assert len(index) == GALLERY_SIZE + 1 and index.search(noisy(new))[0][0] == "newcomer"
+
+        # Re-registering replaces the old vector instead of adding a second row
+        index.add("user-7", new * -1)
+        assert len(index) == GALLERY_SIZE + 1
+        assert index.search(vectors[7], k=GALLERY_SIZE + 1)[0][0] != "user-7"
+        assert index.search(-new)[0][0] == "user-7"
+
+        # Removing a row moves another one into its slot; that user must still be found
+        index.remove("user-3")
+        index.remove("not-enrolled")
+        assert "user-3" not in index and len(index) == GALLERY_SIZE
+        top = [r[0][0] for r in index.search_batch(noisy(vectors))]
+        assert "user-3" not in top
+        assert all(found == uid for found, uid in zip(top, ids) if uid not in ("user-3", "user-7"))
+
+
+def test_l2_metric_scores_distances():
+    ids, vectors = gallery(n=20)
+    index = PalmIndex(dim=DIM, metric="l2", n_lists=1)
+    index.build(ids, vectors)
+    (best, distance), (_, second) = index.search(vectors[5], k=2)
+    assert best == "user-5" and distance < 1e-3 < second
+
+
+def test_rejects_bad_input():
+    index = PalmIndex(dim=DIM)
+    assert index.search(np.ones(DIM)) == []
+    for bad in (lambda: PalmIndex(metric="dot"),
+                lambda: index.add("user", np.ones(DIM + 1)),
+                lambda: index.build(["a", "b"], np.ones((3, DIM)))):
+        try:
+            bad()
+        except ValueError:
+            continue
+        raise AssertionError("expected ValueError")
+
+
+def test_load_palm_index_reads_templates():
+    ids, vectors = gallery(n=6)
+    db = FakeFirestore()
+    users = db.collection("users")
+    for uid, vector in zip(ids[:3], vectors[:3]):
+        users.document(uid).set({"palmHash": palm_template.encode(vector, codec="float16")})
+    users.document(ids[3]).set({"palmHash": vectors[3].tolist()})  # legacy float list
+    users.document(ids[4]).set({"palmHash": palm_template.encode(vectors[4], model_version=99)})
+    users.document(ids[5]).set({"palmHash": None})  # palm cleared in the app
+
+    index = load_palm_index(db, dim=DIM)
+    assert sorted(index._locations) == ids[:4]
+    assert index.search(vectors[1])[0][0] == "user-1"
+
+
+if __name__ == "__main__":
+    test_build_flat_finds_every_user()
+    test_ivf_agrees_with_flat()
+    test_too_small_for_ivf_falls_back_to_flat()
+    test_add_replace_and_remove()
+    test_l2_metric_scores_distances()
+    test_rejects_bad_input()
+    test_load_palm_index_reads_templates()
+    print("✅ Palm index build, add, remove and flat/IVF search")
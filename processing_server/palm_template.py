@@ -0,0 +1,119 @@
+import os
+import struct
+import numpy as np
+
+# === CONFIG ===
+TEMPLATE_CODEC = os.getenv("PALM_TEMPLATE_CODEC", "float16")     # float32, float16 or int8
+MODEL_VERSION = int(os.getenv("EMBEDDING_MODEL_VERSION", "1"))  # bump when the embedding model changes
+FORMAT_VERSION = 1
+MAGIC = b"PT"
+
+# magic, format version, codec, dim, model version, flags, (3 pad bytes), int8 scale: 16 bytes,
+# so the payload that follows starts 16-byte aligned inside the blob
+HEADER = struct.Struct("<2sBBHHB3xf")
+CODECS = {"float32": (0, np.dtype("<f4")), "float16": (1, np.dtype("<f2")), "int8": (2, np.dtype("i1"))}
+CODEC_NAMES = {code: name for name, (code, _) in CODECS.items()}
+HEADER_DTYPE = np.dtype([("magic", "S2"), ("version", "u1"), ("codec", "u1"), ("dim", "<u2"),
+                         ("model_version", "<u2"), ("flags", "u1"), ("pad", "V3"), ("scale", "<f4")])
+FLAG_L2_NORMALISED = 1
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class TemplateHeader:
+    """Decoded template header."""
+
+    def __init__(self, codec, dim, model_version, flags, scale):
+        self.codec = codec
+        self.dim = dim
+        self.model_version = model_version
+        self.flags = flags
+        self.scale = scale
+
+    @property
+    def normalised(self):
+        return bool(self.flags & FLAG_L2_NORMALISED)
+
+
+def encode(vector, codec=TEMPLATE_CODEC, model_version=MODEL_VERSION):
+    """
+    Packs an embedding into a versioned binary template for a Firestore bytes field.
+    float16 keeps ~3 significant digits; int8 is symmetric per-template quantization
+    (scale = max |x| / 127) and is 128 + 16 bytes at 128 dimensions.
+    """
+    if codec not in CODECS:
+        raise TemplateError(f"Unknown template codec: {codec}")
+    code, dtype = CODECS[codec]
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(vector))
+    flags = FLAG_L2_NORMALISED if abs(norm - 1.0) < 1e-3 else 0
+
+    scale = 1.0
+    if codec == "int8":
+        peak = float(np.abs(vector).max()) if len(vector) else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        payload = np.clip(np.rint(vector / scale), -127, 127).astype(dtype)
+    else:
+        payload = vector.astype(dtype)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, code, len(vector), model_version, flags, scale) + payload.tobytes()
+
+
+def read_header(blob):
+    if len(blob) < HEADER.size:
+        raise TemplateError("Template is shorter than its header")
+    magic, version, code, dim, model_version, flags, scale = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise TemplateError("Not a palm template")
+    if version != FORMAT_VERSION:
+        raise TemplateError(f"Unsupported template format version {version}")
+    if code not in CODEC_NAMES:
+        raise TemplateError(f"Unknown template codec {code}")
+    if len(blob) != HEADER.size + dim * CODECS[CODEC_NAMES[code]][1].itemsize:
+        raise TemplateError("Template length does not match its header")
+    return TemplateHeader(CODEC_NAMES[code], dim, model_version, flags, scale)
+
+
+def view(blob):
+    """(header, payload) where payload is a zero-copy NumPy view of the stored values (not yet scaled)."""
+    header = read_header(blob)
+    payload = np.frombuffer(blob, dtype=CODECS[header.codec][1], count=header.dim, offset=HEADER.size)
+    return header, payload
+
+
+def decode(blob):
+    """Returns the template as a float32 vector."""
+    header, payload = view(blob)
+    vector = payload.astype(np.float32)
+    if header.codec == "int8":
+        vector *= header.scale
+    return vector
+
+
+def decode_many(blobs, dim):
+    """
+    Decodes same-length templates into an [N, dim] float32 matrix with one buffer
+    copy and vectorised header checks and conversion (no per-template Python work).
+    Returns (matrix, headers) where headers is a structured array with HEADER_DTYPE fields.
+    """
+    if not blobs:
+        return np.empty((0, dim), dtype=np.float32), np.empty(0, dtype=HEADER_DTYPE)
+    length = len(blobs[0])
+    if any(len(blob) != length for blob in blobs):
+        raise TemplateError("decode_many needs templates of a single length")
+    rows = np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(len(blobs), length)
+    headers = rows[:, :HEADER.size].copy().view(HEADER_DTYPE).ravel()
+    codec = CODEC_NAMES.get(int(headers["codec"][0]))
+    if (codec is None or (headers["magic"] != MAGIC).any() or (headers["version"] != FORMAT_VERSION).any()
+            or (headers["codec"] != headers["codec"][0]).any() or (headers["dim"] != dim).any()
+            or rows.shape[1] != HEADER.size + dim * CODECS[codec][1].itemsize):
+        raise TemplateError("decode_many needs valid templates of a single codec and dimension")
+    matrix = rows[:, HEADER.size:].view(CODECS[codec][1]).astype(np.float32)
+    if codec == "int8":
+        matrix *= headers["scale"][:, None]
+    return matrix, headers
+
+
+def is_template(value):
+    return isinstance(value, (bytes, bytearray, memoryview))
@@ -0,0 +1,80 @@
+import numpy as np
+
+import palm_template
+from palm_template import TemplateError
+
+# Encode/decode round trips for every codec, and rejection of damaged templates.
+# Run from processing_server: python palm_template_test.py (or pytest palm_template_test.py)
+
+# === CONFIG ===
+DIM = 128
+
+
+def unit_vector(seed=0):
+    vector = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def expect_error(blob):
+    try:
+        palm_template.decode(blob)
+    except TemplateError:
+        return
+    raise AssertionError("expected TemplateError")
+
+
+def test_round_trips():
+    vector = unit_vector()
+    for codec, tolerance, size in (("float32", 0, 16 + 4 * DIM), ("float16", 1e-3, 16 + 2 * DIM),
+                                   ("int8", 1e-2, 16 + DIM)):
+        blob = palm_template.encode(vector, codec=codec, model_version=3)
+        assert len(blob) == size and palm_template.is_template(blob)
+        assert np.abs(palm_template.decode(blob) - vector).max() <= tolerance, codec
+
+        header = palm_template.read_header(blob)
+        assert (header.codec, header.dim, header.model_version, header.normalised) == (codec, DIM, 3, True)
+    assert not palm_template.read_header(palm_template.encode(vector * 2)).normalised
+
+
+def test_decode_many_matches_decode():
+    blobs = [palm_template.encode(unit_vector(seed), codec="int8", model_version=seed) for seed in range(5)]
+    matrix, headers = palm_template.decode_many(blobs, DIM)
+    assert matrix.shape == (5, DIM)
+    assert np.array_equal(matrix, np.stack([palm_template.decode(b) for b in blobs]))
+    assert list(headers["model_version"]) == list(range(5))
+    assert palm_template.decode_many([], DIM)[0].shape == (0, DIM)
+
+
+def test_damaged_templates_are_rejected():
+    blob = palm_template.encode(unit_vector())
+    expect_error(blob[:10])                                    # shorter than the header
+    expect_error(b"XX" + blob[2:])                             # wrong magic
+    expect_error(blob[:2] + bytes([9]) + blob[3:])             # unknown format version
+    expect_error(blob[:3] + bytes([7]) + blob[4:])             # unknown codec
+    expect_error(blob[:-2])                                    # truncated payload
+    try:
+        palm_template.encode(unit_vector(), codec="bfloat16")
+    except TemplateError:
+        pass
+    else:
+        raise AssertionError("expected TemplateError")
+
+
+def test_decode_many_rejects_mixed_batches():
+    float16 = palm_template.encode(unit_vector(), codec="float16")
+    for blobs, dim in (([float16, palm_template.encode(unit_vector(), codec="float32")], DIM),  # two lengths
+                       ([float16, b"XX" + float16[2:]], DIM),                                 # one corrupt
+                       ([float16], DIM // 2)):                                                # other dimension
+        try:
+            palm_template.decode_many(blobs, dim)
+        except TemplateError:
+            continue
+        raise AssertionError("expected TemplateError")
+
+
+if __name__ == "__main__":
+    test_round_trips()
+    test_decode_many_matches_decode()
+    test_damaged_templates_are_rejected()
+    test_decode_many_rejects_mixed_batches()
+    print("✅ Palm templates round-trip and damaged ones are rejected")
@@ -0,0 +1,89 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import requests
+
+import load_test
+from palm_index import PalmIndex
+from user_cache import UserProfileCache
+
+# Checks that a user who clears their palmHash in the app (profile_screen.dart sets it to
+# null) is no longer matched or charged, against a local server on the fake Firestore.
+# Run from processing_server: python palm_unenroll_test.py (or pytest palm_unenroll_test.py)
+
+# === CONFIG ===
+PAYMENT = {"merchant": "Tesco", "amount": "12.50"}
+
+
+def scan(base_url, image):
+    name, data = image
+    return requests.post(f"{base_url}/scanPalm", data={"token": json.dumps(PAYMENT)},
+                         files={"image": (name, data, "image/jpeg")}, timeout=30)
+
+
+def test_scan_after_palm_cleared():
+    base_url, db = load_test.start_local_server()
+    import pc_image_receiver as server
+
+    images = load_test.load_images()[:1]
+    uid = load_test.enrol(base_url, images, db)[0]
+    assert scan(base_url, images[0]).status_code == 200
+
+    # The app clears the palm; the cached profile runs out (its TTL, or the snapshot listener)
+    db.collection("users").document(uid).set({"palmHash": None}, merge=True)
+    server.user_cache.invalidate(uid)
+
+    r = scan(base_url, images[0])
+    assert r.status_code == 404, r.text
+    assert r.json()["error"] == "Palm not recognised"
+    assert uid not in server.palm_index
+    assert scan(base_url, images[0]).status_code == 404  # now unmatched, without a profile read
+
+    # Registering again puts the user back
+    load_test.enrol(base_url, images, db)
+    assert scan(base_url, images[0]).status_code == 200
+
+
+def test_watch_reports_cleared_palm():
+    listeners, removed = [], []
+    collection = SimpleNamespace(on_snapshot=listeners.append)
+    cache = UserProfileCache(loader=lambda uid: None)
+    cache.put("cached-user", {"default_acc": "acc-1", "palm_enrolled": True})
+    cache.watch(collection, on_unenrolled=removed.append)
+
+    def change(kind, uid, data):
+        document = SimpleNamespace(id=uid, to_dict=lambda: data)
+        return SimpleNamespace(type=SimpleNamespace(name=kind), document=document)
+
+    listeners[0](None, [change("MODIFIED", "cached-user", {"default_acc": "acc-1", "palmHash": None}),
+                        change("MODIFIED", "other-user", {"default_acc": "acc-2"}),
+                        change("ADDED", "enrolled-user", {"default_acc": "acc-3", "palmHash": b"\x01"}),
+                        change("REMOVED", "deleted-user", {})], None)
+
+    assert removed == ["cached-user", "other-user", "deleted-user"]
+    assert cache.get("cached-user") == {"default_acc": "acc-1", "palm_enrolled": False}
+
+
+def test_build_with_duplicate_uid_then_remove():
+    # A gallery read while a user re-registers can list them twice; the last vector wins
+    rng = np.random.default_rng(0)
+    old, new, other = rng.standard_normal((3, 128)).astype(np.float32)
+    index = PalmIndex(dim=128, n_lists=1)
+    index.build(["user-a", "user-b", "user-a"], np.stack([old, other, new]))
+    assert len(index) == 2
+    assert index.search(new)[0][0] == "user-a"
+
+    index.remove("user-a")
+    assert "user-a" not in index and len(index) == 1
+    assert [uid for uid, _ in index.search(old, k=5)] == ["user-b"]
+    assert [uid for uid, _ in index.search(new, k=5)] == ["user-b"]
+
+
+if __name__ == "__main__":
+    test_scan_after_palm_cleared()
+    print("✅ Cleared palm is no longer charged")
+    test_watch_reports_cleared_palm()
+    print("✅ Snapshot listener reports cleared palms")
+    test_build_with_duplicate_uid_then_remove()
+    print("✅ Duplicate uid in a bulk build leaves no stale row after removal")
@@ -1,13 +1,33 @@
 import os
 from flask import Flask, request, jsonify
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import auth, credentials, exceptions, firestore
 import time
 import json
 import random
+from palm_index import PalmIndex, load_palm_index
+from palm_embedder import load_embedder
+from transaction_store import TransactionStore, create_backend
+from user_cache import UserProfileCache, firestore_profile_loader
+from metrics import Metrics, REQUEST_ID_HEADER, CONTENT_TYPE, endpoint_label
+import palm_template
+import spend_rollups
+from transaction_history import FirstPageCache, HistoryRequest, read_history
+from idempotency import IdempotencyCache, IDEMPOTENCY_HEADER, MAX_KEY_LENGTH, transaction_id_for
+
+# === Config ===
+# Minimum cosine similarity between a scanned palm and an enrolled palmHash to accept a payment
+MATCH_THRESHOLD = float(os.getenv("PALM_MATCH_THRESHOLD", "0.9"))
+# A payment's optional 'captured_at' (when the Pi took it, for payments it forwards late)
+# is trusted up to this far in the future to allow for clock skew; later values are ignored
+MAX_CLOCK_SKEW = 300  # seconds
+
+# Per-stage latency histograms, served on /metrics
+metrics = Metrics("server")
 
 # === Firebase Init ===
 # Ensure FIREBASE_CREDS environment variable is set with your Firebase service account key JSON
+db = None
 try:
     firebase_creds = json.loads(os.environ["FIREBASE_CREDS"])
     cred = credentials.Certificate(firebase_creds)
@@ -20,13 +40,206 @@ except KeyError:
 except Exception as e:
     print(f"Error initializing Firebase: {e}")
 
+# === Firestore-backed Services Init ===
+TRANSACTION_BACKEND = os.getenv("TRANSACTION_BACKEND", "firestore")
+palm_index = transaction_store = user_cache = None
+
+# First pages of /transactions/<uid>, dropped when one of the user's transactions commits
+history_cache = FirstPageCache()
+
+def invalidate_history(batch):
+    history_cache.invalidate({txn["user_id"] for txn in batch})
+
+def init_services(database):
+    """
+    Builds the services that sit on top of Firestore. Called at import with the real
+    client; offline tools call it again with an in-process fake.
+    """
+    global db, palm_index, transaction_store, user_cache
+    db = database
+
+    # Every enrolled palmHash is loaded once at startup; /registerPalm keeps it up to date.
+    palm_index = PalmIndex()
+    if db is not None:
+        try:
+            palm_index = load_palm_index(db)
+            print(f"Palm index loaded with {len(palm_index)} enrolled users.")
+        except Exception as e:
+            print(f"Error loading palm index: {e}")
+
+    # Payments are acknowledged once journalled locally and committed to Firestore in batches.
+    # TRANSACTION_BACKEND=memory or sqlite[:path] swaps Firestore out for offline runs.
+    if transaction_store is not None:
+        transaction_store.close()
+    backend = create_backend(TRANSACTION_BACKEND, db)
+    backend.commit = metrics.timed("firestore_batch_commit", backend.commit)
+    transaction_store = TransactionStore(backend, on_commit=invalidate_history)
+
+    # /scanPalm only needs default_acc and whether the palm is still enrolled, so repeat payers
+    # are served without a Firestore read. USER_CACHE_WATCH=1 also keeps cached entries fresh
+    # with a snapshot listener, which drops a palm from the index as soon as the app clears it.
+    user_cache = UserProfileCache(metrics.timed("firestore_read", firestore_profile_loader(db)))
+    if db is not None and os.getenv("USER_CACHE_WATCH") == "1":
+        user_cache.watch(db.collection("users"), on_unenrolled=palm_index.remove)
+
+init_services(db)
+
+# === Palm Embedder Init ===
+# Loaded once per worker; concurrent requests are micro-batched into one inference call.
+embedder = load_embedder()
+
+# Responses to payments sent with an Idempotency-Key, so a retry (the Pi's offline journal
+# resends until it gets an answer) is not charged twice
+idempotency_cache = IdempotencyCache()
+
 # === Flask App Init ===
 app = Flask(__name__)
 
-# === Helper: Generate a fake vector ===
-def GenerateVector():
-    """Generates a random 128-dimension vector."""
-    return [round(random.uniform(0, 1), 8) for _ in range(128)]
+# Every request is traced under the caller's X-Request-ID (the Pi sends one), and its
+# stage breakdown is logged and returned in a Server-Timing header
+@app.before_request
+def begin_trace():
+    metrics.begin_request(request.headers.get(REQUEST_ID_HEADER))
+
+@app.after_request
+def finish_trace(response):
+    response.headers.update(metrics.finish_request(endpoint_label(request.url_rule), response.status_code))
+    return response
+
+# === Helper: Generate the palm vector ===
+def GenerateVector(image_bytes):
+    """Embeds an uploaded palm image into a normalised 128-dimension vector."""
+    with metrics.stage("decode"):
+        tensor = embedder.preprocess(image_bytes)
+    with metrics.stage("embed"):
+        return ToVector(embedder.submit(tensor).result())
+
+def ToVector(embedding):
+    return [round(float(v), 8) for v in embedding]
+
+# === Helpers: shared with the async server (async_app.py) ===
+def validate_upload(token, image):
+    """Returns the error message for a missing token or image file, or None."""
+    if not token:
+        return "Missing 'token' in form data"
+    if not image:
+        return "Missing 'image' file"
+    if image.filename == '':
+        return "No selected image file"
+    return None
+
+def parse_payment_token(token_raw):
+    """
+    Parses the /scanPalm token (a JSON string containing merchant and amount).
+    Returns (merchant, amount); raises ValueError with the message for the client.
+    """
+    try:
+        token_data = json.loads(token_raw)
+    except json.JSONDecodeError:
+        raise ValueError("Invalid JSON format for 'token'")
+
+    # Extract merchant and amount from the parsed token data
+    merchant = token_data.get("merchant")
+    amount_str = token_data.get("amount")
+
+    if not merchant:
+        raise ValueError("Missing 'merchant' in 'token' JSON")
+    if not amount_str:
+        raise ValueError("Missing 'amount' in 'token' JSON")
+
+    try:
+        amount = float(amount_str)
+    except ValueError:
+        raise ValueError("Invalid 'amount' format in 'token' JSON. Must be a number.")
+    if amount <= 0:
+        raise ValueError("Amount must be a positive number")
+    return merchant, amount
+
+def replay_payment(key):
+    """
+    Returns the stored (body, status) for a payment retried with the same Idempotency-Key,
+    a 409 while the first request with that key is still running, or None if it has to be
+    processed. In that last case the key is reserved: the caller must settle it with
+    idempotency_cache.put() or release(). Raises ValueError for an unusable key.
+    """
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"'{IDEMPOTENCY_HEADER}' must be at most {MAX_KEY_LENGTH} characters")
+    return idempotency_cache.reserve(key)
+
+def payment_timestamp(captured_at):
+    """When the payment was taken: the client's 'captured_at' if it is usable, otherwise now."""
+    now = time.time()
+    try:
+        timestamp = float(captured_at)
+    except (TypeError, ValueError):
+        return now
+    return timestamp if timestamp <= now + MAX_CLOCK_SKEW else now
+
+def authorize_user(uid, authorization):
+    """
+    Checks that a request for uid's data carries a Firebase ID token issued to uid
+    (Authorization: Bearer <token>, as the app sends). Returns (error, status) or None.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    token = token.strip()
+    if scheme.lower() != "bearer" or not token:
+        return "Missing ID token", 401
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        return "Authentication unavailable", 503
+    try:
+        with metrics.stage("auth"):
+            claims = auth.verify_id_token(token)
+    except auth.CertificateFetchError as e:
+        print(f"❌ Could not fetch ID token certificates: {e}")
+        return "Authentication unavailable", 503
+    except (ValueError, exceptions.FirebaseError):
+        return "Invalid ID token", 401
+    if claims.get("uid") != uid:
+        return "ID token does not belong to this user", 403
+    return None
+
+def match_palm(query_vector):
+    """Returns (user_id, score) for the best enrolled palm, or None below MATCH_THRESHOLD."""
+    with metrics.stage("index_search"):
+        matches = palm_index.search(query_vector, k=1)
+    if not matches or matches[0][1] < MATCH_THRESHOLD:
+        return None
+    user_id, score = matches[0]
+    print(f"🔍 Palm matched user {user_id} (score {score:.4f})")
+    return user_id, score
+
+def unenroll(user_id):
+    """
+    Drops a user whose palmHash was cleared (the app's profile screen does this) from the
+    palm index, so they are no longer matched or charged. Called when a matched user's
+    profile has no palmHash any more.
+    """
+    palm_index.remove(user_id)
+    user_cache.invalidate(user_id)
+    print(f"🗑️ Removed user {user_id} from the palm index: palmHash cleared")
+
+def record_payment(user_id, default_acc, merchant, amount, idempotency_key=None, timestamp=None):
+    """Journals a successful payment and returns its transaction ID (fixed by the idempotency key, if any)."""
+    categories = ['Groceries', 'Food & Drink', 'Bills', 'Transport', 'Others']
+    random_category = random.choice(categories)
+
+    # Journal the transaction locally; it is written to the linked account's
+    # transactions subcollection by the store's background batch flusher
+    with metrics.stage("journal_write"):
+        transaction_id = transaction_store.record(user_id, default_acc, {
+            "amount": amount,
+            "merchant": merchant,
+            "category": random_category,
+            "status": "success",
+            "timestamp": timestamp or time.time()
+        }, txn_id=transaction_id_for(idempotency_key) if idempotency_key else None)
+
+    print(f"✅ Transaction recorded for user {user_id} in account {default_acc}: Merchant={merchant}, Amount={amount}")
+    return transaction_id
 
 @app.route("/registerPalm", methods=["POST"])
 def register_palm():
@@ -34,29 +247,36 @@ def register_palm():
     Handles user registration requests with a token (UID) and an image.
     Expects 'token' as form data and an 'image' file.
     The 'token' will be used as the document ID in Firestore.
-    The image is acknowledged but not stored in Firestore directly due to size limits.
-    A 'palmHash' (generated vector) is stored for the user.
+    The image is embedded but not stored in Firestore directly due to size limits.
+    A 'palmHash' (the palm embedding as a compact binary template, see palm_template.py)
+    is stored for the user.
     """
-    token = request.form.get("token")
-    image = request.files.get("image")
+    with metrics.stage("multipart_parse"):
+        token = request.form.get("token")
+        image = request.files.get("image")
 
     # Validate incoming data
-    if not token:
-        return jsonify({"error": "Missing 'token' in form data"}), 400
-    if not image:
-        return jsonify({"error": "Missing 'image' file"}), 400
-    if image.filename == '':
-        return jsonify({"error": "No selected image file"}), 400
+    error = validate_upload(token, image)
+    if error:
+        return jsonify({"error": error}), 400
 
     try:
-        # Generate a fake vector for palmHash
-        vector = GenerateVector()
+        vector = GenerateVector(image.read())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
+    try:
         # Update or create the user document in Firestore with the palmHash
         # Using .set(..., merge=True) will create the document if it doesn't exist
         # or update it if it does, without overwriting other fields.
         user_ref = db.collection("users").document(token)
-        user_ref.set({"palmHash": vector}, merge=True)
+        template = palm_template.encode(vector)
+        with metrics.stage("firestore_write"):
+            user_ref.set({"palmHash": template}, merge=True)
+        # Index what was stored, so matching is the same before and after a restart. The cached
+        # profile goes first, so a payment in between can't find the palm with a stale profile
+        user_cache.invalidate(token)
+        palm_index.add(token, palm_template.decode(template))
 
         print(f"✅ Registered vector for {token}")
         return jsonify({"message": "Registration OK", "uid": token}), 200
@@ -70,84 +290,140 @@ def scan_palm():
     """
     Handles payment scanning requests.
     Expects 'token' (a JSON string containing merchant and amount), and an 'image' file.
-    Retrieves user's default account and records a transaction in Firestore.
+    Identifies the user from the palm image against the in-memory palm index,
+    retrieves their default account and records a transaction in Firestore.
+    Optional: an Idempotency-Key header (a retry with the same key gets the first
+    response back) and a 'captured_at' field with when the payment was taken.
     """
+    reserved_key = None
     try:
-        token_raw = request.form.get("token")  # This is expected to be a JSON string
-        image = request.files.get("image")
+        with metrics.stage("multipart_parse"):
+            token_raw = request.form.get("token")  # This is expected to be a JSON string
+            image = request.files.get("image")
 
         # Validate incoming data
-        if not token_raw:
-            return jsonify({"error": "Missing 'token' in form data"}), 400
-        if not image:
-            return jsonify({"error": "Missing 'image' file"}), 400
-        if image.filename == '':
-            return jsonify({"error": "No selected image file"}), 400
-
-        # Parse the JSON string from the 'token' form field
-        try:
-            token_data = json.loads(token_raw)
-        except json.JSONDecodeError:
-            return jsonify({"error": "Invalid JSON format for 'token'"}), 400
+        error = validate_upload(token_raw, image)
+        if error:
+            return jsonify({"error": error}), 400
 
-        # Extract merchant and amount from the parsed token data
-        merchant = token_data.get("merchant")
-        amount_str = token_data.get("amount")
-
-        if not merchant:
-            return jsonify({"error": "Missing 'merchant' in 'token' JSON"}), 400
-        if not amount_str:
-            return jsonify({"error": "Missing 'amount' in 'token' JSON"}), 400
+        try:
+            merchant, amount = parse_payment_token(token_raw)
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            replayed = replay_payment(idempotency_key)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if replayed is not None:
+            return jsonify(replayed[0]), replayed[1]
+        reserved_key = idempotency_key  # a concurrent retry now gets 409 until this one settles
 
+        # Identify the payer by matching the scanned palm against every enrolled palmHash.
+        # Every frame is embedded: near-duplicate suppression happens on the Pi, never here,
+        # where a similar-looking palm from another customer could reuse the last payer's vector
         try:
-            amount = float(amount_str)
-            if amount <= 0:
-                return jsonify({"error": "Amount must be a positive number"}), 400
-        except ValueError:
-            return jsonify({"error": "Invalid 'amount' format in 'token' JSON. Must be a number."}), 400
-
-        # --- Hardcoded user ID (as per your provided code) ---
-        # In a real application, this user_id would likely come from an authentication
-        # mechanism (e.g., from a decoded JWT token or a session).
-        user_id = "uZsYmasM5B3dVXTYjt3J" # Replace with dynamic user ID in production
-
-        # Retrieve user document to get the default account
-        user_ref = db.collection("users").document(user_id)
-        user_doc = user_ref.get()
-
-        if not user_doc.exists:
+            query_vector = GenerateVector(image.read())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        match = match_palm(query_vector)
+        if match is None:
+            return jsonify({"error": "Palm not recognised"}), 404
+        user_id, _ = match
+
+        # Retrieve the user's default account (cached after the first payment)
+        user_data = user_cache.get(user_id)
+        if user_data is None:
             return jsonify({"error": "User not found"}), 404
+        if not user_data.get("palm_enrolled"):
+            unenroll(user_id)
+            return jsonify({"error": "Palm not recognised"}), 404
 
-        user_data = user_doc.to_dict()
         default_acc = user_data.get("default_acc")
         if not default_acc:
+            user_cache.invalidate(user_id)  # re-read next time, the user may be setting one up now
             return jsonify({"error": "No default account set for this user"}), 400
 
-        # Add transaction to the specified linked account's transactions subcollection
-        transaction_collection_ref = db.collection("users") \
-            .document(user_id) \
-            .collection("linkedAccounts") \
-            .document(default_acc) \
-            .collection("transactions")
+        transaction_id = record_payment(user_id, default_acc, merchant, amount, idempotency_key,
+                                        payment_timestamp(request.form.get("captured_at")))
+        body = {"message": "Payment OK", "transaction_id": transaction_id}
+        if idempotency_key:
+            idempotency_cache.put(idempotency_key, body, 200)
+        return jsonify(body), 200
 
-        categories = ['Groceries', 'Food & Drink', 'Bills', 'Transport', 'Others']
-        random_category = random.choice(categories)
-
-        transaction_collection_ref.add({
-            "amount": amount,
-            "merchant": merchant,
-            "category": random_category,
-            "status": "success",
-            "timestamp": firestore.SERVER_TIMESTAMP
-        })
+    except Exception as e:
+        print(f"❌ Error in scanPalm: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if reserved_key:
+            idempotency_cache.release(reserved_key)  # no-op once the response is stored
 
-        print(f"✅ Transaction recorded for user {user_id} in account {default_acc}: Merchant={merchant}, Amount={amount}")
-        return jsonify({"message": "Payment OK"}), 200
+@app.route("/spend/<uid>", methods=["GET"])
+def monthly_spend(uid):
+    """
+    A user's spending for one month (?month=YYYY-MM, default: this month), in total,
+    by category and by linked account, or for one account with ?account=<id>.
+    Served from the rollup documents kept by the transaction flusher: one read,
+    however many transactions the month has. Requires the user's own Firebase ID token.
+    """
+    denied = authorize_user(uid, request.headers.get("Authorization"))
+    if denied:
+        return jsonify({"error": denied[0]}), denied[1]
+    try:
+        month = spend_rollups.validate_month(request.args.get("month"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        with metrics.stage("firestore_read"):
+            body = spend_rollups.read_monthly_spend(db, uid, month, request.args.get("account"))
+        return jsonify(body), 200
+    except Exception as e:
+        print(f"❌ Error in monthly_spend: {e}")
+        return jsonify({"error": str(e)}), 500
 
+@app.route("/transactions/<uid>", methods=["GET"])
+def transaction_history(uid):
+    """
+    A page of a user's transactions across all linked accounts, newest first
+    (?limit=, default 20, at most 100), optionally for one ?account= and/or ?category=.
+    Pass the response's nextCursor back as ?cursor= for the next page; it is null on
+    the last one. First pages are cached per user. Requires the user's own Firebase ID token.
+    """
+    denied = authorize_user(uid, request.headers.get("Authorization"))
+    if denied:
+        return jsonify({"error": denied[0]}), denied[1]
+    try:
+        req = HistoryRequest.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        body = history_cache.get(uid, req.cache_key) if req.first_page else None
+        if body is None:
+            with metrics.stage("firestore_read"):
+                body = read_history(db, uid, req)
+            if req.first_page:
+                history_cache.put(uid, req.cache_key, body)
+        return jsonify(body), 200
     except Exception as e:
-        print(f"❌ Error in scanPalm: {e}")
+        print(f"❌ Error in transaction_history: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/stats", methods=["GET"])
+def stats():
+    """Reports user cache and transaction store counters for sizing and monitoring."""
+    return jsonify(collect_stats()), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Per-stage and per-endpoint latency histograms in the Prometheus text format."""
+    return metrics.render(), 200, {"Content-Type": CONTENT_TYPE}
+
+def collect_stats():
+    return {
+        "userCache": user_cache.stats(),
+        "transactions": transaction_store.stats(),
+        "enrolledPalms": len(palm_index),
+        "idempotency": idempotency_cache.stats(),
+        "historyCache": history_cache.stats(),
+    }
+
 if __name__ == "__main__":
     # The server will run on all available network interfaces on port 8080.
     # For local development, you can access it via http://127.0.0.1:8080/
@@ -59,12 +59,13 @@ def send_post(endpoint, image_path, token_dict):
         print("-" * 40)
 
 # === SPAM LOOP ===
-for i in range(15):
-    merchant = MERCHANTS[i % len(MERCHANTS)]
-    amount = round(random.uniform(1.5, 50.0), 2)  # Random RM1.50 - RM50.00
-    scan_token = {
-        "merchant": merchant,
-        "amount": amount
-    }
-    send_post("scanPalm", IMAGE_PATH, scan_token)
-    time.sleep(1)  # optional delay to not flood the server too hard
+if __name__ == "__main__":
+    for i in range(15):
+        merchant = MERCHANTS[i % len(MERCHANTS)]
+        amount = round(random.uniform(1.5, 50.0), 2)  # Random RM1.50 - RM50.00
+        scan_token = {
+            "merchant": merchant,
+            "amount": amount
+        }
+        send_post("scanPalm", IMAGE_PATH, scan_token)
+        time.sleep(1)  # optional delay to not flood the server too hard
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+# === CONFIG ===
+ROLLUP_COLLECTION = "monthlySpend"
+# Months roll over at midnight in this zone (the app shows RM amounts, so Malaysia by default)
+ROLLUP_TIMEZONE = os.getenv("ROLLUP_TIMEZONE", "Asia/Kuala_Lumpur")
+MONTH_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+def _zone():
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(ROLLUP_TIMEZONE)
+    except Exception as e:
+        print(f"Warning: time zone {ROLLUP_TIMEZONE} unavailable ({e}), spend months roll over in UTC.")
+        return timezone.utc
+
+ZONE = _zone()
+
+
+def month_key(timestamp):
+    """YYYY-MM of a Unix timestamp in ROLLUP_TIMEZONE."""
+    return datetime.fromtimestamp(timestamp, ZONE).strftime("%Y-%m")
+
+
+def current_month():
+    return datetime.now(ZONE).strftime("%Y-%m")
+
+
+def user_rollup_ref(db, uid, month):
+    """users/{uid}/monthlySpend/{YYYY-MM}: totals across accounts, by category and by account."""
+    return db.collection("users").document(uid).collection(ROLLUP_COLLECTION).document(month)
+
+
+def account_rollup_ref(db, uid, account_id, month):
+    """users/{uid}/linkedAccounts/{acc}/monthlySpend/{YYYY-MM}: one account's totals by category."""
+    return db.collection("users").document(uid) \
+        .collection("linkedAccounts").document(account_id) \
+        .collection(ROLLUP_COLLECTION).document(month)
+
+
+# === WRITE PATH ===
+def rollup_deltas(transactions):
+    """
+    Sums successful transactions into per-(user, month) and per-(user, account, month)
+    deltas. Amounts are kept in integer cents so repeated increments never drift.
+    """
+    users, accounts = {}, {}
+    for txn in transactions:
+        data = txn["data"]
+        if data.get("status", "success") != "success":
+            continue
+        cents = int(round(float(data["amount"]) * 100))
+        category = data.get("category") or "Others"
+        month = month_key(data["timestamp"])
+        for deltas, key in ((users, (txn["user_id"], month)), (accounts, (txn["user_id"], txn["account_id"], month))):
+            delta = deltas.setdefault(key, {"cents": 0, "count": 0, "categories": {}, "accounts": {}})
+            delta["cents"] += cents
+            delta["count"] += 1
+            _add(delta["categories"], category, cents)
+            if len(key) == 2:
+                _add(delta["accounts"], txn["account_id"], cents)
+    return users, accounts
+
+
+def _add(breakdown, name, cents):
+    entry = breakdown.setdefault(name, {"cents": 0, "count": 0})
+    entry["cents"] += cents
+    entry["count"] += 1
+
+
+def add_rollup_writes(batch, db, transactions):
+    """
+    Adds the rollup increments for transactions to batch, one merged write per rollup
+    document, so they commit atomically with the transactions. Returns the write count.
+    """
+    from firebase_admin import firestore
+
+    def fields(month, delta):
+        doc = {
+            "month": month,
+            "totalCents": firestore.Increment(delta["cents"]),
+            "count": firestore.Increment(delta["count"]),
+            "categories": {name: {"totalCents": firestore.Increment(e["cents"]), "count": firestore.Increment(e["count"])}
+                           for name, e in delta["categories"].items()},
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+        }
+        if delta["accounts"]:
+            doc["accounts"] = {name: {"totalCents": firestore.Increment(e["cents"]), "count": firestore.Increment(e["count"])}
+                               for name, e in delta["accounts"].items()}
+        return doc
+
+    users, accounts = rollup_deltas(transactions)
+    for (uid, month), delta in users.items():
+        batch.set(user_rollup_ref(db, uid, month), fields(month, delta), merge=True)
+    for (uid, account_id, month), delta in accounts.items():
+        batch.set(account_rollup_ref(db, uid, account_id, month), fields(month, delta), merge=True)
+    return len(users) + len(accounts)
+
+
+# === READ PATH ===
+def validate_month(month):
+    """Returns month (default: the current one); raises ValueError unless it is YYYY-MM."""
+    if month is None:
+        return current_month()
+    if not MONTH_PATTERN.match(month):
+        raise ValueError("'month' must be in YYYY-MM format")
+    return month
+
+
+def format_rollup(uid, month, data, account_id=None):
+    """Response body for a rollup document (all zeros when there is none yet)."""
+    data = data or {}
+
+    def breakdown(entries):
+        return {name: {"total": e.get("totalCents", 0) / 100, "count": e.get("count", 0)}
+                for name, e in sorted((entries or {}).items())}
+
+    body = {
+        "uid": uid,
+        "month": month,
+        "total": data.get("totalCents", 0) / 100,
+        "count": data.get("count", 0),
+        "categories": breakdown(data.get("categories")),
+    }
+    if account_id is None:
+        body["accounts"] = breakdown(data.get("accounts"))
+    else:
+        body["account"] = account_id
+    return body
+
+
+def read_monthly_spend(db, uid, month, account_id=None):
+    """One document read, however many transactions the month has."""
+    ref = user_rollup_ref(db, uid, month) if account_id is None else account_rollup_ref(db, uid, account_id, month)
+    return format_rollup(uid, month, ref.get().to_dict(), account_id)
+
+
+# === BACKFILL ===
+def rebuild(db, uid):
+    """
+    Recomputes a user's rollups from their transactions and overwrites them. For
+    transactions written before rollups existed; run it while the user is not paying,
+    since a payment committed during the scan can be counted twice or not at all.
+    """
+    transactions = []
+    for account in db.collection("users").document(uid).collection("linkedAccounts").stream():
+        for doc in account.reference.collection("transactions").stream():
+            data = doc.to_dict()
+            timestamp = data.get("timestamp")
+            if timestamp is None or data.get("amount") is None:
+                continue
+            data["timestamp"] = timestamp.timestamp() if hasattr(timestamp, "timestamp") else float(timestamp)
+            transactions.append({"user_id": uid, "account_id": account.id, "data": data})
+
+    users, accounts = rollup_deltas(transactions)
+    batch, writes = db.batch(), 0
+    for key, delta in list(users.items()) + list(accounts.items()):
+        ref = user_rollup_ref(db, *key) if len(key) == 2 else account_rollup_ref(db, *key)
+        month = key[-1]
+        doc = {"month": month, "totalCents": delta["cents"], "count": delta["count"],
+               "categories": {n: {"totalCents": e["cents"], "count": e["count"]} for n, e in delta["categories"].items()},
+               "updatedAt": datetime.now(timezone.utc)}
+        if delta["accounts"]:
+            doc["accounts"] = {n: {"totalCents": e["cents"], "count": e["count"]} for n, e in delta["accounts"].items()}
+        batch.set(ref, doc)
+        writes += 1
+        if writes % 500 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return len(transactions), writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild monthly spend rollups from existing transactions.")
+    parser.add_argument("uids", nargs="*", help="Users to rebuild (default: every user).")
+    args = parser.parse_args()
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    firebase_admin.initialize_app(credentials.Certificate(json.loads(os.environ["FIREBASE_CREDS"])))
+    db = firestore.client()
+
+    uids = args.uids or [doc.id for doc in db.collection("users").select([]).stream()]
+    for uid in uids:
+        count, writes = rebuild(db, uid)
+        print(f"✅ {uid}: {count} transactions -> {writes} rollup documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from datetime import datetime, timezone
+
+import spend_rollups
+from fake_firestore import FakeFirestore
+
+# Monthly spend rollups: deltas, the batched increments, the read path and the backfill.
+# Run from processing_server: python spend_rollups_test.py (or pytest spend_rollups_test.py)
+
+# === CONFIG ===
+JULY = datetime(2025, 7, 17, 12, tzinfo=timezone.utc).timestamp()
+# 2025-07-31 20:00 UTC is already 1 August in Kuala Lumpur (UTC+8)
+MONTH_END = datetime(2025, 7, 31, 20, tzinfo=timezone.utc).timestamp()
+
+
+def txn(txn_id, amount, account_id="acc-1", category="Groceries", status="success", timestamp=JULY):
+    return {"id": txn_id, "user_id": "user-1", "account_id": account_id,
+            "data": {"amount": amount, "category": category, "status": status, "timestamp": timestamp}}
+
+
+TRANSACTIONS = [
+    txn("t1", 10.10),
+    txn("t2", 0.20, category="Bills"),
+    txn("t3", 5.00, account_id="acc-2", category=None),
+    txn("t4", 99.00, status="failed"),
+    txn("t5", 1.00, timestamp=MONTH_END),
+]
+
+
+def commit(db, transactions):
+    batch = db.batch()
+    writes = spend_rollups.add_rollup_writes(batch, db, transactions)
+    batch.commit()
+    return writes
+
+
+def test_month_key_uses_rollup_timezone():
+    assert spend_rollups.month_key(JULY) == "2025-07"
+    expected = "2025-08" if spend_rollups.ZONE is not timezone.utc else "2025-07"
+    assert spend_rollups.month_key(MONTH_END) == expected
+
+
+def test_deltas_sum_successful_payments_in_cents():
+    users, accounts = spend_rollups.rollup_deltas(TRANSACTIONS[:4])
+    july = users[("user-1", "2025-07")]
+    assert (july["cents"], july["count"]) == (1530, 3)  # 10.10 + 0.20 + 5.00, the failed one skipped
+    assert july["categories"] == {"Groceries": {"cents": 1010, "count": 1}, "Bills": {"cents": 20, "count": 1},
+                                  "Others": {"cents": 500, "count": 1}}
+    assert july["accounts"] == {"acc-1": {"cents": 1030, "count": 2}, "acc-2": {"cents": 500, "count": 1}}
+    assert accounts[("user-1", "acc-2", "2025-07")]["cents"] == 500
+    assert accounts[("user-1", "acc-1", "2025-07")]["accounts"] == {}
+
+
+def test_increments_accumulate_across_batches():
+    db = FakeFirestore()
+    assert commit(db, TRANSACTIONS[:2]) == 2  # the user's month and acc-1's month
+    commit(db, TRANSACTIONS[2:4])
+    spend = spend_rollups.read_monthly_spend(db, "user-1", "2025-07")
+    assert (spend["total"], spend["count"]) == (15.3, 3)
+    assert spend["categories"]["Groceries"] == {"total": 10.1, "count": 1}
+    assert spend["accounts"] == {"acc-1": {"total": 10.3, "count": 2}, "acc-2": {"total": 5.0, "count": 1}}
+
+    account = spend_rollups.read_monthly_spend(db, "user-1", "2025-07", account_id="acc-1")
+    assert (account["account"], account["total"], account["count"]) == ("acc-1", 10.3, 2)
+    assert "accounts" not in account
+
+
+def test_empty_month_reads_as_zero():
+    spend = spend_rollups.read_monthly_spend(FakeFirestore(), "user-1", "2024-01")
+    assert spend == {"uid": "user-1", "month": "2024-01", "total": 0, "count": 0, "categories": {}, "accounts": {}}
+
+
+def test_validate_month():
+    assert spend_rollups.validate_month("2025-12") == "2025-12"
+    assert spend_rollups.validate_month(None) == spend_rollups.current_month()
+    for bad in ("2025-13", "2025-7", "July"):
+        try:
+            spend_rollups.validate_month(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"expected ValueError for {bad}")
+
+
+def test_rebuild_matches_incremental_rollups():
+    incremental, rebuilt = FakeFirestore(), FakeFirestore()
+    commit(incremental, TRANSACTIONS)
+    for t in TRANSACTIONS:
+        account = rebuilt.collection("users").document("user-1").collection("linkedAccounts").document(t["account_id"])
+        account.set({"name": t["account_id"]})
+        account.collection("transactions").document(t["id"]).set(
+            dict(t["data"], timestamp=datetime.fromtimestamp(t["data"]["timestamp"], timezone.utc)))
+
+    assert spend_rollups.rebuild(rebuilt, "user-1")[0] == len(TRANSACTIONS)
+    for month in ("2025-07", spend_rollups.month_key(MONTH_END)):
+        for account_id in (None, "acc-1", "acc-2"):
+            assert spend_rollups.read_monthly_spend(rebuilt, "user-1", month, account_id) == \
+                spend_rollups.read_monthly_spend(incremental, "user-1", month, account_id)
+
+
+if __name__ == "__main__":
+    test_month_key_uses_rollup_timezone()
+    test_deltas_sum_successful_payments_in_cents()
+    test_increments_accumulate_across_batches()
+    test_empty_month_reads_as_zero()
+    test_validate_month()
+    test_rebuild_matches_incremental_rollups()
+    print("✅ Monthly spend rollups add up, read back and rebuild")
@@ -0,0 +1,252 @@
+import asyncio
+import base64
+import heapq
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+# === CONFIG ===
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+MAX_PAGE_SIZE = 100
+HISTORY_FANOUT = int(os.getenv("HISTORY_FANOUT", "8"))  # accounts queried in parallel per request
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "10000"))  # users
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "30"))  # seconds
+MAX_CURSOR_LENGTH = 16384
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+_fanout_pool = ThreadPoolExecutor(max_workers=HISTORY_FANOUT, thread_name_prefix="history")
+
+
+# === CURSORS ===
+class HistoryPosition:
+    """
+    Where a page ended: the timestamp (in microseconds) of its last transaction and
+    the "account/id" keys of every transaction already returned at exactly that
+    timestamp. The next page queries timestamp <= t and skips those, so transactions
+    sharing a timestamp across a page boundary are neither lost nor repeated.
+    """
+
+    def __init__(self, micros, seen=()):
+        self.micros = micros
+        self.seen = set(seen)
+
+    def encode(self):
+        raw = json.dumps({"t": self.micros, "seen": sorted(self.seen)}, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    @classmethod
+    def decode(cls, token):
+        """Parses a nextCursor token; raises ValueError when it is not one."""
+        if len(token) > MAX_CURSOR_LENGTH:
+            raise ValueError("'cursor' is too long")
+        try:
+            body = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            micros, seen = body["t"], body["seen"]
+            if not isinstance(micros, int) or not all(isinstance(key, str) for key in seen):
+                raise TypeError
+        except (ValueError, TypeError, KeyError):
+            raise ValueError("'cursor' is not a valid history cursor")
+        return cls(micros, seen)
+
+    def seen_in(self, account_id):
+        prefix = f"{account_id}/"
+        return sum(1 for key in self.seen if key.startswith(prefix))
+
+
+def to_micros(timestamp):
+    return (timestamp - EPOCH) // MICROSECOND
+
+
+def from_micros(micros):
+    return EPOCH + micros * MICROSECOND
+
+
+# === REQUESTS ===
+class HistoryRequest:
+    """A validated page request: page size, cursor and the optional account and category filters."""
+
+    def __init__(self, page_size=HISTORY_PAGE_SIZE, cursor=None, account_id=None, category=None):
+        self.page_size = page_size
+        self.cursor = cursor
+        self.account_id = account_id
+        self.category = category
+
+    @classmethod
+    def from_args(cls, args):
+        """From request query parameters (?limit=&cursor=&account=&category=); raises ValueError."""
+        try:
+            page_size = int(args.get("limit", HISTORY_PAGE_SIZE))
+        except ValueError:
+            raise ValueError("'limit' must be an integer")
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f"'limit' must be between 1 and {MAX_PAGE_SIZE}")
+        cursor = args.get("cursor")
+        return cls(page_size, HistoryPosition.decode(cursor) if cursor else None,
+                   args.get("account") or None, args.get("category") or None)
+
+    @property
+    def first_page(self):
+        return self.cursor is None
+
+    @property
+    def cache_key(self):
+        return self.account_id, self.category, self.page_size
+
+
+# === QUERIES ===
+def accounts_ref(db, uid):
+    return db.collection("users").document(uid).collection("linkedAccounts")
+
+
+def account_query(db, uid, account_id, req):
+    """
+    One account's next candidates, newest first. The category filter and the cursor are
+    pushed into the query, so Firestore reads at most page_size + 1 (plus the already
+    returned ties) documents per account. The category filter needs a composite index
+    on transactions (category ASC, timestamp DESC), which Firestore offers to create
+    from the error of the first such query.
+    """
+    query = accounts_ref(db, uid).document(account_id).collection("transactions")
+    if req.category is not None:
+        query = query.where("category", "==", req.category)
+    limit = req.page_size + 1
+    if req.cursor is not None:
+        query = query.where("timestamp", "<=", from_micros(req.cursor.micros))
+        limit += req.cursor.seen_in(account_id)
+    return query.order_by("timestamp", direction="DESCENDING").limit(limit)
+
+
+def candidates(account_id, snapshots, cursor):
+    """(micros, account, id, data) rows sorted newest first, minus those the cursor has already returned."""
+    rows = []
+    for snap in snapshots:
+        data = snap.to_dict()
+        timestamp = data.get("timestamp")
+        if not isinstance(timestamp, datetime):
+            continue
+        micros = to_micros(timestamp)
+        if cursor is not None and micros == cursor.micros and f"{account_id}/{snap.id}" in cursor.seen:
+            continue
+        rows.append((micros, account_id, snap.id, data))
+    rows.sort(key=lambda row: row[:3], reverse=True)
+    return rows
+
+
+def merge_page(uid, req, per_account):
+    """
+    k-way merges the per-account candidate lists by (timestamp, account, id), newest
+    first, and cuts the page. Each list holds page_size + 1 rows when the account has
+    that many, so the merge always knows whether another page follows.
+    """
+    merged = heapq.merge(*per_account, key=lambda row: row[:3], reverse=True)
+    rows = [row for _, row in zip(range(req.page_size + 1), merged)]
+    page, more = rows[:req.page_size], len(rows) > req.page_size
+
+    next_cursor = None
+    if more:
+        last = page[-1][0]
+        seen = {f"{account_id}/{txn_id}" for micros, account_id, txn_id, _ in page if micros == last}
+        if req.cursor is not None and req.cursor.micros == last:
+            seen |= req.cursor.seen
+        next_cursor = HistoryPosition(last, seen).encode()
+
+    return {
+        "uid": uid,
+        "transactions": [format_transaction(*row) for row in page],
+        "nextCursor": next_cursor,
+    }
+
+
+def format_transaction(micros, account_id, txn_id, data):
+    return {
+        "id": txn_id,
+        "account": account_id,
+        "amount": data.get("amount"),
+        "merchant": data.get("merchant"),
+        "category": data.get("category"),
+        "status": data.get("status"),
+        "timestamp": micros / 1e6,
+    }
+
+
+def read_history(db, uid, req):
+    """One page of a user's transactions across linked accounts, with the account queries run in parallel."""
+    if req.account_id is not None:
+        account_ids = [req.account_id]
+    else:
+        account_ids = [doc.id for doc in accounts_ref(db, uid).select([]).stream()]
+
+    def fetch(account_id):
+        return candidates(account_id, account_query(db, uid, account_id, req).stream(), req.cursor)
+
+    per_account = list(_fanout_pool.map(fetch, account_ids)) if len(account_ids) > 1 else \
+        [fetch(account_id) for account_id in account_ids]
+    return merge_page(uid, req, per_account)
+
+
+async def read_history_async(db, uid, req):
+    """read_history() through a Firestore AsyncClient, with the account queries awaited together."""
+    if req.account_id is not None:
+        account_ids = [req.account_id]
+    else:
+        account_ids = [doc.id async for doc in accounts_ref(db, uid).select([]).stream()]
+
+    async def fetch(account_id):
+        return candidates(account_id, await account_query(db, uid, account_id, req).get(), req.cursor)
+
+    per_account = await asyncio.gather(*(fetch(account_id) for account_id in account_ids))
+    return merge_page(uid, req, per_account)
+
+
+# === FIRST-PAGE CACHE ===
+class FirstPageCache:
+    """
+    Bounded LRU of users' first history pages (one per filter and page size), with a
+    TTL. Opening the history screen is by far the most common request and always asks
+    for the first page, so repeat opens are served without touching Firestore. A
+    user's pages are dropped as soon as a transaction of theirs is committed by this
+    process; the TTL bounds staleness from commits made by other workers.
+    """
+
+    def __init__(self, max_size=HISTORY_CACHE_SIZE, ttl=HISTORY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # uid -> {cache key: (expires_at, body)}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, uid, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(uid, {}).get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(uid)
+                self._counters["hits"] += 1
+                return entry[1]
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, uid, key, body):
+        with self._lock:
+            self._entries.setdefault(uid, {})[key] = (time.monotonic() + self.ttl, body)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate(self, uids):
+        with self._lock:
+            for uid in uids:
+                if self._entries.pop(uid, None) is not None:
+                    self._counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return dict(self._counters, size=len(self._entries), max_size=self.max_size,
+                        hit_rate=round(self._counters["hits"] / lookups, 4) if lookups else 0.0)
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta, timezone
+
+import transaction_history
+from fake_firestore import FakeFirestore
+from transaction_history import FirstPageCache, HistoryPosition, HistoryRequest, read_history
+
+# Cursor pagination merged across linked accounts, on the fake Firestore.
+# Run from processing_server: python transaction_history_test.py (or pytest transaction_history_test.py)
+
+# === CONFIG ===
+START = datetime(2025, 7, 1, tzinfo=timezone.utc)
+ACCOUNTS = ("acc-a", "acc-b", "acc-c")
+CATEGORIES = ("Groceries", "Bills")
+
+
+def seed(db, uid="user-1", per_account=7):
+    """Transactions spread over the accounts, with several sharing one timestamp across accounts."""
+    accounts = db.collection("users").document(uid).collection("linkedAccounts")
+    expected = []
+    for a, account_id in enumerate(ACCOUNTS):
+        accounts.document(account_id).set({"name": account_id})
+        for i in range(per_account):
+            # Every third transaction lands on the same minute in every account
+            minutes = 100 if i % 3 == 0 else i * 10 + a
+            timestamp = START + timedelta(minutes=minutes)
+            txn_id = f"{account_id}-{i}"
+            accounts.document(account_id).collection("transactions").document(txn_id).set(
+                {"amount": i + 1, "merchant": "Tesco", "category": CATEGORIES[i % 2],
+                 "status": "success", "timestamp": timestamp})
+            expected.append((timestamp, account_id, txn_id, CATEGORIES[i % 2]))
+    expected.sort(reverse=True)
+    return expected
+
+
+def read_all(db, uid, **filters):
+    """Follows nextCursor through every page. Returns (transactions, page count)."""
+    transactions, pages, cursor = [], 0, None
+    while True:
+        req = HistoryRequest.from_args(dict(filters, limit="4", **({"cursor": cursor} if cursor else {})))
+        page = read_history(db, uid, req)
+        assert len(page["transactions"]) <= 4
+        transactions.extend(page["transactions"])
+        pages += 1
+        cursor = page["nextCursor"]
+        if cursor is None:
+            return transactions, pages
+
+
+def test_pages_cover_every_account_in_order():
+    db = FakeFirestore()
+    expected = seed(db)
+    transactions, pages = read_all(db, "user-1")
+    assert [(t["account"], t["id"]) for t in transactions] == [(acc, txn_id) for _, acc, txn_id, _ in expected]
+    assert pages == -(-len(expected) // 4)
+    assert transactions[0]["timestamp"] == expected[0][0].timestamp()
+
+
+def test_filters():
+    db = FakeFirestore()
+    expected = seed(db)
+    bills, _ = read_all(db, "user-1", category="Bills")
+    assert [t["id"] for t in bills] == [txn_id for _, _, txn_id, category in expected if category == "Bills"]
+    one_account, _ = read_all(db, "user-1", account="acc-b")
+    assert [t["id"] for t in one_account] == [txn_id for _, acc, txn_id, _ in expected if acc == "acc-b"]
+
+
+def test_user_without_accounts():
+    page = read_history(FakeFirestore(), "nobody", HistoryRequest())
+    assert page == {"uid": "nobody", "transactions": [], "nextCursor": None}
+
+
+def test_cursor_round_trip_and_rejection():
+    position = HistoryPosition(1_751_328_000_000_000, {"acc-a/t1", "acc-b/t2"})
+    decoded = HistoryPosition.decode(position.encode())
+    assert (decoded.micros, decoded.seen) == (position.micros, position.seen)
+    assert decoded.seen_in("acc-a") == 1
+    for bad in ("not-a-cursor", "x" * (transaction_history.MAX_CURSOR_LENGTH + 1),
+                HistoryPosition("soon", ()).encode()):
+        try:
+            HistoryPosition.decode(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"expected ValueError for {bad[:20]!r}")
+    for args in ({"limit": "0"}, {"limit": "many"}, {"limit": str(transaction_history.MAX_PAGE_SIZE + 1)}):
+        try:
+            HistoryRequest.from_args(args)
+        except ValueError:
+            continue
+        raise AssertionError(f"expected ValueError for {args}")
+
+
+def test_first_page_cache():
+    cache = FirstPageCache(max_size=2)
+    cache.put("user-1", ("acc-a", None, 20), {"page": 1})
+    assert cache.get("user-1", ("acc-a", None, 20)) == {"page": 1}
+    assert cache.get("user-1", (None, None, 20)) is None
+    cache.invalidate({"user-1"})  # a transaction of theirs was committed
+    assert cache.get("user-1", ("acc-a", None, 20)) is None
+
+    for uid in ("user-1", "user-2", "user-3"):
+        cache.put(uid, (None, None, 20), {"uid": uid})
+    assert cache.get("user-1", (None, None, 20)) is None  # least recently used, evicted
+    assert cache.stats()["evictions"] == 1
+
+
+if __name__ == "__main__":
+    test_pages_cover_every_account_in_order()
+    test_filters()
+    test_user_without_accounts()
+    test_cursor_round_trip_and_rejection()
+    test_first_page_cache()
+    print("✅ History pages merge every account without gaps or repeats")
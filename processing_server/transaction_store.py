@@ -0,0 +1,329 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+import spend_rollups
+
+# === CONFIG ===
+TRANSACTION_JOURNAL = os.getenv("TRANSACTION_JOURNAL", "transactions.journal")
+FLUSH_INTERVAL = float(os.getenv("TRANSACTION_FLUSH_INTERVAL", "0.2"))  # seconds
+MAX_BATCH_SIZE = 500  # Firestore's limit on writes per batch
+# A transaction costs up to three writes: itself plus its user and account monthly rollups
+TRANSACTIONS_PER_FIRESTORE_BATCH = MAX_BATCH_SIZE // 3
+# Transactions the backend rejects on their own are parked here (next to the journal by default)
+TRANSACTION_DEAD_LETTER = os.getenv("TRANSACTION_DEAD_LETTER")
+
+
+def is_retryable(error):
+    """
+    Whether a commit error is worth retrying as is: the backend was unreachable, overloaded
+    or timed out. Anything else (a rejected write, bad data) fails the same way every time.
+    """
+    if isinstance(error, (OSError, sqlite3.OperationalError)):
+        return True
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (exceptions.ServiceUnavailable, exceptions.DeadlineExceeded,
+                              exceptions.InternalServerError, exceptions.Aborted,
+                              exceptions.TooManyRequests, exceptions.Unknown, exceptions.RetryError))
+
+
+# === BACKENDS ===
+class FirestoreBackend:
+    """
+    Commits transactions to users/{uid}/linkedAccounts/{acc}/transactions in batched
+    writes, with the monthly spend rollups (spend_rollups.py) incremented in the same batch.
+
+    Transactions are created with a must-not-exist precondition, so a batch replayed
+    from the journal after a crash (or a payment retried under the same idempotency key)
+    fails instead of incrementing the rollups twice; its transactions are then committed
+    one at a time and the ones already in Firestore skipped.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def commit(self, transactions):
+        from google.api_core.exceptions import AlreadyExists
+
+        for start in range(0, len(transactions), TRANSACTIONS_PER_FIRESTORE_BATCH):
+            chunk = transactions[start:start + TRANSACTIONS_PER_FIRESTORE_BATCH]
+            try:
+                self._commit_batch(chunk)
+            except AlreadyExists:
+                for txn in chunk:
+                    try:
+                        self._commit_batch([txn])
+                    except AlreadyExists:
+                        print(f"Transaction {txn['id']} is already committed, skipping it")
+
+    def _commit_batch(self, transactions):
+        batch = self.db.batch()
+        for txn in transactions:
+            ref = self.db.collection("users") \
+                .document(txn["user_id"]) \
+                .collection("linkedAccounts") \
+                .document(txn["account_id"]) \
+                .collection("transactions") \
+                .document(txn["id"])
+            data = dict(txn["data"])
+            data["timestamp"] = datetime.fromtimestamp(data["timestamp"], tz=timezone.utc)
+            batch.create(ref, data)
+        spend_rollups.add_rollup_writes(batch, self.db, transactions)
+        batch.commit()
+
+
+class SQLiteBackend:
+    """Local stand-in for Firestore, for offline throughput runs."""
+
+    def __init__(self, path=":memory:"):
+        self._lock = threading.Lock()  # one connection shared across threads
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS transactions ("
+            "id TEXT PRIMARY KEY, user_id TEXT, account_id TEXT, timestamp REAL, data TEXT)"
+        )
+
+    def commit(self, transactions):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?)",
+                [(t["id"], t["user_id"], t["account_id"], t["data"]["timestamp"], json.dumps(t["data"]))
+                 for t in transactions],
+            )
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+
+class MemoryBackend:
+    """Keeps committed transactions in a dict keyed by transaction ID."""
+
+    def __init__(self):
+        self.transactions = {}
+        self.batches = 0
+
+    def commit(self, transactions):
+        for txn in transactions:
+            self.transactions[txn["id"]] = txn
+        self.batches += 1
+
+
+def create_backend(spec, db=None):
+    """Builds a backend from a TRANSACTION_BACKEND value: firestore, memory or sqlite[:path]."""
+    if spec == "firestore":
+        return FirestoreBackend(db)
+    if spec == "memory":
+        return MemoryBackend()
+    if spec.startswith("sqlite"):
+        _, _, path = spec.partition(":")
+        return SQLiteBackend(path or "transactions.sqlite")
+    raise ValueError(f"Unknown transaction backend: {spec}")
+
+
+# === WRITE-BEHIND STORE ===
+class TransactionStore:
+    """
+    Write-behind transaction persistence.
+
+    record() appends the transaction to a local append-only journal, fsyncs it and
+    returns, so a payment is acknowledged once it is durable on local disk. A
+    flusher thread commits pending transactions to the backend in batches of up
+    to MAX_BATCH_SIZE every flush_interval seconds and marks them committed in the
+    journal. On start-up, journal entries without a commit mark are replayed.
+
+    A batch that fails with a retryable error (is_retryable) stays pending for the next
+    flush. Any other failure is retried one transaction at a time, so one bad transaction
+    can't hold up the rest; a transaction that still fails on its own is written to the
+    dead-letter file (JSON lines with the error) and counted, instead of blocking the queue.
+
+    Each process needs its own journal file. on_commit, if given, is called with every
+    batch once the backend has committed it.
+    """
+
+    def __init__(self, backend, journal_path=TRANSACTION_JOURNAL, flush_interval=FLUSH_INTERVAL,
+                 max_batch_size=MAX_BATCH_SIZE, fsync=True, on_commit=None, dead_letter_path=TRANSACTION_DEAD_LETTER):
+        self.backend = backend
+        self.on_commit = on_commit
+        self.journal_path = journal_path
+        self.dead_letter_path = dead_letter_path or f"{journal_path}.dead"
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.fsync = fsync
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one flush at a time, so a batch is never committed twice
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._counters = {"recorded": 0, "committed": 0, "batches": 0, "failed_batches": 0,
+                          "dead_lettered": 0, "replayed": 0}
+
+        self._pending = self._replay()
+        self._counters["replayed"] = len(self._pending)
+        self._journal = open(journal_path, "a", encoding="utf-8")
+        if self._pending:
+            print(f"Replaying {len(self._pending)} uncommitted transactions from {journal_path}")
+        self._flusher = threading.Thread(target=self._flush_loop, name="transaction-flusher", daemon=True)
+        self._flusher.start()
+
+    def record(self, user_id, account_id, data, txn_id=None):
+        """
+        Durably journals one transaction and queues it for commit. Returns its ID.
+        A caller-supplied txn_id makes a repeated record() overwrite the same document.
+        """
+        now = time.time()
+        txn = {
+            "id": txn_id or uuid.uuid4().hex,
+            "user_id": user_id,
+            "account_id": account_id,
+            "data": dict(data, timestamp=data.get("timestamp", now)),
+            "journaled_at": now,  # the payment's own timestamp can be much older (forwarded late by the Pi)
+        }
+        line = json.dumps({"op": "txn", "txn": txn}) + "\n"
+        with self._lock:
+            self._append(line)
+            self._pending.append(txn)
+            self._counters["recorded"] += 1
+            full = len(self._pending) >= self.max_batch_size
+        if full:
+            self._wake.set()
+        return txn["id"]
+
+    def stats(self):
+        with self._lock:
+            lag = time.time() - self._pending[0]["journaled_at"] if self._pending else 0.0
+            return dict(self._counters, pending=len(self._pending), lag_seconds=round(lag, 3))
+
+    def flush(self):
+        """Commits everything pending now. Returns the number of transactions committed."""
+        committed = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self.max_batch_size]
+                if not batch:
+                    return committed
+                try:
+                    self.backend.commit(batch)
+                except Exception as e:
+                    print(f"❌ Transaction batch commit failed ({len(batch)} pending): {e}")
+                    with self._lock:
+                        self._counters["failed_batches"] += 1
+                    if is_retryable(e):
+                        return committed  # the backend is unavailable; retried on the next flush
+                    done, finished = self._commit_each(batch)
+                    committed += done
+                    if not finished:
+                        return committed
+                    continue
+                self._settle(batch, "commit")
+                committed += len(batch)
+
+    def _commit_each(self, batch):
+        """
+        Commits a failed batch one transaction at a time, dead-lettering the ones that fail
+        on their own. Returns (number committed, False if it stopped early because the
+        backend became unavailable).
+        """
+        committed = 0
+        for txn in batch:
+            try:
+                self.backend.commit([txn])
+            except Exception as e:
+                if is_retryable(e):
+                    print(f"❌ Transaction {txn['id']} commit failed, retrying later: {e}")
+                    return committed, False
+                self._dead_letter(txn, e)
+                continue
+            self._settle([txn], "commit")
+            committed += 1
+        return committed, True
+
+    def _dead_letter(self, txn, error):
+        print(f"❌ Transaction {txn['id']} rejected on its own, moved to {self.dead_letter_path}: {error}")
+        entry = {"txn": txn, "error": f"{type(error).__name__}: {error}", "at": time.time()}
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._settle([txn], "dead_letter")
+
+    def _settle(self, txns, op):
+        """Takes committed ("commit") or dead-lettered ("dead_letter") transactions off the queue."""
+        with self._lock:
+            if self._pending[:len(txns)] == txns:
+                del self._pending[:len(txns)]  # the usual case: the head of the queue
+            else:
+                ids = {t["id"] for t in txns}
+                self._pending = [t for t in self._pending if t["id"] not in ids]
+            self._append(json.dumps({"op": op, "ids": [t["id"] for t in txns]}) + "\n")
+            if op == "commit":
+                self._counters["committed"] += len(txns)
+                self._counters["batches"] += 1
+            else:
+                self._counters["dead_lettered"] += len(txns)
+            if not self._pending:
+                self._truncate_journal()
+        if op == "commit" and self.on_commit is not None:
+            self.on_commit(txns)
+
+    def close(self):
+        """Stops the flusher after a final flush."""
+        self._stop_event.set()
+        self._wake.set()
+        self._flusher.join()
+        self.flush()
+        self._journal.close()
+
+    # === JOURNAL ===
+    def _append(self, line):
+        self._journal.write(line)
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _truncate_journal(self):
+        # Everything journalled so far is committed, so the journal can start over
+        self._journal.truncate(0)
+        self._journal.seek(0)
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return []
+        pending = {}
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn final write from a crash
+                if entry["op"] == "txn":
+                    pending[entry["txn"]["id"]] = entry["txn"]
+                elif entry["op"] in ("commit", "dead_letter"):
+                    for txn_id in entry["ids"]:
+                        pending.pop(txn_id, None)
+        # Rewrite the journal with only the uncommitted entries so the torn tail is dropped
+        replayed_at = time.time()
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            for txn in pending.values():
+                txn.setdefault("journaled_at", replayed_at)  # journals written before it was recorded
+                f.write(json.dumps({"op": "txn", "txn": txn}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return list(pending.values())
+
+    def _flush_loop(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:  # e.g. the dead-letter file can't be written; keep the flusher alive
+                print(f"❌ Transaction flush failed: {e}")
@@ -0,0 +1,161 @@
+import json
+import os
+import tempfile
+
+from google.api_core.exceptions import ServiceUnavailable
+
+import spend_rollups
+from fake_firestore import FakeFirestore
+from transaction_store import FirestoreBackend, MemoryBackend, TransactionStore
+
+# Journal replay, retry vs dead-letter on commit failures, and the AlreadyExists fallback
+# of the Firestore backend (on the fake Firestore).
+# Run from processing_server: python transaction_store_test.py (or pytest transaction_store_test.py)
+
+# === CONFIG ===
+TIMESTAMP = 1752710400.0  # 2025-07-17, so every test transaction falls in one rollup month
+
+
+class FlakyBackend(MemoryBackend):
+    """Commits to memory, except while down (raises ServiceUnavailable) or for rejected amounts."""
+
+    def __init__(self, rejected_amount=None):
+        super().__init__()
+        self.down = False
+        self.rejected_amount = rejected_amount
+
+    def commit(self, transactions):
+        if self.down:
+            raise ServiceUnavailable("backend unavailable")
+        if any(t["data"]["amount"] == self.rejected_amount for t in transactions):
+            raise ValueError("invalid transaction")
+        super().commit(transactions)
+
+
+def open_store(backend, journal_path=None):
+    journal_path = journal_path or os.path.join(tempfile.mkdtemp(), "transactions.journal")
+    return TransactionStore(backend, journal_path=journal_path, flush_interval=3600, fsync=False)
+
+
+def crash(store):
+    """Stops the flusher without the final flush close() does, as if the process died."""
+    store._stop_event.set()
+    store._wake.set()
+    store._flusher.join()
+    store._journal.close()
+
+
+def payment(amount, user_id="user-1", account_id="acc-1"):
+    return user_id, account_id, {"amount": amount, "merchant": "Tesco", "category": "Groceries",
+                                 "status": "success", "timestamp": TIMESTAMP}
+
+
+def test_uncommitted_transactions_are_replayed():
+    backend = FlakyBackend()
+    store = open_store(backend)
+    committed = store.record(*payment(1.0))
+    assert store.flush() == 1
+
+    backend.down = True
+    pending = [store.record(*payment(2.0)), store.record(*payment(3.0))]
+    assert store.flush() == 0
+    crash(store)
+    with open(store.journal_path, "a") as f:
+        f.write('{"op": "txn", "txn": {"id"')  # torn final write
+
+    backend = MemoryBackend()
+    store = open_store(backend, store.journal_path)
+    assert store.stats()["replayed"] == 2
+    assert store.flush() == 2
+    assert list(backend.transactions) == pending and committed not in backend.transactions
+    store.close()
+    assert os.path.getsize(store.journal_path) == 0  # everything committed, the journal starts over
+
+
+def test_retryable_failure_keeps_the_batch():
+    backend = FlakyBackend()
+    backend.down = True
+    store = open_store(backend)
+    ids = [store.record(*payment(amount)) for amount in (1.0, 2.0, 3.0)]
+    assert store.flush() == 0
+    stats = store.stats()
+    assert (stats["pending"], stats["failed_batches"], stats["dead_lettered"]) == (3, 1, 0)
+
+    backend.down = False
+    assert store.flush() == 3
+    assert list(backend.transactions) == ids and backend.batches == 1
+    assert not os.path.exists(store.dead_letter_path)
+    store.close()
+
+
+def test_rejected_transaction_is_dead_lettered():
+    backend = FlakyBackend(rejected_amount=-1)
+    store = open_store(backend)
+    good, bad, later = (store.record(*payment(amount)) for amount in (1.0, -1, 2.0))
+    assert store.flush() == 2
+    stats = store.stats()
+    assert (stats["pending"], stats["committed"], stats["dead_lettered"]) == (0, 2, 1)
+    assert list(backend.transactions) == [good, later]
+
+    with open(store.dead_letter_path) as f:
+        entries = [json.loads(line) for line in f]
+    assert [e["txn"]["id"] for e in entries] == [bad]
+    assert entries[0]["error"] == "ValueError: invalid transaction"
+
+    # A dead-lettered transaction is not replayed after a restart
+    crash(store)
+    store = open_store(MemoryBackend(), store.journal_path)
+    assert store.stats()["replayed"] == 0
+    store.close()
+
+
+def test_backend_outage_while_retrying_one_by_one_stops_early():
+    backend = FlakyBackend(rejected_amount=-1)
+    store = open_store(backend)
+    bad = store.record(*payment(-1))
+    store.record(*payment(1.0))
+    commit = backend.commit
+
+    def reject_then_go_down(transactions):
+        if len(transactions) == 1 and transactions[0]["id"] == bad:
+            backend.down = True  # the outage starts after the bad one was tried on its own
+        commit(transactions)
+    backend.commit = reject_then_go_down
+
+    assert store.flush() == 0
+    assert store.stats()["pending"] == 2 and store.stats()["dead_lettered"] == 0
+
+    # Once the backend is back the bad transaction is judged on its own merits
+    backend.commit, backend.down = commit, False
+    assert store.flush() == 1
+    assert store.stats()["pending"] == 0 and store.stats()["dead_lettered"] == 1
+    store.close()
+
+
+def test_already_committed_transactions_are_skipped():
+    db = FakeFirestore()
+    backend = FirestoreBackend(db)
+    first = {"id": "txn-1", "user_id": "user-1", "account_id": "acc-1", "data": payment(10.0)[2]}
+    second = {"id": "txn-2", "user_id": "user-1", "account_id": "acc-1", "data": payment(2.5)[2]}
+    backend.commit([first])
+
+    # Replayed from the journal together with a new one: the batch fails on the existing
+    # document, so each is committed on its own and the rollups count the first only once
+    backend.commit([first, second])
+    transactions = db.collection("users").document("user-1").collection("linkedAccounts") \
+        .document("acc-1").collection("transactions")
+    assert sorted(doc.id for doc in transactions.stream()) == ["txn-1", "txn-2"]
+
+    month = spend_rollups.month_key(TIMESTAMP)
+    spend = spend_rollups.read_monthly_spend(db, "user-1", month)
+    assert (spend["total"], spend["count"]) == (12.5, 2)
+    assert spend["accounts"] == {"acc-1": {"total": 12.5, "count": 2}}
+
+
+if __name__ == "__main__":
+    test_uncommitted_transactions_are_replayed()
+    test_retryable_failure_keeps_the_batch()
+    test_rejected_transaction_is_dead_lettered()
+    test_backend_outage_while_retrying_one_by_one_stops_early()
+    test_already_committed_transactions_are_skipped()
+    print("✅ Transaction store replays, retries, dead-letters and skips committed transactions")
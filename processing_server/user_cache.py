@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# === CONFIG ===
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))  # seconds
+PROFILE_FIELDS = ["default_acc", "palmHash"]  # palmHash is read only to check it is still set
+
+
+class UserProfileCache:
+    """
+    Bounded LRU cache of user profile fields with a per-entry TTL.
+    A hit serves /scanPalm without any Firestore read. Entries are dropped when
+    /registerPalm writes the user, when they expire, or when the cache is full
+    (least recently used first). Missing users are not cached. Profiles hold
+    default_acc and palm_enrolled (whether the user still has a palmHash).
+    """
+
+    def __init__(self, loader, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.loader = loader  # uid -> dict of profile fields, or None if the user does not exist
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # uid -> (expires_at, fields)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+        self._watch = None
+
+    def get(self, uid):
+        """Returns the cached profile fields for uid, loading them on a miss."""
+        hit, fields = self._lookup(uid)
+        if hit:
+            return fields
+        fields = self.loader(uid)
+        if fields is not None:
+            self.put(uid, fields)
+        return fields
+
+    async def get_async(self, uid, loader):
+        """Like get(), but awaits the async loader(uid) on a miss."""
+        hit, fields = self._lookup(uid)
+        if hit:
+            return fields
+        fields = await loader(uid)
+        if fields is not None:
+            self.put(uid, fields)
+        return fields
+
+    def _lookup(self, uid):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(uid)
+                    self._counters["hits"] += 1
+                    return True, entry[1]
+                del self._entries[uid]
+                self._counters["expirations"] += 1
+            self._counters["misses"] += 1
+            return False, None
+
+    def put(self, uid, fields):
+        with self._lock:
+            self._entries[uid] = (time.monotonic() + self.ttl, fields)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate(self, uid):
+        with self._lock:
+            if self._entries.pop(uid, None) is not None:
+                self._counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return dict(self._counters, size=len(self._entries), max_size=self.max_size,
+                        hit_rate=round(self._counters["hits"] / lookups, 4) if lookups else 0.0)
+
+    # === FIRESTORE ===
+    def watch(self, collection_ref, on_unenrolled=None):
+        """
+        Keeps cached entries fresh from a Firestore snapshot listener on the users
+        collection. Only users already in the cache are updated; removals invalidate.
+        on_unenrolled(uid) is called for every user seen without a palmHash, cached or not.
+        """
+        def on_snapshot(_docs, changes, _read_time):
+            for change in changes:
+                uid = change.document.id
+                data = {} if change.type.name == "REMOVED" else (change.document.to_dict() or {})
+                if on_unenrolled is not None and data.get("palmHash") is None:
+                    on_unenrolled(uid)
+                with self._lock:
+                    cached = uid in self._entries
+                if not cached:
+                    continue
+                if change.type.name == "REMOVED":
+                    self.invalidate(uid)
+                else:
+                    self.put(uid, to_profile(data))
+
+        self._watch = collection_ref.on_snapshot(on_snapshot)
+        return self._watch
+
+
+def to_profile(data):
+    """The cached profile for a users/{uid} document: default_acc, and palm_enrolled instead of the template."""
+    return {"default_acc": data.get("default_acc"), "palm_enrolled": data.get("palmHash") is not None}
+
+
+def firestore_profile_loader(db, fields=PROFILE_FIELDS):
+    """Loader that reads only the cached fields of users/{uid}."""
+    def load(uid):
+        doc = db.collection("users").document(uid).get(field_paths=fields)
+        if not doc.exists:
+            return None
+        return to_profile(doc.to_dict() or {})
+    return load
+
+
+def firestore_async_profile_loader(db, fields=PROFILE_FIELDS):
+    """Async loader for get_async(), reading users/{uid} through a Firestore AsyncClient."""
+    async def load(uid):
+        doc = await db.collection("users").document(uid).get(field_paths=fields)
+        if not doc.exists:
+            return None
+        return to_profile(doc.to_dict() or {})
+    return load